@@ -0,0 +1,74 @@
+"""Benchmark put and drain throughput of repository backends
+
+Messages are put with `put_many` and drained with `peek`/`remove_many`.
+
+Usage:
+
+    python benchmarks/bench_backends.py --messages 100000 --batch-size 100
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from igpy.messagebus import MessageBus
+from igpy.messagebus.memory import MemoryRepository
+from igpy.messagebus.messagebus import TextMessage
+from igpy.messagebus.persistence import TranscodingMapper
+from igpy.messagebus.segment import SegmentLogRepository
+from igpy.messagebus.sqlite import SQLiteRepository
+
+
+def backends(directory: str) -> dict:
+    """Repository factories by name"""
+    return {
+        "memory": MemoryRepository,
+        "memory-raw": lambda: MemoryRepository(TranscodingMapper()),
+        "sqlite-memory": SQLiteRepository,
+        "sqlite-file": lambda: SQLiteRepository(
+            os.path.join(directory, "queue.db"), profile="balanced"
+        ),
+        "segment-log": lambda: SegmentLogRepository(os.path.join(directory, "log")),
+    }
+
+
+def drain(bus: MessageBus, batch_size: int) -> int:
+    """Claim and remove all messages, return number of messages"""
+    count = 0
+    while True:
+        messages = bus.peek(batch_size)
+        if not messages:
+            return count
+        bus.remove_many(messages)
+        count += len(messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'backend':>14} {'put msg/sec':>12} {'drain msg/sec':>14}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, factory in backends(directory).items():
+            repository = factory()
+            repository.initialize()
+            bus = MessageBus(repository)
+            messages = [
+                TextMessage(body=f"message {index}") for index in range(args.messages)
+            ]
+            started = time.perf_counter()
+            bus.put_many(messages)
+            put_elapsed = time.perf_counter() - started
+            started = time.perf_counter()
+            drain(bus, args.batch_size)
+            drain_elapsed = time.perf_counter() - started
+            print(
+                f"{name:>14} {args.messages / put_elapsed:>12.0f}"
+                f" {args.messages / drain_elapsed:>14.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
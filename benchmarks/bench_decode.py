@@ -0,0 +1,46 @@
+"""Benchmark TranscodingMapper encode/decode throughput with and without topic cache
+
+The "lazy" mode returns envelopes, deferring state decoding until first access.
+
+Usage:
+
+    python benchmarks/bench_decode.py --messages 100000
+"""
+import argparse
+import time
+
+from igpy.messagebus.messagebus import TextMessage
+from igpy.messagebus.persistence import TranscodingMapper
+from igpy.serialization.transcode import JSONTranscoder
+from igpy.serialization.utils import TopicCache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100_000)
+    args = parser.parse_args()
+
+    messages = [TextMessage(body=f"message {index}") for index in range(args.messages)]
+    print(f"{'mode':>8} {'encode msg/sec':>15} {'decode msg/sec':>15}")
+    modes = (
+        ("no-cache", TopicCache(maxsize=0), False),
+        ("cache", TopicCache(), False),
+        ("lazy", TopicCache(), True),
+    )
+    for name, cache, lazy in modes:
+        mapper = TranscodingMapper(JSONTranscoder(), topic_cache=cache, lazy=lazy)
+        started = time.perf_counter()
+        encoded = [mapper.encode(message) for message in messages]
+        encode_elapsed = time.perf_counter() - started
+        started = time.perf_counter()
+        for item in encoded:
+            mapper.decode(item)
+        decode_elapsed = time.perf_counter() - started
+        print(
+            f"{name:>8} {args.messages / encode_elapsed:>15.0f}"
+            f" {args.messages / decode_elapsed:>15.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
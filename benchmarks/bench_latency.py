@@ -0,0 +1,81 @@
+"""Benchmark end-to-end put-to-process latency of a Consumer
+
+Compares the fixed 1 second poll, adaptive polling and adaptive polling
+with in-process wakeup.
+
+Usage:
+
+    python benchmarks/bench_latency.py --messages 500 --rate 200
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from igpy.messagebus import MessageBus
+from igpy.messagebus.messagebus import Consumer, TextMessage, Wakeup
+from igpy.messagebus.sqlite import SQLiteRepository
+
+
+class LatencyConsumer(Consumer):
+    """Consumer recording the time since each message was put"""
+
+    def __init__(self, message_bus: MessageBus):
+        super().__init__(message_bus)
+        self.latencies = []
+
+    def process(self, message: TextMessage):
+        self.latencies.append(time.perf_counter() - float(message.body))
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(db_name: str, messages: int, rate: float, mode: str) -> list:
+    """Run producer and consumer, return list of latencies"""
+    repository = SQLiteRepository(db_name)
+    repository.initialize()
+    wakeup = Wakeup() if mode == "wakeup" else None
+    producer_bus = MessageBus(repository, wakeup=wakeup)
+    consumer = LatencyConsumer(MessageBus(SQLiteRepository(db_name), wakeup=wakeup))
+    if mode == "fixed":
+        consumer.min_sleep_interval = consumer.running_sleep_interval = 1
+        consumer.backoff_factor = 1
+    thread = threading.Thread(target=consumer.run, daemon=True)
+    thread.start()
+    for _ in range(messages):
+        producer_bus.put(TextMessage(body=repr(time.perf_counter())))
+        time.sleep(1 / rate)
+    while len(consumer.latencies) < messages:
+        time.sleep(0.01)
+    consumer.stop()
+    thread.join()
+    return consumer.latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=200, help="messages/sec")
+    args = parser.parse_args()
+
+    print(f"{'mode':>10} {'p50 ms':>10} {'p99 ms':>10} {'mean ms':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ("fixed", "adaptive", "wakeup"):
+            latencies = run(
+                os.path.join(directory, f"{mode}.db"), args.messages, args.rate, mode
+            )
+            print(
+                f"{mode:>10} {percentile(latencies, 0.5) * 1000:>10.2f}"
+                f" {percentile(latencies, 0.99) * 1000:>10.2f}"
+                f" {statistics.mean(latencies) * 1000:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Benchmark overhead of metrics instrumentation
+
+Messages are put one by one and drained with `peek`/`remove_many` without
+instrumentation and with a `MetricsCollector` hook.
+
+Usage:
+
+    python benchmarks/bench_metrics.py --messages 20000 --batch-size 100
+"""
+import argparse
+import time
+
+from igpy.messagebus import MessageBus
+from igpy.messagebus.messagebus import TextMessage
+from igpy.messagebus.metrics import MetricsCollector, instrumentation
+from igpy.messagebus.sqlite import SQLiteRepository
+
+
+def run(messages: int, batch_size: int) -> float:
+    """Put and drain messages, return elapsed seconds"""
+    repository = SQLiteRepository()
+    repository.initialize()
+    bus = MessageBus(repository)
+    started = time.perf_counter()
+    for index in range(messages):
+        bus.put(TextMessage(body=f"message {index}"))
+    while True:
+        batch = bus.peek(batch_size)
+        if not batch:
+            break
+        bus.remove_many(batch)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'metrics':>10} {'seconds':>10} {'msg/sec':>10}")
+    elapsed = run(args.messages, args.batch_size)
+    print(f"{'disabled':>10} {elapsed:>10.3f} {args.messages / elapsed:>10.0f}")
+    collector = MetricsCollector()
+    instrumentation.add_hook(collector)
+    try:
+        elapsed = run(args.messages, args.batch_size)
+    finally:
+        instrumentation.remove_hook(collector)
+    print(f"{'enabled':>10} {elapsed:>10.3f} {args.messages / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
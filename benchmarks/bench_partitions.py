@@ -0,0 +1,76 @@
+"""Benchmark put throughput of concurrent producers over SQLite partitions
+
+Every producer process opens its own `PartitionedRepository` over the same
+database files and puts messages of its own key one by one. Producer keys
+are chosen so that producers write to different partitions where there
+are enough of them.
+
+Usage:
+
+    python benchmarks/bench_partitions.py --messages 2000 --producers 4
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import os
+import tempfile
+import time
+
+from igpy.messagebus import MessageBus
+from igpy.messagebus.messagebus import TextMessage
+from igpy.messagebus.partition import PartitionedRepository, partition_index
+
+
+def open_bus(directory: str, partitions: int) -> MessageBus:
+    """Open message bus over `partitions` database files in `directory`"""
+    repository = PartitionedRepository.from_sqlite(
+        [os.path.join(directory, f"queue-{index}.db") for index in range(partitions)],
+        key=lambda message: message.body.split(":")[0],
+        profile="balanced",
+    )
+    repository.initialize()
+    return MessageBus(repository)
+
+
+def producer_key(producer: int, partitions: int) -> str:
+    """Key of producer stored in partition `producer % partitions`"""
+    for attempt in itertools.count():
+        key = f"producer-{producer}-{attempt}"
+        if partition_index(key, partitions) == producer % partitions:
+            return key
+
+
+def produce(directory: str, partitions: int, producer: int, count: int):
+    """Put `count` messages with the producer's key"""
+    bus = open_bus(directory, partitions)
+    key = producer_key(producer, partitions)
+    for index in range(count):
+        bus.put(TextMessage(body=f"{key}:{index}"))
+    bus.repository.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--producers", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'partitions':>10} {'put msg/sec':>12}")
+    for partitions in sorted({1, 2, args.producers}):
+        with tempfile.TemporaryDirectory() as directory:
+            open_bus(directory, partitions).repository.close()
+            started = time.perf_counter()
+            with ProcessPoolExecutor(args.producers) as executor:
+                futures = [
+                    executor.submit(produce, directory, partitions, producer, args.messages)
+                    for producer in range(args.producers)
+                ]
+                for future in futures:
+                    future.result()
+            elapsed = time.perf_counter() - started
+            total = args.messages * args.producers
+            print(f"{partitions:>10} {total / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
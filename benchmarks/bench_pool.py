@@ -0,0 +1,77 @@
+"""Benchmark ConsumerPool throughput for 1..N workers
+
+Runs a CPU-bound handler with the process executor and an I/O-bound
+handler with the thread executor.
+
+Usage:
+
+    python benchmarks/bench_pool.py --messages 2000 --max-workers 8
+"""
+import argparse
+import functools
+import os
+import tempfile
+import time
+from typing import Any
+
+from igpy.messagebus import MessageBus
+from igpy.messagebus.messagebus import Consumer, TextMessage
+from igpy.messagebus.pool import ConsumerPool
+from igpy.messagebus.sqlite import SQLiteRepository
+
+
+class CPUBoundConsumer(Consumer):
+    """Consumer burning CPU for every message"""
+
+    def process(self, message: Any):
+        sum(i * i for i in range(20_000))
+
+
+class IOBoundConsumer(Consumer):
+    """Consumer waiting on simulated I/O for every message"""
+
+    def process(self, message: Any):
+        time.sleep(0.002)
+
+
+def make_consumer(consumer_class: type, db_name: str) -> Consumer:
+    """Create consumer with its own repository connection"""
+    consumer = consumer_class(MessageBus(SQLiteRepository(db_name)))
+    consumer.running_sleep_interval = 0.01
+    return consumer
+
+
+def bench(db_name: str, messages: int, workers: int, executor: str) -> float:
+    """Return messages/sec for given number of workers"""
+    repository = SQLiteRepository(db_name)
+    repository.initialize()
+    MessageBus(repository).put_many(TextMessage(body=str(i)) for i in range(messages))
+    consumer_class = CPUBoundConsumer if executor == "process" else IOBoundConsumer
+    factory = functools.partial(make_consumer, consumer_class, db_name)
+    started = time.perf_counter()
+    with ConsumerPool(factory, workers, executor):
+        while repository.row_count(repository.queue_table_name):
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - started
+    return messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    print(f"{'executor':>10} {'workers':>8} {'msg/sec':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for executor in ("process", "thread"):
+            baseline = None
+            for workers in range(1, args.max_workers + 1):
+                db_name = os.path.join(directory, f"{executor}-{workers}.db")
+                rate = bench(db_name, args.messages, workers, executor)
+                baseline = baseline or rate
+                print(f"{executor:>10} {workers:>8} {rate:>10.0f} {rate / baseline:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Benchmark concurrent producer/consumer throughput for SQLite tuning profiles
+
+Usage:
+
+    python benchmarks/bench_profiles.py --messages 5000 --producers 4 --consumers 2
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from igpy.messagebus import MessageBus
+from igpy.messagebus.messagebus import TextMessage
+from igpy.messagebus.sqlite import PROFILES, SQLiteRepository
+
+
+def bench(db_name: str, profile: str, messages: int, producers: int, consumers: int):
+    """Return messages/sec produced and consumed concurrently"""
+    repository = SQLiteRepository(db_name, profile=profile)
+    repository.initialize()
+    bus = MessageBus(repository)
+    per_producer = messages // producers
+    total = per_producer * producers
+    consumed = []
+    consumed_lock = threading.Lock()
+
+    def produce():
+        for index in range(per_producer):
+            bus.put(TextMessage(body=str(index)))
+
+    def consume():
+        while True:
+            with consumed_lock:
+                if sum(consumed) >= total:
+                    return
+            batch = bus.peek(50)
+            if batch:
+                bus.remove_many(batch)
+            else:
+                time.sleep(0.001)
+            with consumed_lock:
+                consumed.append(len(batch))
+
+    threads = [threading.Thread(target=produce) for _ in range(producers)]
+    threads += [threading.Thread(target=consume) for _ in range(consumers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    repository.close()
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--producers", type=int, default=4)
+    parser.add_argument("--consumers", type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"{'profile':>10} {'msg/sec':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in [None, *PROFILES]:
+            db_name = os.path.join(directory, f"{profile}.db")
+            rate = bench(db_name, profile, args.messages, args.producers, args.consumers)
+            print(f"{profile or 'default':>10} {rate:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark per-item `MessageBus.put` against bulk `MessageBus.put_many`
+
+Usage:
+
+    python benchmarks/bench_put.py --sizes 10000 1000000 --chunk-size 1000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from igpy.messagebus import MessageBus
+from igpy.messagebus.messagebus import TextMessage
+from igpy.messagebus.sqlite import SQLiteRepository
+
+
+def make_bus(directory: str, name: str, chunk_size: int) -> MessageBus:
+    """Create message bus backed by a fresh SQLite file"""
+    repository = SQLiteRepository(
+        os.path.join(directory, f"{name}.db"), insert_chunk_size=chunk_size
+    )
+    repository.initialize()
+    return MessageBus(repository)
+
+
+def bench_put(bus: MessageBus, count: int) -> float:
+    """Put messages one by one, return elapsed seconds"""
+    started = time.perf_counter()
+    for index in range(count):
+        bus.put(TextMessage(body=f"message {index}"))
+    return time.perf_counter() - started
+
+
+def bench_put_many(bus: MessageBus, count: int) -> float:
+    """Put messages with a single put_many call, return elapsed seconds"""
+    started = time.perf_counter()
+    bus.put_many(TextMessage(body=f"message {index}") for index in range(count))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'messages':>10} {'path':>10} {'seconds':>10} {'msg/sec':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.sizes:
+            for name, bench in (("put", bench_put), ("put_many", bench_put_many)):
+                bus = make_bus(directory, f"{name}-{count}", args.chunk_size)
+                elapsed = bench(bus, count)
+                print(f"{count:>10} {name:>10} {elapsed:>10.3f} {count / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
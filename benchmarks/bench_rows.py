@@ -0,0 +1,58 @@
+"""Benchmark materialization of selected rows into StoredMessage instances
+
+Compares building every row through a dictionary, as `CursorFactory.as_dict`
+does, with the precomputed `CursorFactory.message_factory`.
+
+Usage:
+
+    python benchmarks/bench_rows.py --rows 100000
+"""
+import argparse
+from datetime import datetime
+import sqlite3
+import time
+
+from igpy.messagebus.persistence import CursorFactory, StoredMessage
+
+
+def make_cursor(rows: int) -> sqlite3.Cursor:
+    """Create in-memory table with `rows` rows and return cursor selecting them"""
+    connection = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES)
+    connection.execute(
+        "CREATE TABLE item (message_id TEXT, posted_at timestamp, topic TEXT, state BLOB)"
+    )
+    now = datetime.utcnow()
+    connection.executemany(
+        "INSERT INTO item VALUES (?,?,?,?)",
+        ((f"{index:032x}", now, "module#Message", b"{}") for index in range(rows)),
+    )
+    return connection.execute("SELECT message_id, posted_at, topic, state FROM item")
+
+
+def by_dict(cursor, rows) -> list:
+    """Materialize rows through a dictionary per row"""
+    return [StoredMessage(**CursorFactory.as_dict(cursor, row)) for row in rows]
+
+
+def by_factory(cursor, rows) -> list:
+    """Materialize rows with precomputed column mapping"""
+    return CursorFactory.as_messages(cursor, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    cursor = make_cursor(args.rows)
+    rows = cursor.fetchall()
+    print(f"{'path':>10} {'seconds':>10} {'rows/sec':>12}")
+    for name, materialize in (("dict", by_dict), ("factory", by_factory)):
+        started = time.perf_counter()
+        materialize(cursor, rows)
+        elapsed = time.perf_counter() - started
+        print(f"{name:>10} {elapsed:>10.3f} {args.rows / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Benchmark peak memory of `MessageBus.peek` against `MessageBus.iter_messages`
+
+Usage:
+
+    python benchmarks/bench_stream.py --messages 100000 --body-size 1000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from igpy.messagebus import MessageBus
+from igpy.messagebus.messagebus import TextMessage
+from igpy.messagebus.sqlite import SQLiteRepository
+
+
+def make_bus(directory: str, name: str, count: int, body_size: int) -> MessageBus:
+    """Create message bus backed by a fresh SQLite file holding `count` messages"""
+    repository = SQLiteRepository(os.path.join(directory, f"{name}.db"))
+    repository.initialize()
+    bus = MessageBus(repository)
+    body = "x" * body_size
+    bus.put_many(TextMessage(body=body) for _ in range(count))
+    return bus
+
+
+def consume(messages) -> int:
+    """Touch every message, return number of messages"""
+    count = 0
+    for message in messages:
+        count += len(message.body) > 0
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--body-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'path':>14} {'seconds':>10} {'peak MiB':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ("peek", "iter_messages"):
+            bus = make_bus(directory, name, args.messages, args.body_size)
+            read = getattr(bus, name)
+            tracemalloc.start()
+            started = time.perf_counter()
+            consume(read(args.messages))
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            bus.repository.close()
+            print(f"{name:>14} {elapsed:>10.3f} {peak / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Benchmark state transcoders on representative payloads
+
+Usage:
+
+    python benchmarks/bench_transcode.py --repeat 20000
+"""
+import argparse
+from datetime import datetime
+from decimal import Decimal
+import time
+from uuid import uuid4
+
+from igpy.serialization import binary
+from igpy.serialization.binary import BinaryTranscoder
+from igpy.serialization.compress import CompressingTranscoder
+from igpy.serialization.transcode import (
+    DatetimeAsISO,
+    DecimalAsStr,
+    FastJSONTranscoder,
+    JSONTranscoder,
+    UUIDAsHex,
+)
+
+
+def register_all(transcoder):
+    """Register all transcodings with the transcoder"""
+    for transcoding in (UUIDAsHex(), DecimalAsStr(), DatetimeAsISO()):
+        transcoder.register(transcoding)
+    return transcoder
+
+
+class Chain:
+    """Transcoders applied in sequence, like TranscodingMapper does"""
+
+    def __init__(self, *transcoders):
+        self.transcoders = transcoders
+
+    def encode(self, obj):
+        for transcoder in self.transcoders:
+            obj = transcoder.encode(obj)
+        return obj
+
+    def decode(self, data):
+        for transcoder in reversed(self.transcoders):
+            data = transcoder.decode(data)
+        return data
+
+
+TRANSCODERS = {
+    "json": lambda: register_all(JSONTranscoder()),
+    "fast-json": lambda: register_all(FastJSONTranscoder(use_orjson=False)),
+    "fast-orjson": lambda: register_all(FastJSONTranscoder()),
+    "binary": BinaryTranscoder,
+    "json+zlib": lambda: Chain(register_all(FastJSONTranscoder()), CompressingTranscoder()),
+    "json+lzma": lambda: Chain(
+        register_all(FastJSONTranscoder()), CompressingTranscoder("lzma")
+    ),
+}
+if binary.msgpack:
+    TRANSCODERS["binary-msgpack"] = lambda: BinaryTranscoder(use_msgpack=True)
+
+PAYLOADS = {
+    "flat": {"body": "Hello world", "count": 10, "ratio": 0.5, "tags": ["a", "b"]},
+    "nested": {
+        "items": [
+            {"sku": f"sku-{i}", "attributes": {"color": "red", "size": {"w": i, "h": i}}}
+            for i in range(20)
+        ]
+    },
+    "typed": {
+        "order_id": uuid4(),
+        "placed_at": datetime.utcnow(),
+        "lines": [{"product": uuid4(), "price": Decimal("12.30")} for _ in range(10)],
+    },
+}
+
+
+def bench(transcoder, payload, repeat: int):
+    """Return encoded size, encodes/sec and decodes/sec"""
+    data = transcoder.encode(payload)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        transcoder.encode(payload)
+    encode_rate = repeat / (time.perf_counter() - started)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        transcoder.decode(data)
+    decode_rate = repeat / (time.perf_counter() - started)
+    return len(data), encode_rate, decode_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20_000)
+    parser.add_argument("--transcoders", nargs="+", default=list(TRANSCODERS))
+    args = parser.parse_args()
+
+    print(f"{'payload':>8} {'transcoder':>14} {'bytes':>7} {'encode/sec':>11} {'decode/sec':>11}")
+    for payload_name, payload in PAYLOADS.items():
+        for name in args.transcoders:
+            size, encode_rate, decode_rate = bench(TRANSCODERS[name](), payload, args.repeat)
+            print(
+                f"{payload_name:>8} {name:>14} {size:>7}"
+                f" {encode_rate:>11.0f} {decode_rate:>11.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
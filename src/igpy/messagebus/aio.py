@@ -0,0 +1,163 @@
+"""Asyncio message bus and consumer"""
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+import functools
+from typing import Any, AsyncIterator, Iterable, List
+
+from .messagebus import Consumer, MessageBus
+
+
+class AsyncMessageBus:
+    """Asyncio message bus
+
+    Blocking repository work runs on a dedicated executor thread, so the
+    event loop is never blocked.
+    """
+
+    def __init__(self, message_bus: MessageBus, executor: Executor = None):
+        self.message_bus = message_bus
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="messagebus"
+        )
+        self.min_sleep_interval = 0.01
+        self.max_sleep_interval = 1
+        self._put_event = None
+
+    @property
+    def wakeup(self):
+        """Wakeup of the underlying message bus"""
+        return self.message_bus.wakeup
+
+    @property
+    def repository(self):
+        """Repository of the underlying message bus"""
+        return self.message_bus.repository
+
+    async def _call(self, func, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+
+    def _notify(self):
+        if self._put_event:
+            self._put_event.set()
+
+    async def put(self, item: Any, priority: int = 0, delay: float = None):
+        """Put item into the bus, see :meth:`MessageBus.put`"""
+        await self._call(self.message_bus.put, item, priority, delay)
+        self._notify()
+
+    async def put_many(self, items: Iterable[Any], priority: int = 0, delay: float = None):
+        """Put multiple items with the same priority and delay into the bus"""
+        await self._call(self.message_bus.put_many, list(items), priority, delay)
+        self._notify()
+
+    async def peek(self, batch_limit=None, topics: Iterable[Any] = None) -> List[Any]:
+        """Get items from the bus, optionally of given topics only"""
+        return await self._call(self.message_bus.peek, batch_limit, topics)
+
+    async def remove(self, item: Any):
+        """Remove an item from the bus"""
+        await self._call(self.message_bus.remove, item)
+
+    async def remove_many(self, items: Iterable[Any]):
+        """Remove multiple items from the bus"""
+        await self._call(self.message_bus.remove_many, list(items))
+
+    async def fail(self, items: Iterable[Any], error: str = None):
+        """Return items which failed processing to the bus for a later retry"""
+        await self._call(self.message_bus.fail, list(items), error)
+
+    async def redrive(self, message_ids: Iterable[str] = None) -> int:
+        """Return dead letters with given ids, or all, to the bus"""
+        if message_ids is not None:
+            message_ids = list(message_ids)
+        count = await self._call(self.message_bus.redrive, message_ids)
+        if count:
+            self._notify()
+        return count
+
+    async def stream(
+        self, batch_limit: int = 10, topics: Iterable[Any] = None
+    ) -> AsyncIterator[Any]:
+        """Iterate over items put into the bus, optionally of given topics only.
+
+        Items are claimed in batches of `batch_limit` and should be removed
+        by the caller once processed. When the bus runs dry, polling backs
+        off from `min_sleep_interval` to `max_sleep_interval`, unless an
+        item is put through this bus in the meantime.
+        """
+        if self._put_event is None:
+            self._put_event = asyncio.Event()
+        if topics is not None:
+            topics = list(topics)
+        interval = self.min_sleep_interval
+        while True:
+            self._put_event.clear()
+            messages = await self.peek(batch_limit, topics)
+            for message in messages:
+                yield message
+            if len(messages) >= batch_limit:
+                interval = self.min_sleep_interval
+                continue
+            try:
+                await asyncio.wait_for(self._put_event.wait(), interval)
+            except asyncio.TimeoutError:
+                interval = min(interval * 2, self.max_sleep_interval)
+
+    def close(self):
+        """Shut down the executor created by this bus"""
+        if self._own_executor:
+            self.executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class AsyncConsumer(Consumer):
+    """Asyncio message bus consumer
+
+    Messages of a batch are processed concurrently by coroutine `process`,
+    at most `concurrency` at a time. The batch is removed from the bus once
+    all its messages are processed. Messages which raise an exception are
+    returned to the bus with :meth:`AsyncMessageBus.fail`. Subscription
+    handlers are coroutine functions.
+    """
+
+    def __init__(self, message_bus: AsyncMessageBus, concurrency: int = 10):
+        super().__init__(message_bus)
+        self.concurrency = concurrency
+
+    async def run(self):
+        """Run consumer polling loop"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def process(message):
+            async with semaphore:
+                try:
+                    await self.process(message)
+                except Exception as exc:  # pylint: disable=broad-except
+                    await self.message_bus.fail([message], repr(exc))
+                    return None
+                return message
+
+        while not self._stopped:
+            if self._paused:
+                await asyncio.sleep(self.paused_sleep_interval)
+                continue
+            messages = await self.message_bus.peek(self.peek_batch_size, self.topics)
+            if messages:
+                results = await asyncio.gather(*(process(message) for message in messages))
+                processed = [message for message in results if message is not None]
+                if processed:
+                    await self.message_bus.remove_many(processed)
+            await asyncio.sleep(self._next_sleep_interval(len(messages)))
+
+    async def process(self, message: Any):
+        """Process message, dispatching it to the subscribed handler"""
+        if self.handlers:
+            topic = self.message_bus.repository.mapper.get_message_topic(message)
+            await self.handlers[topic](message)
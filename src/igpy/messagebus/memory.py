@@ -0,0 +1,290 @@
+"""Message Bus repository keeping messages in process memory"""
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+
+from igpy.messagebus.persistence import (
+    Mapper,
+    Repository,
+    RetryPolicy,
+    StoredMessage,
+    TranscodingMapper,
+)
+from igpy.serialization.transcode import JSONTranscoder
+
+_READY = 0
+_DELAYED = 1
+_CLAIMED = 2
+_REMOVED = 3
+
+_COMPACT_MIN = 64
+
+
+class _Entry:
+    """Queued item with its delivery state"""
+
+    __slots__ = (
+        "item", "priority", "order", "sequence", "attempts", "state", "expires_at"
+    )
+
+    def __init__(self, item: StoredMessage, priority: int, order: float, sequence: int):
+        self.item = item
+        self.priority = priority
+        self.order = order
+        self.sequence = sequence
+        self.attempts = 0
+        self.state = _READY
+        self.expires_at = None
+
+
+class MemoryRepository(Repository):
+    """Message Bus repository keeping messages in process memory
+
+    Unclaimed messages are kept in a heap per topic, ordered by priority and
+    delivery time. Delayed messages wait in a heap ordered by delivery time
+    and claimed messages in a heap ordered by lease expiry. Messages are
+    indexed by id, so claiming, acknowledging and extending leases take
+    O(log n). Heap entries of removed messages are discarded lazily, removed
+    messages release their items at once and the lease heap is compacted
+    when most of its entries are stale.
+
+    The repository is thread-safe. Messages are encoded and decoded outside
+    of the queue lock, dead letters are guarded by their own lock. Pass
+    ``TranscodingMapper()`` as `mapper` to keep message state unserialized.
+    """
+
+    def __init__(
+        self,
+        mapper: Mapper = None,
+        lease_duration: float = 300,
+        retry_policy: RetryPolicy = None,
+    ):
+        mapper = mapper or TranscodingMapper(JSONTranscoder())
+        super().__init__(mapper, retry_policy)
+        self.lease_duration = lease_duration
+        self._entries: Dict[str, _Entry] = {}
+        self._ready: Dict[str, list] = {}
+        self._delayed = []
+        self._leases = []
+        self._dead: Dict[str, Tuple[_Entry, str]] = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._dead_lock = threading.Lock()
+
+    def message_count(self) -> int:
+        """Number of messages in the queue, claimed or not"""
+        return len(self._entries)
+
+    def claimed_count(self) -> int:
+        """Number of claimed messages"""
+        with self._lock:
+            return sum(entry.state == _CLAIMED for entry in self._entries.values())
+
+    def _insert(self, item: StoredMessage, priority: int = 0, delay: float = None):
+        self._insert_many([item], priority, delay)
+
+    def _insert_many(
+        self, items: Iterable[StoredMessage], priority: int = 0, delay: float = None
+    ):
+        items = list(items)
+        now = time.monotonic()
+        with self._lock:
+            for item in items:
+                if item.message_id in self._entries:
+                    raise ValueError(f"Duplicate message id: {item.message_id}")
+            for item in items:
+                entry = _Entry(
+                    item, priority, now + delay if delay else now, next(self._sequence)
+                )
+                self._entries[item.message_id] = entry
+                if delay:
+                    self._delay(entry)
+                else:
+                    self._push_ready(entry)
+
+    def _select(
+        self, batch_limit: int = None, topics: List[str] = None
+    ) -> List[StoredMessage]:
+        now = time.monotonic()
+        with self._lock:
+            self._expire_leases(now)
+            self._release_due(now)
+            if topics is None:
+                heaps = list(self._ready.values())
+            else:
+                heaps = [
+                    self._ready[topic] for topic in set(topics) if topic in self._ready
+                ]
+            # merge topic heaps by their heads
+            heads = []
+            for heap in heaps:
+                self._discard_stale(heap)
+                if heap:
+                    heads.append((heap[0], heap))
+            heapq.heapify(heads)
+            expires_at = now + self.lease_duration
+            claimed = []
+            while heads and len(claimed) < (batch_limit or 1):
+                heap = heads[0][1]
+                entry = heapq.heappop(heap)[-1]
+                entry.state = _CLAIMED
+                entry.attempts += 1
+                entry.expires_at = expires_at
+                heapq.heappush(self._leases, (expires_at, next(self._sequence), entry))
+                claimed.append(entry.item)
+                self._discard_stale(heap)
+                if heap:
+                    heapq.heapreplace(heads, (heap[0], heap))
+                else:
+                    heapq.heappop(heads)
+            return claimed
+
+    def _delete(self, item: StoredMessage):
+        self._delete_many([item.message_id])
+
+    def _delete_many(self, message_ids: List[str]):
+        with self._lock:
+            for message_id in message_ids:
+                entry = self._entries.pop(message_id, None)
+                if entry is not None:
+                    entry.state = _REMOVED
+                    entry.item = None
+            self._compact_leases()
+
+    def _extend_lease(self, message_ids: List[str], duration: float = None):
+        if duration is None:
+            duration = self.lease_duration
+        expires_at = time.monotonic() + duration
+        with self._lock:
+            for message_id in message_ids:
+                entry = self._entries.get(message_id)
+                if entry is not None and entry.state == _CLAIMED:
+                    entry.expires_at = expires_at
+                    heapq.heappush(
+                        self._leases, (expires_at, next(self._sequence), entry)
+                    )
+            self._compact_leases()
+
+    def _release(self, message_ids: List[str], after: str = None):
+        with self._lock:
+            head = self._entries.get(after) if after is not None else None
+            if head is not None and head.state not in (_READY, _DELAYED):
+                head = None
+            for message_id in message_ids:
+                entry = self._entries.get(message_id)
+                if entry is not None and entry.state == _CLAIMED:
+                    entry.attempts -= 1
+                    if head is None:
+                        self._push_ready(entry)
+                        continue
+                    # same order as the head, the entry sequence puts it after
+                    entry.order = head.order
+                    if head.state == _DELAYED:
+                        self._delay(entry)
+                    else:
+                        self._push_ready(entry)
+            self._compact_leases()
+
+    def _reclaim_expired(self) -> int:
+        with self._lock:
+            return self._expire_leases(time.monotonic())
+
+    def _fail(self, message_ids: List[str], error: str = None):
+        now = time.monotonic()
+        policy = self.retry_policy
+        with self._lock:
+            for message_id in message_ids:
+                entry = self._entries.get(message_id)
+                if entry is None or entry.state != _CLAIMED:
+                    continue
+                if policy.exhausted(entry.attempts):
+                    self._bury(entry, error)
+                else:
+                    entry.order = now + policy.delay(entry.attempts)
+                    self._delay(entry)
+
+    def _redrive(self, message_ids: List[str] = None) -> int:
+        now = time.monotonic()
+        with self._lock, self._dead_lock:
+            if message_ids is None:
+                dead = list(self._dead.values())
+                self._dead.clear()
+            else:
+                dead = [
+                    self._dead.pop(message_id)
+                    for message_id in message_ids
+                    if message_id in self._dead
+                ]
+            for buried, _ in dead:
+                entry = _Entry(buried.item, buried.priority, now, next(self._sequence))
+                self._entries[entry.item.message_id] = entry
+                self._push_ready(entry)
+            return len(dead)
+
+    def _select_dead(self, batch_limit: int = None) -> List[StoredMessage]:
+        with self._dead_lock:
+            dead = itertools.islice(self._dead.values(), batch_limit)
+            return [entry.item for entry, _ in dead]
+
+    # queue structures, called with the lock held
+
+    def _push_ready(self, entry: _Entry):
+        entry.state = _READY
+        heap = self._ready.get(entry.item.topic)
+        if heap is None:
+            heap = self._ready[entry.item.topic] = []
+        # an entry is in a ready heap at most once, its sequence breaks ties
+        heapq.heappush(heap, (-entry.priority, entry.order, entry.sequence, entry))
+
+    def _delay(self, entry: _Entry):
+        entry.state = _DELAYED
+        heapq.heappush(self._delayed, (entry.order, next(self._sequence), entry))
+
+    def _bury(self, entry: _Entry, error: str):
+        del self._entries[entry.item.message_id]
+        entry.state = _REMOVED
+        with self._dead_lock:
+            self._dead[entry.item.message_id] = (entry, error)
+
+    def _release_due(self, now: float):
+        delayed = self._delayed
+        while delayed and delayed[0][0] <= now:
+            entry = heapq.heappop(delayed)[-1]
+            if entry.state == _DELAYED:
+                self._push_ready(entry)
+
+    def _expire_leases(self, now: float) -> int:
+        leases = self._leases
+        expired = 0
+        while leases and leases[0][0] < now:
+            expires_at, _, entry = heapq.heappop(leases)
+            if entry.state != _CLAIMED or entry.expires_at != expires_at:
+                # removed, failed or extended since
+                continue
+            expired += 1
+            if self.retry_policy.exhausted(entry.attempts):
+                self._bury(entry, "Lease expired")
+            else:
+                self._push_ready(entry)
+        return expired
+
+    def _compact_leases(self):
+        # leases of removed, failed or extended messages are popped when they
+        # expire, drop them earlier once they outnumber claimed messages
+        leases = self._leases
+        if len(leases) <= 2 * len(self._entries) + _COMPACT_MIN:
+            return
+        self._leases = [
+            lease
+            for lease in leases
+            if lease[-1].state == _CLAIMED and lease[-1].expires_at == lease[0]
+        ]
+        heapq.heapify(self._leases)
+
+    @staticmethod
+    def _discard_stale(heap: list):
+        while heap and heap[0][-1].state != _READY:
+            heapq.heappop(heap)
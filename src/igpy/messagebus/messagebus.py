@@ -1,9 +1,13 @@
 """Message Bus implementation
 """
+from concurrent.futures import Executor, ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
+import itertools
+import threading
 import time
-from typing import Any
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Set, Tuple
+from . import metrics
 from .persistence import Repository
 
 @dataclass(frozen=True)
@@ -15,34 +19,190 @@ class TextMessage:
     posted_at: datetime=None
 
 
+class Wakeup:
+    """In-process notification about items put into the bus"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        """Number of notifications sent so far"""
+        return self._generation
+
+    def notify(self):
+        """Wake up all waiting consumers"""
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+
+    def wait(self, timeout: float, generation: int = None) -> bool:
+        """Wait for notification newer than `generation` or until timeout expires.
+
+        Returns True if notified and False on timeout.
+        """
+        with self._condition:
+            if generation is None:
+                generation = self._generation
+            return self._condition.wait_for(
+                lambda: self._generation != generation, timeout
+            )
+
+
 class MessageBus:
     """Message bus"""
 
-    def __init__(self, repository: Repository):
+    def __init__(self, repository: Repository, wakeup: Wakeup = None):
         self.repository = repository
+        self.wakeup = wakeup
+
+    def put(self, item: Any, priority: int = 0, delay: float = None):
+        """Put item into the bus.
+
+        Items with higher `priority` are delivered first. Item is not
+        delivered before `delay` seconds pass.
+        """
+        self.repository.insert(item, priority=priority, delay=delay)
+        if self.wakeup:
+            self.wakeup.notify()
+
+    def put_many(self, items: Iterable[Any], priority: int = 0, delay: float = None):
+        """Put multiple items with the same priority and delay into the bus"""
+        self.repository.insert_many(items, priority=priority, delay=delay)
+        if self.wakeup:
+            self.wakeup.notify()
 
-    def put(self, item: Any):
-        """Put item into the bus"""
-        self.repository.insert(item)
+    def peek(self, batch_limit=None, topics: Iterable[Any] = None) -> Any:
+        """Get items from the bus.
 
-    def peek(self, batch_limit=None) -> Any:
-        """Get items from the bus"""
-        return self.repository.select(batch_limit)
+        `topics` limits returned items to given topics or message classes.
+        """
+        return self.repository.select(batch_limit, topics)
+
+    def iter_messages(
+        self, batch_limit=None, topics: Iterable[Any] = None
+    ) -> Iterator[Any]:
+        """Claim a batch of items, return iterator fetching and decoding them lazily.
+
+        Unlike :meth:`peek`, the batch is not loaded into memory at once,
+        which suits large batch limits.
+        """
+        return self.repository.iter_select(batch_limit, topics)
 
     def remove(self, item: Any):
         """Remove an item from the bus"""
         self.repository.delete(item)
 
+    def remove_many(self, items: Iterable[Any]):
+        """Remove multiple items from the bus"""
+        get_message_id = self.repository.mapper.get_message_id
+        self.repository.delete_many(get_message_id(item) for item in items)
+
+    def extend_lease(self, items: Iterable[Any], duration: float = None):
+        """Keep claimed items from returning to the bus for `duration` seconds"""
+        get_message_id = self.repository.mapper.get_message_id
+        self.repository.extend_lease(
+            (get_message_id(item) for item in items), duration
+        )
+
+    def release(self, items: Iterable[Any], after: Any = None):
+        """Return claimed items which were not processed to the bus.
+
+        The claim does not count as an attempt of the items. If `after` is
+        an item waiting in the bus, e.g. for a retry, released items are
+        delivered after it.
+        """
+        get_message_id = self.repository.mapper.get_message_id
+        self.repository.release(
+            (get_message_id(item) for item in items),
+            None if after is None else get_message_id(after),
+        )
+
+    def reclaim_expired(self) -> int:
+        """Return claimed items with expired leases to the bus"""
+        return self.repository.reclaim_expired()
+
+    def fail(self, items: Iterable[Any], error: str = None):
+        """Return items which failed processing to the bus for a later retry.
+
+        Items which exhausted their attempts are moved to dead letters.
+        """
+        get_message_id = self.repository.mapper.get_message_id
+        self.repository.fail((get_message_id(item) for item in items), error)
+
+    def dead_letters(self, batch_limit: int = None) -> list:
+        """Get dead letters without claiming them"""
+        return self.repository.select_dead(batch_limit)
+
+    def redrive(self, message_ids: Iterable[str] = None) -> int:
+        """Return dead letters with given ids, or all, to the bus"""
+        count = self.repository.redrive(message_ids)
+        if count and self.wakeup:
+            self.wakeup.notify()
+        return count
+
+
+class _BlockedKey:
+    """Partition key waiting for the retry of its failed message"""
+
+    __slots__ = ("message", "message_id", "released")
+
+    def __init__(self, message: Any, message_id: str):
+        self.message = message
+        self.message_id = message_id
+        self.released: Set[str] = set()
+
 
 class Consumer:
-    """Message bus consumer for running in a thread"""
-    def __init__(self, message_bus: MessageBus):
+    """Message bus consumer for running in a thread
+
+    Full batches are drained back-to-back. When the bus runs dry, the sleep
+    between polls starts at `min_sleep_interval` and is multiplied by
+    `backoff_factor` after every empty poll, up to `running_sleep_interval`.
+    If the message bus has a `Wakeup`, sleeping consumers are woken up as
+    soon as an item is put into the bus.
+
+    Consumers with subscriptions (see :meth:`subscribe`) only peek messages
+    of subscribed topics and dispatch them to their handlers.
+
+    Messages which raise an exception in :meth:`process` are returned to the
+    bus with :meth:`MessageBus.fail`, other messages of the batch are removed.
+
+    With `workers`, every batch is split by message partition key (see
+    :meth:`Mapper.get_partition_key`) over that many worker threads.
+    Messages with different keys are processed in parallel and messages
+    with the same key one after another in batch order. Once a message
+    fails, its key is blocked until the message is delivered again: other
+    messages with the key are released (see :meth:`MessageBus.release`)
+    without processing and without losing an attempt, to be delivered
+    after the failed message. If a released message is delivered first,
+    the failed message has left the bus, e.g. to dead letters, and the
+    key is unblocked. Messages without a key are not ordered.
+    """
+    def __init__(self, message_bus: MessageBus, workers: int = None):
         self.message_bus = message_bus
+        self.workers = workers
         self._stopped = False
         self._paused = False
+        self._sleep_interval = 0
         self.paused_sleep_interval = 1
         self.running_sleep_interval = 1
+        self.min_sleep_interval = 0.01
+        self.backoff_factor = 2
         self.peek_batch_size = 10
+        self.handlers: Dict[str, Callable[[Any], None]] = {}
+        self._blocked: Dict[Any, _BlockedKey] = {}
+
+    def subscribe(self, topic_or_class: Any, handler: Callable[[Any], None]):
+        """Handle messages of a topic or message class with `handler`"""
+        topic = self.message_bus.repository.mapper.get_topic(topic_or_class)
+        self.handlers[topic] = handler
+
+    @property
+    def topics(self) -> list:
+        """Subscribed topics or None if consuming all topics"""
+        return list(self.handlers) if self.handlers else None
 
     def pause(self):
         """Pause the consumer"""
@@ -55,20 +215,140 @@ class Consumer:
     def stop(self):
         """Stop the consumer and exit the run() method"""
         self._stopped = True
+        if self.message_bus.wakeup:
+            self.message_bus.wakeup.notify()
 
     def run(self):
         """Run consumer polling loop"""
+        executor = ThreadPoolExecutor(self.workers) if self.workers else None
+        try:
+            self._poll(executor)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def _poll(self, executor: Executor = None):
+        wakeup = self.message_bus.wakeup
+        get_message_id = self.message_bus.repository.mapper.get_message_id
         while not self._stopped:
             if self._paused:
                 # Some kind of throttling could be implemented
                 time.sleep(self.paused_sleep_interval)
                 continue
-            messages = self.message_bus.peek(self.peek_batch_size)
-            for message in messages:
-                self.process(message)
-                self.message_bus.remove(message)
-            # Some kind of throttling could be implemented
-            time.sleep(self.running_sleep_interval)
+            generation = wakeup.generation if wakeup else None
+            messages = self.message_bus.peek(self.peek_batch_size, self.topics)
+            if executor is None:
+                processed, failed, released = self._process_ordered(messages)
+            else:
+                processed, failed, released = self._process_by_key(messages, executor)
+            for message, error, key in failed:
+                self.message_bus.fail([message], error)
+                if key is not None:
+                    self._blocked[key] = _BlockedKey(message, get_message_id(message))
+            if released:
+                self._release(released)
+            if processed:
+                self.message_bus.remove_many(processed)
+            interval = self._next_sleep_interval(len(messages))
+            if wakeup and interval:
+                wakeup.wait(interval, generation)
+            else:
+                # zero interval still yields to other threads
+                time.sleep(interval)
+
+    def _process_ordered(
+        self, messages: Iterable[Any], keys: Iterable[Any] = None
+    ) -> Tuple[List[Any], List[Tuple[Any, str, Any]], List[Tuple[Any, Any]]]:
+        """Process messages one after another, return processed, failed and released messages.
+
+        Failed and released messages are returned with their keys. If `keys`
+        are given, messages of blocked keys and messages following a failed
+        message with the same key are released without processing.
+        """
+        process = metrics.timed("consumer.process", self.process)
+        processed = []
+        failed = []
+        released = []
+        failed_keys = set()
+        for message, key in zip(messages, keys or itertools.repeat(None)):
+            if key is not None and (
+                key in failed_keys or self._is_blocked(key, message)
+            ):
+                released.append((message, key))
+                continue
+            try:
+                process(message)
+            except Exception as exc:  # pylint: disable=broad-except
+                failed.append((message, repr(exc), key))
+                failed_keys.add(key)
+            else:
+                processed.append(message)
+        return processed, failed, released
+
+    def _is_blocked(self, key: Any, message: Any) -> bool:
+        """Check if `message` waits for the retry of a failed message with its key"""
+        block = self._blocked.get(key)
+        if block is None:
+            return False
+        message_id = self.message_bus.repository.mapper.get_message_id(message)
+        if message_id == block.message_id or message_id in block.released:
+            # the failed message is retried, or it has left the bus if
+            # a message released after it is delivered first
+            del self._blocked[key]
+            return False
+        return True
+
+    def _release(self, released: List[Tuple[Any, Any]]):
+        """Release messages of blocked keys after the failed message of their key"""
+        get_message_id = self.message_bus.repository.mapper.get_message_id
+        by_key: Dict[Any, list] = {}
+        for message, key in released:
+            by_key.setdefault(key, []).append(message)
+        for key, messages in by_key.items():
+            block = self._blocked[key]
+            block.released.update(get_message_id(message) for message in messages)
+            self.message_bus.release(messages, after=block.message)
+
+    def _process_by_key(
+        self, messages: List[Any], executor: Executor
+    ) -> Tuple[List[Any], List[Tuple[Any, str, Any]], List[Tuple[Any, Any]]]:
+        """Process messages with different keys in parallel, return processed, failed and released messages"""
+        get_partition_key = self.message_bus.repository.mapper.get_partition_key
+        shards = [([], []) for _ in range(self.workers)]
+        for index, message in enumerate(messages):
+            key = get_partition_key(message)
+            shard = shards[(index if key is None else hash(key)) % self.workers]
+            shard[0].append(message)
+            shard[1].append(key)
+        futures = [
+            executor.submit(self._process_ordered, shard_messages, keys)
+            for shard_messages, keys in shards
+            if shard_messages
+        ]
+        processed = []
+        failed = []
+        released = []
+        for future in futures:
+            shard_processed, shard_failed, shard_released = future.result()
+            processed.extend(shard_processed)
+            failed.extend(shard_failed)
+            released.extend(shard_released)
+        return processed, failed, released
+
+    def _next_sleep_interval(self, received: int) -> float:
+        """Calculate sleep interval after a poll which returned `received` messages"""
+        if received >= self.peek_batch_size:
+            self._sleep_interval = 0
+        elif received:
+            self._sleep_interval = self.min_sleep_interval
+        else:
+            self._sleep_interval = max(
+                self._sleep_interval * self.backoff_factor, self.min_sleep_interval
+            )
+        return min(self._sleep_interval, self.running_sleep_interval)
 
     def process(self, message: Any):
-        """Process message"""
+        """Process message, dispatching it to the subscribed handler"""
+        if self.handlers:
+            topic = self.message_bus.repository.mapper.get_message_topic(message)
+            self.handlers[topic](message)
@@ -0,0 +1,314 @@
+"""Metrics and tracing hooks of message bus operations
+
+Durations of instrumented operations are reported to hooks added to the
+shared `instrumentation`, e.g. to a :class:`MetricsCollector`::
+
+    collector = MetricsCollector()
+    collector.watch_repository(repository)
+    instrumentation.add_hook(collector)
+    ...
+    print(collector.to_prometheus())
+"""
+
+import bisect
+import functools
+import json
+import re
+import threading
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Tuple
+
+Hook = Callable[[str, float, bool], None]
+
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+
+def _operations() -> Dict[str, Tuple[type, str]]:
+    """Instrumented methods by operation name"""
+    # pylint: disable=import-outside-toplevel
+    # instrumented modules import this module
+    from igpy.messagebus.messagebus import MessageBus
+    from igpy.messagebus.persistence import TranscodingMapper
+    from igpy.messagebus.sqlite import SQLiteRepository
+
+    return {
+        "messagebus.put": (MessageBus, "put"),
+        "messagebus.put_many": (MessageBus, "put_many"),
+        "messagebus.peek": (MessageBus, "peek"),
+        "messagebus.remove": (MessageBus, "remove"),
+        "messagebus.remove_many": (MessageBus, "remove_many"),
+        "mapper.encode": (TranscodingMapper, "encode"),
+        "mapper.decode": (TranscodingMapper, "decode"),
+        "sqlite.insert": (SQLiteRepository, "_insert"),
+        "sqlite.write_rows": (SQLiteRepository, "_write_rows"),
+        "sqlite.select": (SQLiteRepository, "_select"),
+        "sqlite.claim": (SQLiteRepository, "_claim"),
+        "sqlite.expire_leases": (SQLiteRepository, "_expire_leases"),
+        "sqlite.delete": (SQLiteRepository, "_delete"),
+        "sqlite.delete_many": (SQLiteRepository, "_delete_many"),
+        "sqlite.extend_lease": (SQLiteRepository, "_extend_lease"),
+        "sqlite.release": (SQLiteRepository, "_release"),
+        "sqlite.fail": (SQLiteRepository, "_fail"),
+        "sqlite.redrive": (SQLiteRepository, "_redrive"),
+    }
+
+
+def _timed(name: str, function: Callable, record: Callable) -> Callable:
+    """Wrap function to pass its durations as operation `name` to `record`"""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except BaseException:
+            record(name, perf_counter() - started, True)
+            raise
+        record(name, perf_counter() - started, False)
+        return result
+
+    return wrapper
+
+
+# Instrumented methods are shared by all Instrumentation instances: they are
+# wrapped once while any instance has hooks, and the wrappers report to the
+# instances in `_active`. Both are changed with `_lock` held only.
+_lock = threading.Lock()
+_active: Tuple["Instrumentation", ...] = ()
+_originals: List[Tuple[type, str, Any]] = []
+
+
+def _record(name: str, elapsed: float, error: bool = False):
+    """Report duration of an operation to all instrumentations with hooks"""
+    for active in _active:
+        active.record(name, elapsed, error)
+
+
+def _activate(instance: "Instrumentation"):
+    global _active  # pylint: disable=global-statement
+    if not _active:
+        for name, (cls, attribute) in _operations().items():
+            original = cls.__dict__[attribute]
+            _originals.append((cls, attribute, original))
+            setattr(cls, attribute, _timed(name, original, _record))
+    # replaced, not modified, so that it is iterated without lock
+    _active = _active + (instance,)
+
+
+def _deactivate(instance: "Instrumentation"):
+    global _active  # pylint: disable=global-statement
+    _active = tuple(active for active in _active if active is not instance)
+    if not _active:
+        for cls, attribute, original in reversed(_originals):
+            setattr(cls, attribute, original)
+        _originals.clear()
+
+
+def timed(name: str, function: Callable) -> Callable:
+    """Wrap function to report its durations to all instrumentations with hooks.
+
+    Returns `function` itself while no instrumentation has hooks.
+    """
+    return _timed(name, function, _record) if _active else function
+
+
+class Instrumentation:
+    """Report durations of message bus operations to hook callbacks
+
+    Hooks are called with operation name, duration in seconds and True if
+    the operation raised an exception. Instrumented methods are replaced
+    by timing wrappers when the first hook of any instance is added and
+    restored when the last one is removed, so there is no overhead while
+    no hook is added. Every method is wrapped once, the wrappers report to
+    all instances with hooks. Consumers time :meth:`Consumer.process` as
+    ``"consumer.process"``.
+    """
+
+    def __init__(self):
+        self.hooks: List[Hook] = []
+
+    @property
+    def enabled(self) -> bool:
+        """True if any hook is added"""
+        return bool(self.hooks)
+
+    def add_hook(self, hook: Hook):
+        """Add hook, instrument operations if it is the first one"""
+        with _lock:
+            if not self.hooks:
+                _activate(self)
+            # replaced, not modified, so that hooks are iterated without lock
+            self.hooks = self.hooks + [hook]
+
+    def remove_hook(self, hook: Hook):
+        """Remove hook, restore operations if it is the last one"""
+        with _lock:
+            hooks = list(self.hooks)
+            hooks.remove(hook)
+            self.hooks = hooks
+            if not hooks:
+                _deactivate(self)
+
+    def record(self, name: str, elapsed: float, error: bool = False):
+        """Report duration of an operation to the hooks"""
+        for hook in self.hooks:
+            hook(name, elapsed, error)
+
+    def timed(self, name: str, function: Callable) -> Callable:
+        """Wrap function to report its durations as operation `name`"""
+        return _timed(name, function, self.record)
+
+
+instrumentation = Instrumentation()
+
+
+class _Histogram:
+    """Counts of durations per bucket, the last bucket counts the rest"""
+
+    __slots__ = ("counts", "sum", "errors")
+
+    def __init__(self, size: int):
+        self.counts = [0] * (size + 1)
+        self.sum = 0.0
+        self.errors = 0
+
+
+class MetricsCollector:
+    """In-process collector of operation counts and duration histograms
+
+    Use as a hook of :class:`Instrumentation`. Every operation has a
+    duration histogram with upper bounds `buckets` and an error counter.
+    Gauges registered by :meth:`gauge` are read when a snapshot is taken.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._histograms: Dict[str, _Histogram] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, name: str, elapsed: float, error: bool = False):
+        index = bisect.bisect_left(self.buckets, elapsed)
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = _Histogram(len(self.buckets))
+            histogram.counts[index] += 1
+            histogram.sum += elapsed
+            if error:
+                histogram.errors += 1
+
+    def gauge(self, name: str, read: Callable[[], float]):
+        """Register gauge `name` read by calling `read`.
+
+        Raises ValueError if a gauge with this name is registered.
+        """
+        if name in self._gauges:
+            raise ValueError(f"Gauge {name!r} is already registered")
+        self._gauges[name] = read
+
+    def watch_repository(self, repository: Any, prefix: str = ""):
+        """Register queue depth gauges of a repository.
+
+        SQLite repositories report queue, lock table and dead letter table
+        sizes, other repositories their message and claimed message counts.
+        Gauge names start with `prefix`, e.g. ``"orders_"``, so that several
+        repositories can be watched.
+        """
+        if hasattr(repository, "row_count"):
+            for gauge, table in (
+                ("queue_depth", repository.queue_table_name),
+                ("lock_table_size", repository.lock_table_name),
+                ("dead_letters", repository.dead_table_name),
+            ):
+                read = functools.partial(repository.row_count, table)
+                self.gauge(prefix + gauge, read)
+            return
+        if hasattr(repository, "message_count"):
+            self.gauge(prefix + "queue_depth", repository.message_count)
+        if hasattr(repository, "claimed_count"):
+            self.gauge(prefix + "claimed", repository.claimed_count)
+
+    def reset(self):
+        """Forget collected operations"""
+        with self._lock:
+            self._histograms.clear()
+
+    def snapshot(self) -> dict:
+        """Collected operations and current gauge values.
+
+        Histogram buckets are cumulative, keyed by upper bound.
+        """
+        with self._lock:
+            histograms = [
+                (name, list(histogram.counts), histogram.sum, histogram.errors)
+                for name, histogram in sorted(self._histograms.items())
+            ]
+        operations = {}
+        for name, counts, total, errors in histograms:
+            buckets = {}
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            operations[name] = {
+                "count": cumulative,
+                "errors": errors,
+                "sum": total,
+                "buckets": buckets,
+            }
+        gauges = {name: read() for name, read in sorted(self._gauges.items())}
+        return {"operations": operations, "gauges": gauges}
+
+    def to_json(self) -> str:
+        """Snapshot as JSON"""
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self, prefix: str = "igpy_messagebus") -> str:
+        """Snapshot in Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        operations = snapshot["operations"]
+        lines = [
+            f"# HELP {prefix}_operation_seconds Duration of message bus operations",
+            f"# TYPE {prefix}_operation_seconds histogram",
+        ]
+        for name, operation in operations.items():
+            for bound, count in operation["buckets"].items():
+                lines.append(
+                    f'{prefix}_operation_seconds_bucket{{operation="{name}",le="{bound}"}} {count}'
+                )
+            lines.append(
+                f'{prefix}_operation_seconds_sum{{operation="{name}"}} {operation["sum"]}'
+            )
+            lines.append(
+                f'{prefix}_operation_seconds_count{{operation="{name}"}} {operation["count"]}'
+            )
+        lines += [
+            f"# HELP {prefix}_operation_errors_total Message bus operations which raised an exception",
+            f"# TYPE {prefix}_operation_errors_total counter",
+        ]
+        for name, operation in operations.items():
+            lines.append(
+                f'{prefix}_operation_errors_total{{operation="{name}"}} {operation["errors"]}'
+            )
+        for name, value in snapshot["gauges"].items():
+            metric = f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+            lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        return "\n".join(lines) + "\n"
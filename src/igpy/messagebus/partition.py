@@ -0,0 +1,258 @@
+"""Message Bus repository spreading messages over partition repositories"""
+# Partitions are driven through their protected operations on already
+# encoded items, the public ones would encode and decode every item again.
+# pylint: disable=protected-access
+
+import collections
+import copy
+import itertools
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+import zlib
+
+from igpy.messagebus.persistence import (
+    Mapper,
+    Repository,
+    StoredMessage,
+    TranscodingMapper,
+    _schedule,
+)
+from igpy.messagebus.sqlite import SQLiteRepository
+from igpy.serialization.transcode import JSONTranscoder
+
+
+def partition_index(key: Any, partition_count: int) -> int:
+    """Partition of `key`, stable across processes"""
+    return zlib.crc32(str(key).encode("utf8")) % partition_count
+
+
+class PartitionedRepository(Repository):
+    """Message Bus repository spreading messages over partition repositories
+
+    Every message is stored in one of `partitions`, chosen by the hash of
+    its partition key. `key` returns the partition key of a message, by
+    default it is the mapper's partition key of the message, or its topic
+    if the message has no key. Messages with the same key are kept in one
+    partition and claimed in its order, so they stay ordered when each
+    partition is consumed by one consumer at a time.
+
+    Items are encoded and decoded by this repository's `mapper` and passed
+    to the protected methods of the partitions, partition mappers are not
+    used. Batches are filled from the partitions in turn, starting with a
+    different partition every time. Use :meth:`assign` to claim from a
+    subset of partitions only, e.g. one partition per consumer.
+
+    Stored items given to the protected insert methods are decoded to find
+    their partition key, so they land in the same partition as the
+    messages they were encoded from.
+
+    Claimed message ids are remembered with their partition, so that
+    deleting, failing and extending leases touches only that partition.
+    Other message ids are passed to all partitions. A claim is forgotten
+    once the partition's `lease_duration` passes without the lease being
+    extended, as the message may be claimed and finished elsewhere.
+    """
+
+    def __init__(
+        self,
+        partitions: Iterable[Repository],
+        mapper: Mapper = None,
+        key: Callable[[Any], Any] = None,
+    ):
+        mapper = mapper or TranscodingMapper(JSONTranscoder())
+        super().__init__(mapper)
+        self.partitions: List[Repository] = list(partitions)
+        if not self.partitions:
+            raise ValueError("At least one partition is required")
+        self.key = key or self._default_key
+        self.assigned: List[Repository] = self.partitions
+        self._turn = itertools.count()
+        self._claims: Dict[str, Tuple[Repository, float]] = collections.OrderedDict()
+        self._claims_lock = threading.Lock()
+
+    @classmethod
+    def from_sqlite(
+        cls,
+        db_names: Iterable[str],
+        mapper: Mapper = None,
+        key: Callable[[Any], Any] = None,
+        **options,
+    ) -> "PartitionedRepository":
+        """Create repository with a `SQLiteRepository` partition per database.
+
+        `options` are passed to every `SQLiteRepository`.
+        """
+        partitions = [SQLiteRepository(db_name, **options) for db_name in db_names]
+        return cls(partitions, mapper, key)
+
+    def assign(self, indexes: Iterable[int]) -> "PartitionedRepository":
+        """Return repository claiming from partitions with given indexes only.
+
+        Messages are still inserted into all partitions.
+        """
+        assigned = copy.copy(self)
+        assigned.assigned = [self.partitions[index] for index in indexes]
+        assigned._turn = itertools.count()
+        return assigned
+
+    def _default_key(self, item: Any) -> Any:
+        key = self.mapper.get_partition_key(item)
+        return self.mapper.get_message_topic(item) if key is None else key
+
+    def partition_of(self, item: Any) -> Repository:
+        """Partition storing given message"""
+        return self.partitions[partition_index(self.key(item), len(self.partitions))]
+
+    def initialize(self):
+        for partition in self.partitions:
+            partition.initialize()
+
+    def close(self):
+        """Close partitions"""
+        for partition in self.partitions:
+            close = getattr(partition, "close", None)
+            if close is not None:
+                close()
+
+    def insert(self, item: Any, priority: int = 0, delay: float = None):
+        self.partition_of(item)._insert(
+            self.mapper.encode(item), **_schedule(priority, delay)
+        )
+
+    def insert_many(self, items: Iterable[Any], priority: int = 0, delay: float = None):
+        count = len(self.partitions)
+        grouped: Dict[int, list] = {}
+        for item in items:
+            index = partition_index(self.key(item), count)
+            grouped.setdefault(index, []).append(self.mapper.encode(item))
+        for index, group in grouped.items():
+            self.partitions[index]._insert_many(group, **_schedule(priority, delay))
+
+    def _insert(self, item: StoredMessage, priority: int = 0, delay: float = None):
+        self.partition_of(self.mapper.decode(item))._insert(
+            item, **_schedule(priority, delay)
+        )
+
+    def _insert_many(self, items: Iterable[StoredMessage], **schedule):
+        count = len(self.partitions)
+        grouped: Dict[int, list] = {}
+        for item in items:
+            index = partition_index(self.key(self.mapper.decode(item)), count)
+            grouped.setdefault(index, []).append(item)
+        for index, group in grouped.items():
+            self.partitions[index]._insert_many(group, **schedule)
+
+    def _select(
+        self, batch_limit: int = None, topics: List[str] = None
+    ) -> List[StoredMessage]:
+        limit = batch_limit or 1
+        count = len(self.assigned)
+        start = next(self._turn) % count
+        selected = []
+        for offset in range(count):
+            partition = self.assigned[(start + offset) % count]
+            if topics is None:
+                items = partition._select(batch_limit=limit - len(selected))
+            else:
+                items = partition._select(batch_limit=limit - len(selected), topics=topics)
+            self._remember(partition, [item.message_id for item in items])
+            selected.extend(items)
+            if len(selected) >= limit:
+                break
+        return selected
+
+    def _delete(self, item: StoredMessage):
+        self._delete_many([item.message_id])
+
+    def _delete_many(self, message_ids: List[str]):
+        for partition, ids in self._route(message_ids, forget=True).items():
+            partition._delete_many(ids)
+
+    def _extend_lease(self, message_ids: List[str], duration: float = None):
+        for partition, ids in self._route(message_ids).items():
+            partition._extend_lease(ids, duration)
+        self._renew(message_ids, duration)
+
+    def _release(self, message_ids: List[str], after: str = None):
+        for partition, ids in self._route(message_ids, forget=True).items():
+            if after is None:
+                partition._release(ids)
+            else:
+                partition._release(ids, after)
+
+    def _reclaim_expired(self) -> int:
+        with self._claims_lock:
+            self._forget_expired()
+        return sum(partition._reclaim_expired() for partition in self.partitions)
+
+    def _fail(self, message_ids: List[str], error: str = None):
+        for partition, ids in self._route(message_ids, forget=True).items():
+            partition._fail(ids, error)
+
+    def _redrive(self, message_ids: List[str] = None) -> int:
+        return sum(partition._redrive(message_ids) for partition in self.partitions)
+
+    def _select_dead(self, batch_limit: int = None) -> List[StoredMessage]:
+        dead = []
+        for partition in self.partitions:
+            if batch_limit is not None and len(dead) >= batch_limit:
+                break
+            remaining = None if batch_limit is None else batch_limit - len(dead)
+            dead.extend(partition._select_dead(remaining))
+        return dead
+
+    def _remember(self, partition: Repository, message_ids: List[str]):
+        """Remember partition of claimed message ids until their lease expires"""
+        now = time.monotonic()
+        deadline = now + getattr(partition, "lease_duration", math.inf)
+        with self._claims_lock:
+            self._forget_expired(now)
+            for message_id in message_ids:
+                self._claims[message_id] = (partition, deadline)
+
+    def _renew(self, message_ids: List[str], duration: float = None):
+        """Move claims with extended leases to the end of the expiry order"""
+        now = time.monotonic()
+        claims = self._claims
+        with self._claims_lock:
+            for message_id in message_ids:
+                claim = claims.pop(message_id, None)
+                if claim is not None:
+                    partition = claim[0]
+                    lease = getattr(partition, "lease_duration", math.inf)
+                    claims[message_id] = (
+                        partition,
+                        now + (lease if duration is None else duration),
+                    )
+
+    def _forget_expired(self, now: float = None):
+        """Forget claims from the front of the expiry order whose lease expired.
+
+        Caller holds the claims lock.
+        """
+        now = time.monotonic() if now is None else now
+        claims = self._claims
+        while claims:
+            message_id, (_, deadline) = next(iter(claims.items()))
+            if deadline > now:
+                break
+            del claims[message_id]
+
+    def _route(self, message_ids: List[str], forget: bool = False) -> Dict[Repository, list]:
+        """Group message ids by claiming partition, unknown ids go to all partitions"""
+        routed: Dict[Repository, list] = {}
+        unknown = []
+        claims = self._claims
+        with self._claims_lock:
+            for message_id in message_ids:
+                claim = claims.pop(message_id, None) if forget else claims.get(message_id)
+                if claim is None:
+                    unknown.append(message_id)
+                else:
+                    routed.setdefault(claim[0], []).append(message_id)
+        if unknown:
+            for partition in self.partitions:
+                routed.setdefault(partition, []).extend(unknown)
+        return routed
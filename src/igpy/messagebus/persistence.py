@@ -3,26 +3,40 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, List, Mapping
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Tuple
 from uuid import uuid4
 
+from igpy.serialization.codec import ClassCodec
 from igpy.serialization.transcode import AbstractTranscoder
-from igpy.serialization.utils import get_topic, resolve_topic
+from igpy.serialization.utils import TopicCache, get_topic, topic_cache as shared_topic_cache
 
 
 @dataclass(frozen=True)
 class StoredMessage:
     """Repository item"""
 
+    __slots__ = ("message_id", "posted_at", "topic", "state")
+
     message_id: str
     posted_at: datetime
     topic: str
     state: bytes
 
+    def __reduce__(self):
+        # frozen instances without __dict__ cannot be restored attribute by attribute
+        return (type(self), (self.message_id, self.posted_at, self.topic, self.state))
+
+
+def _from_row(row: tuple) -> StoredMessage:
+    return StoredMessage(*row)
+
 
 class CursorFactory:
     """Factory for cursor results"""
 
+    _message_factories: Dict[Tuple[str, ...], Callable[[tuple], StoredMessage]] = {}
+
     @classmethod
     def as_dict(cls, cursor, column_data: tuple[Any, ...]) -> Mapping:
         """Create dictionary-like object from cursor result"""
@@ -33,12 +47,45 @@ class CursorFactory:
     @classmethod
     def as_message(cls, cursor, column_data: tuple[Any, ...]) -> StoredMessage:
         """Create StoredMessage instance from cursor result"""
-        row = cls.as_dict(cursor, column_data)
-        return StoredMessage(**row)
+        return cls.message_factory(cursor.description)(column_data)
+
+    @classmethod
+    def message_factory(cls, description) -> Callable[[tuple], StoredMessage]:
+        """Return function creating StoredMessage from rows with given columns.
+
+        Column positions are looked up once per distinct column list. Rows
+        with columns in field order are passed to StoredMessage as they are.
+        """
+        column_names = tuple(col[0] for col in description)
+        factory = cls._message_factories.get(column_names)
+        if factory is None:
+            fields = StoredMessage.__slots__
+            if column_names == fields:
+                factory = _from_row
+            else:
+                getter = itemgetter(*(column_names.index(name) for name in fields))
+
+                def from_columns(row: tuple) -> StoredMessage:
+                    return StoredMessage(*getter(row))
+
+                factory = from_columns
+            cls._message_factories[column_names] = factory
+        return factory
+
+    @classmethod
+    def as_messages(cls, cursor, rows: Iterable[tuple]) -> List[StoredMessage]:
+        """Create StoredMessage instances from cursor results"""
+        return list(map(cls.message_factory(cursor.description), rows))
 
 
 class Mapper:
-    """Map objects to/from StoredMessage"""
+    """Map objects to/from StoredMessage
+
+    Messages with the same partition key are processed in posting order,
+    the key is read from `partition_key_attr` attribute of a message.
+    """
+
+    partition_key_attr = "partition_key"
 
     def encode(self, subject: object) -> StoredMessage:
         """Encode an object"""
@@ -48,24 +95,110 @@ class Mapper:
         """Reconstruct previously encoded object from StoredMessage"""
         return encoded
 
+    def get_message_id(self, subject: object) -> str:
+        """Get message id of an object without encoding it"""
+        return subject.message_id
+
+    def get_message_topic(self, subject: object) -> str:
+        """Get topic of an object without encoding it"""
+        return subject.topic
+
+    def get_partition_key(self, subject: object) -> Any:
+        """Get partition key of an object, None if it has no key"""
+        return getattr(subject, self.partition_key_attr, None)
+
+    def get_topic(self, topic_or_class: Any) -> str:
+        """Get topic of a message class. Topic strings are returned as is."""
+        if isinstance(topic_or_class, str):
+            return topic_or_class
+        return get_topic(topic_or_class)
+
+
+class LazyMessage:
+    """Message envelope decoding the payload on first access
+
+    Envelope fields are available without decoding. Other attributes are
+    looked up on the decoded message.
+    """
+
+    __slots__ = ("message_id", "posted_at", "topic", "state", "_mapper", "_message")
+
+    def __init__(self, encoded: StoredMessage, mapper: "TranscodingMapper"):
+        self.message_id = encoded.message_id
+        self.posted_at = encoded.posted_at
+        self.topic = encoded.topic
+        self.state = encoded.state
+        self._mapper = mapper
+        self._message = None
+
+    @property
+    def message(self) -> object:
+        """Decoded message"""
+        if self._message is None:
+            self._message = self._mapper.decode_message(self.stored_message())
+        return self._message
+
+    def stored_message(self) -> StoredMessage:
+        """StoredMessage the envelope was created from"""
+        return StoredMessage(self.message_id, self.posted_at, self.topic, self.state)
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.message, name)
+
+    def __repr__(self) -> str:
+        return f"LazyMessage(message_id={self.message_id!r}, topic={self.topic!r})"
+
 
 class TranscodingMapper(Mapper):
-    """Map objects to/from StoredMessage using state transcoder(s)"""
+    """Map objects to/from StoredMessage using state transcoder(s)
+
+    If `lazy` is True, decode returns :class:`LazyMessage` envelopes which
+    decode the state on first access.
+
+    Message state is read and set by a :class:`ClassCodec` compiled on first
+    use of each message class, so slotted and frozen classes are supported.
+
+    If `partition_key` is given, it is called with a message to get its
+    partition key instead of reading the key attribute.
+    """
 
     id_attr = "message_id"
     posted_at_attr = "posted_at"
 
-    def __init__(self, transcoder: AbstractTranscoder = None):
+    def __init__(
+        self,
+        transcoder: AbstractTranscoder = None,
+        topic_cache: TopicCache = None,
+        lazy: bool = False,
+        partition_key: Callable[[object], Any] = None,
+    ):
         self.transcoders = []
         if transcoder:
             self.transcoders.append(transcoder)
+        self.topic_cache = topic_cache or shared_topic_cache
+        self.lazy = lazy
+        self.partition_key = partition_key
+        self.codecs: Dict[type, ClassCodec] = {}
+
+    def get_codec(self, cls: type) -> ClassCodec:
+        """Return cached codec of a message class"""
+        try:
+            return self.codecs[cls]
+        except KeyError:
+            codec = ClassCodec(cls, exclude=(self.id_attr, self.posted_at_attr))
+            self.codecs[cls] = codec
+            return codec
 
     def encode(self, subject: object) -> StoredMessage:
-        props = subject.__dict__.copy()
-        message_id = props.pop(self.id_attr, None) or uuid4().hex
-        posted_at = props.pop(self.posted_at_attr, None) or datetime.utcnow()
-        topic = get_topic(type(subject))
-        encoded_props = props
+        if isinstance(subject, LazyMessage):
+            return subject.stored_message()
+        cls = type(subject)
+        message_id = getattr(subject, self.id_attr, None) or uuid4().hex
+        posted_at = getattr(subject, self.posted_at_attr, None) or datetime.utcnow()
+        topic = self.topic_cache.get_topic(cls)
+        encoded_props = self.get_codec(cls).get_state(subject)
         for transcoder in self.transcoders:
             encoded_props = transcoder.encode(encoded_props)
         return StoredMessage(
@@ -76,48 +209,241 @@ class TranscodingMapper(Mapper):
         )
 
     def decode(self, encoded: StoredMessage) -> object:
-        cls = resolve_topic(encoded.topic)
-        message = object.__new__(cls)
+        if self.lazy:
+            return LazyMessage(encoded, self)
+        return self.decode_message(encoded)
+
+    def decode_message(self, encoded: StoredMessage) -> object:
+        """Reconstruct message object from StoredMessage"""
+        codec = self.get_codec(self.topic_cache.resolve_topic(encoded.topic))
         props: object = encoded.state
+        if not self.transcoders:
+            # keep stored state unchanged
+            props = dict(props)
         for transcoder in reversed(self.transcoders):
             props = transcoder.decode(props)
         props[self.id_attr] = encoded.message_id
         props[self.posted_at_attr] = encoded.posted_at
-        message.__dict__.update(props)
-        return message
+        return codec.create(props)
+
+    def get_message_id(self, subject: object) -> str:
+        return getattr(subject, self.id_attr)
+
+    def get_message_topic(self, subject: object) -> str:
+        if isinstance(subject, LazyMessage):
+            return subject.topic
+        return self.topic_cache.get_topic(type(subject))
+
+    def get_partition_key(self, subject: object) -> Any:
+        if self.partition_key is not None:
+            return self.partition_key(subject)
+        return super().get_partition_key(subject)
+
+    def get_topic(self, topic_or_class: Any) -> str:
+        if isinstance(topic_or_class, str):
+            return topic_or_class
+        return self.topic_cache.get_topic(topic_or_class)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Retry schedule of failed messages
+
+    A failed message is retried after `initial_delay` seconds, multiplied by
+    `backoff_factor` for every further attempt, up to `max_delay`. Messages
+    failed `max_attempts` times are moved to dead letters.
+    """
+
+    max_attempts: int = 5
+    initial_delay: float = 1
+    backoff_factor: float = 2
+    max_delay: float = 300
+
+    def delay(self, attempts: int) -> float:
+        """Delay before retrying a message attempted `attempts` times"""
+        delay = self.initial_delay * self.backoff_factor ** max(attempts - 1, 0)
+        return min(delay, self.max_delay)
+
+    def exhausted(self, attempts: int) -> bool:
+        """Returns True if a message attempted `attempts` times should not be retried"""
+        return attempts >= self.max_attempts
+
+
+def _schedule(priority: int, delay: float) -> dict:
+    """Scheduling arguments of protected insert methods, empty if not scheduled"""
+    if not priority and not delay:
+        return {}
+    return {"priority": priority, "delay": delay}
 
 
 class Repository(ABC):
     """Repository for StoredMessage objects"""
 
-    def __init__(self, mapper: Mapper = None):
+    def __init__(self, mapper: Mapper = None, retry_policy: RetryPolicy = None):
         super().__init__()
         self.mapper = mapper or Mapper()
+        self.retry_policy = retry_policy or RetryPolicy()
 
     def initialize(self):
         """Perform initial repository setup"""
 
     @abstractmethod
-    def _insert(self, item: Any):
-        """Insert item into the repository"""
+    def _insert(self, item: Any, priority: int = 0, delay: float = None):
+        """Insert item into the repository.
+
+        Items with higher `priority` are selected first. Item is not selected
+        before `delay` seconds pass. Repositories without scheduling support
+        are called without these arguments.
+        """
 
     @abstractmethod
-    def _select(self, batch_limit: int = None) -> List[Any]:
-        """Select items for processing from the repository"""
+    def _select(self, batch_limit: int = None, topics: List[str] = None) -> List[Any]:
+        """Select items for processing from the repository.
+
+        If `topics` is given, only items with these topics are selected.
+        """
+
+    def _iter_select(
+        self, batch_limit: int = None, topics: List[str] = None
+    ) -> Iterator[Any]:
+        """Select items for processing, return iterator fetching them as needed.
+
+        Items are claimed before returning. By default the whole batch is
+        fetched by `_select`.
+        """
+        if topics is None:
+            return iter(self._select(batch_limit=batch_limit))
+        return iter(self._select(batch_limit=batch_limit, topics=topics))
+
+    def _insert_many(self, items: Iterable[StoredMessage], **schedule):
+        """Insert multiple items into the repository"""
+        for item in items:
+            self._insert(item, **schedule)
 
     def _delete(self, item: StoredMessage):
         """Delete item from the repository"""
 
-    def insert(self, item: Any):
-        """Insert item into the repository"""
-        self._insert(self.mapper.encode(item))
+    def _delete_many(self, message_ids: List[str]):
+        """Delete items with given message ids from the repository"""
+
+    def _extend_lease(self, message_ids: List[str], duration: float = None):
+        """Extend lease of claimed items by `duration` seconds from now"""
+
+    def _release(self, message_ids: List[str], after: str = None):
+        """Return claimed items to the queue without counting an attempt.
+
+        Items keep their queue position, unless `after` is the message id
+        of an unclaimed item: then they are delivered after it, and not
+        before it is due. By default their leases are expired, so the
+        claim still counts and `after` is ignored.
+        """
+        self._extend_lease(message_ids, 0)
+
+    def _reclaim_expired(self) -> int:
+        """Return items with expired leases to the queue"""
+        return 0
+
+    def _fail(self, message_ids: List[str], error: str = None):
+        """Schedule retry of failed items or move them to dead letters"""
+
+    def _redrive(self, message_ids: List[str] = None) -> int:
+        """Return dead letters to the queue"""
+        return 0
+
+    def _select_dead(self, batch_limit: int = None) -> List[Any]:
+        """Select dead letters, oldest failures first"""
+        return []
 
-    def select(self, batch_limit: int = None) -> List[Any]:
-        """Select items for processing from the repository"""
-        return [
-            self.mapper.decode(item) for item in self._select(batch_limit=batch_limit)
-        ]
+    def insert(self, item: Any, priority: int = 0, delay: float = None):
+        """Insert item into the repository.
+
+        Items with higher `priority` are selected first. Item is not selected
+        before `delay` seconds pass.
+        """
+        self._insert(self.mapper.encode(item), **_schedule(priority, delay))
+
+    def insert_many(self, items: Iterable[Any], priority: int = 0, delay: float = None):
+        """Insert multiple items with the same priority and delay into the repository"""
+        self._insert_many(
+            (self.mapper.encode(item) for item in items), **_schedule(priority, delay)
+        )
+
+    def select(self, batch_limit: int = None, topics: Iterable[Any] = None) -> List[Any]:
+        """Select items for processing from the repository.
+
+        `topics` limits selection to items with given topics or message classes.
+        """
+        if topics is None:
+            items = self._select(batch_limit=batch_limit)
+        else:
+            topics = [self.mapper.get_topic(topic) for topic in topics]
+            items = self._select(batch_limit=batch_limit, topics=topics)
+        return [self.mapper.decode(item) for item in items]
+
+    def iter_select(
+        self, batch_limit: int = None, topics: Iterable[Any] = None
+    ) -> Iterator[Any]:
+        """Select items for processing, return iterator decoding them one at a time.
+
+        The batch is claimed when called, items are fetched and decoded
+        while iterating.
+        """
+        if topics is None:
+            items = self._iter_select(batch_limit=batch_limit)
+        else:
+            topics = [self.mapper.get_topic(topic) for topic in topics]
+            items = self._iter_select(batch_limit=batch_limit, topics=topics)
+        return map(self.mapper.decode, items)
 
     def delete(self, item: Any):
         """Delete item from the repository"""
         self._delete(self.mapper.encode(item))
+
+    def delete_many(self, message_ids: Iterable[str]):
+        """Delete items with given message ids from the repository"""
+        self._delete_many(list(message_ids))
+
+    def extend_lease(self, message_ids: Iterable[str], duration: float = None):
+        """Extend lease of claimed items by `duration` seconds from now.
+
+        Repository default lease duration is used if `duration` is not given.
+        """
+        self._extend_lease(list(message_ids), duration)
+
+    def release(self, message_ids: Iterable[str], after: str = None):
+        """Return claimed items which were not processed to the queue.
+
+        Unlike :meth:`fail`, the claim does not count as an attempt and
+        items are not delayed, unless `after` is the message id of an
+        unclaimed item. Then they are delivered after it, e.g. after the
+        retry of a failed item.
+        """
+        if after is None:
+            self._release(list(message_ids))
+        else:
+            self._release(list(message_ids), after)
+
+    def reclaim_expired(self) -> int:
+        """Return items with expired leases to the queue, return number of items"""
+        return self._reclaim_expired()
+
+    def fail(self, message_ids: Iterable[str], error: str = None):
+        """Release claimed items which failed processing.
+
+        Items are retried later according to the retry policy. Items which
+        exhausted their attempts are moved to dead letters with `error`.
+        """
+        self._fail(list(message_ids), error)
+
+    def redrive(self, message_ids: Iterable[str] = None) -> int:
+        """Return dead letters with given ids, or all, to the queue.
+
+        Returns number of returned items.
+        """
+        if message_ids is not None:
+            message_ids = list(message_ids)
+        return self._redrive(message_ids)
+
+    def select_dead(self, batch_limit: int = None) -> List[Any]:
+        """Select dead letters, oldest failures first"""
+        return [self.mapper.decode(item) for item in self._select_dead(batch_limit)]
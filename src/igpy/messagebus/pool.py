@@ -0,0 +1,138 @@
+"""Pool of message bus consumers"""
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+import os
+import threading
+from typing import Callable, List
+
+from .messagebus import Consumer
+
+_paused = None
+_stopped = None
+
+
+def _initialize_worker(paused, stopped):
+    """Keep pool control events in the worker process"""
+    global _paused, _stopped  # pylint: disable=global-statement
+    _paused = paused
+    _stopped = stopped
+
+
+def _run_worker(consumer_factory: Callable[[], Consumer], control_interval: float):
+    """Run consumer in a worker process, following pool control events"""
+    consumer = consumer_factory()
+
+    def control():
+        while not _stopped.wait(control_interval):
+            if _paused.is_set():
+                consumer.pause()
+            else:
+                consumer.resume()
+        consumer.stop()
+
+    threading.Thread(target=control, daemon=True).start()
+    consumer.run()
+
+
+class ConsumerPool:
+    """Run multiple consumers in parallel
+
+    Every worker runs its own consumer created by `consumer_factory` and
+    claims its own batches from the message bus. Use the ``"thread"``
+    executor for I/O-bound handlers and ``"process"`` for CPU-bound
+    handlers. Process workers call `consumer_factory` in the worker process,
+    so the factory must be picklable and should open its own repository.
+    """
+
+    def __init__(
+        self,
+        consumer_factory: Callable[[], Consumer],
+        workers: int = None,
+        executor: str = "thread",
+    ):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor: {executor}")
+        self.consumer_factory = consumer_factory
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = executor
+        self.control_interval = 0.05
+        self.consumers: List[Consumer] = []
+        self._executor = None
+        self._futures: List[Future] = []
+        self._paused = None
+        self._stopped = None
+
+    @property
+    def running(self) -> bool:
+        """True if pool has been started and not stopped yet"""
+        return self._executor is not None
+
+    def start(self):
+        """Start the workers"""
+        if self.running:
+            raise RuntimeError("Consumer pool is already running")
+        if self.executor == "thread":
+            self.consumers = [self.consumer_factory() for _ in range(self.workers)]
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            self._futures = [
+                self._executor.submit(consumer.run) for consumer in self.consumers
+            ]
+        else:
+            context = multiprocessing.get_context()
+            self._paused = context.Event()
+            self._stopped = context.Event()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_initialize_worker,
+                initargs=(self._paused, self._stopped),
+            )
+            self._futures = [
+                self._executor.submit(
+                    _run_worker, self.consumer_factory, self.control_interval
+                )
+                for _ in range(self.workers)
+            ]
+
+    def pause(self):
+        """Pause all workers"""
+        for consumer in self.consumers:
+            consumer.pause()
+        if self._paused:
+            self._paused.set()
+
+    def resume(self):
+        """Resume previously paused workers"""
+        for consumer in self.consumers:
+            consumer.resume()
+        if self._paused:
+            self._paused.clear()
+
+    def stop(self):
+        """Stop all workers and wait for them to exit.
+
+        Exceptions raised by workers are re-raised.
+        """
+        if not self.running:
+            return
+        for consumer in self.consumers:
+            consumer.stop()
+        if self._stopped:
+            self._stopped.set()
+        try:
+            for future in self._futures:
+                future.result()
+        finally:
+            self._executor.shutdown()
+            self._executor = None
+            self._futures = []
+            self.consumers = []
+            self._paused = None
+            self._stopped = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,601 @@
+"""Message Bus repository appending messages to memory-mapped segment files"""
+
+import bisect
+from datetime import datetime, timedelta
+import heapq
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+import zlib
+
+from igpy.messagebus.persistence import (
+    Mapper,
+    Repository,
+    RetryPolicy,
+    StoredMessage,
+    TranscodingMapper,
+)
+from igpy.serialization.transcode import JSONTranscoder
+
+# record header: record length, CRC-32 of the record body, posting time and
+# delivery time in microseconds since the epoch, then message id, topic and
+# state lengths; the body holds message id, topic, state and optional tail
+_HEADER = struct.Struct("<IIqqHHI")
+_OFFSET = struct.Struct("<Q")
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+SEGMENT_SUFFIX = ".seg"
+ACK_SUFFIX = ".ack"
+OFFSET_FILE = "consumer.offset"
+DEAD_FILE = "dead.log"
+
+
+def _now_us() -> int:
+    return time.time_ns() // 1000
+
+
+def _encode_record(item: StoredMessage, not_before: int, tail: bytes = b"") -> bytes:
+    """Encode item as log record delivered not before `not_before` microseconds"""
+    message_id = item.message_id.encode("utf8")
+    topic = item.topic.encode("utf8")
+    body = b"".join((message_id, topic, item.state, tail))
+    return (
+        _HEADER.pack(
+            _HEADER.size + len(body),
+            zlib.crc32(body),
+            (item.posted_at - _EPOCH) // _MICROSECOND,
+            not_before,
+            len(message_id),
+            len(topic),
+            len(item.state),
+        )
+        + body
+    )
+
+
+def _decode_record(
+    view: memoryview, position: int
+) -> Tuple[StoredMessage, int, memoryview]:
+    """Decode record at `position`, return item, delivery time and record tail.
+
+    Item state and tail are slices of `view`, they are not copied.
+    """
+    length, _, posted_at, not_before, id_size, topic_size, state_size = (
+        _HEADER.unpack_from(view, position)
+    )
+    topic_start = position + _HEADER.size + id_size
+    state_start = topic_start + topic_size
+    state_end = state_start + state_size
+    item = StoredMessage(
+        str(view[position + _HEADER.size : topic_start], "utf8"),
+        _EPOCH + timedelta(microseconds=posted_at),
+        str(view[topic_start:state_start], "utf8"),
+        view[state_start:state_end],
+    )
+    return item, not_before, view[state_end : position + length]
+
+
+def _scan(view: memoryview) -> Tuple[List[int], int]:
+    """Return positions of intact records and end of the last one.
+
+    Scanning stops at unused space or at a record torn by a crash.
+    """
+    positions = []
+    position = 0
+    end = len(view)
+    while position + _HEADER.size <= end:
+        length, crc = _HEADER.unpack_from(view, position)[:2]
+        if length < _HEADER.size or position + length > end:
+            break
+        if zlib.crc32(view[position + _HEADER.size : position + length]) != crc:
+            break
+        positions.append(position)
+        position += length
+    return positions, position
+
+
+class _Segment:
+    """Memory-mapped segment file with its acknowledgment bitmap
+
+    Bit ``n`` of the bitmap is set when record ``n`` of the segment is
+    acknowledged. Bitmap changes are written by `flush_acks`.
+    """
+
+    __slots__ = (
+        "base",
+        "path",
+        "map",
+        "view",
+        "positions",
+        "end",
+        "acks",
+        "acked",
+        "ack_file",
+        "_dirty",
+    )
+
+    def __init__(self, directory: str, base: int, size: int = None):
+        self.base = base
+        self.path = os.path.join(directory, f"{base:020d}")
+        with open(self.path + SEGMENT_SUFFIX, "w+b" if size else "r+b") as file:
+            if size:
+                file.truncate(size)
+            self.map = mmap.mmap(file.fileno(), 0)
+        self.view = memoryview(self.map)
+        if size:
+            self.positions, self.end = [], 0
+        else:
+            self.positions, self.end = _scan(self.view)
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        if size:
+            flags |= os.O_TRUNC
+        fd = os.open(self.path + ACK_SUFFIX, flags)
+        self.ack_file = os.fdopen(fd, "r+b", buffering=0)
+        self.acks = bytearray(self.ack_file.read())
+        self.acked = bin(int.from_bytes(self.acks, "little")).count("1")
+        self._dirty = None
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def append(self, record: bytes) -> bool:
+        """Append record, return False if the segment is full"""
+        end = self.end + len(record)
+        if end > len(self.map):
+            return False
+        self.map[self.end : end] = record
+        self.positions.append(self.end)
+        self.end = end
+        return True
+
+    def is_acked(self, index: int) -> bool:
+        byte, bit = divmod(index, 8)
+        return byte < len(self.acks) and self.acks[byte] >> bit & 1
+
+    def ack(self, index: int):
+        byte, bit = divmod(index, 8)
+        if byte >= len(self.acks):
+            self.acks.extend(bytes(byte + 1 - len(self.acks)))
+        if not self.acks[byte] >> bit & 1:
+            self.acks[byte] |= 1 << bit
+            self.acked += 1
+        low, high = self._dirty or (byte, byte)
+        self._dirty = (min(low, byte), max(high, byte))
+
+    def flush_acks(self, sync: bool = False):
+        """Write changed part of the bitmap"""
+        if self._dirty is None:
+            return
+        low, high = self._dirty
+        self._dirty = None
+        self.ack_file.seek(low)
+        self.ack_file.write(self.acks[low : high + 1])
+        if sync:
+            os.fsync(self.ack_file.fileno())
+
+    def close(self):
+        self.flush_acks()
+        self.ack_file.close()
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            # zero-copy slices are still referenced, mapping is released with them
+            pass
+
+    def remove(self):
+        self.close()
+        for suffix in (SEGMENT_SUFFIX, ACK_SUFFIX):
+            os.remove(self.path + suffix)
+
+
+class SegmentLogRepository(Repository):
+    """Message Bus repository appending messages to memory-mapped segment files
+
+    Messages are appended in posting order to segment files in `directory`.
+    The active segment is rolled when its `segment_size` bytes are used.
+    Acknowledged (deleted) messages are marked in a bitmap file next to
+    each segment, and the position of the oldest unacknowledged message is
+    kept in the consumer offset file. Fully acknowledged segments are
+    removed.
+
+    Claimed items are zero-copy: their state is a ``memoryview`` slice of
+    the mapped segment, decoded directly by the mapper's transcoder.
+
+    Messages are delivered in append order, so priorities are not
+    supported. Leases, attempts and retry delays are kept in process
+    memory: after reopening, all unacknowledged messages are delivered
+    again. Dead letters are appended to a separate log file. Segments
+    recovered when the repository is initialized are not appended to,
+    new messages go to a new segment.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        mapper: Mapper = None,
+        segment_size: int = 16 * 2**20,
+        lease_duration: float = 300,
+        retry_policy: RetryPolicy = None,
+        sync: bool = False,
+    ):
+        mapper = mapper or TranscodingMapper(JSONTranscoder())
+        super().__init__(mapper, retry_policy)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.lease_duration = lease_duration
+        self.sync = sync
+        self._segments: List[_Segment] = []
+        self._active: Optional[_Segment] = None
+        self._bases: List[int] = []
+        self._offset_file = None
+        self._low_water = 0
+        self._next = 0
+        self._cursor = 0
+        self._index: Dict[str, int] = {}
+        self._attempts: Dict[int, int] = {}
+        self._leases: Dict[int, float] = {}
+        self._lease_heap = []
+        self._available: Dict[str, list] = {}
+        self._delayed = []
+        self._lock = threading.Lock()
+        self._dead_lock = threading.Lock()
+
+    def initialize(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            path = os.path.join(self.directory, OFFSET_FILE)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+            self._offset_file = os.fdopen(fd, "r+b", buffering=0)
+            data = self._offset_file.read(_OFFSET.size)
+            self._low_water = _OFFSET.unpack(data)[0] if data else 0
+            bases = sorted(
+                int(name[: -len(SEGMENT_SUFFIX)])
+                for name in os.listdir(self.directory)
+                if name.endswith(SEGMENT_SUFFIX)
+            )
+            for base in bases:
+                path = os.path.join(self.directory, f"{base:020d}")
+                if not os.path.getsize(path + SEGMENT_SUFFIX):
+                    # crashed while rolling, the segment never held a record
+                    for suffix in (SEGMENT_SUFFIX, ACK_SUFFIX):
+                        if os.path.exists(path + suffix):
+                            os.remove(path + suffix)
+                    continue
+                segment = _Segment(self.directory, base)
+                self._segments.append(segment)
+                self._bases.append(base)
+                self._next = base + len(segment)
+                for index in range(len(segment)):
+                    if base + index < self._low_water:
+                        segment.ack(index)
+                    elif not segment.is_acked(index):
+                        item = _decode_record(segment.view, segment.positions[index])[0]
+                        self._index[item.message_id] = base + index
+                segment.flush_acks()
+            if self._bases:
+                self._low_water = max(self._low_water, self._bases[0])
+            self._next = max(self._next, self._low_water)
+            self._cursor = self._low_water
+            self._collect()
+
+    def close(self):
+        """Close segment and offset files"""
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+            self._segments.clear()
+            self._bases.clear()
+            self._active = None
+            if self._offset_file is not None:
+                self._offset_file.close()
+                self._offset_file = None
+
+    def message_count(self) -> int:
+        """Number of unacknowledged messages, claimed or not"""
+        return len(self._index)
+
+    def claimed_count(self) -> int:
+        """Number of claimed messages"""
+        return len(self._leases)
+
+    def segment_count(self) -> int:
+        """Number of segment files"""
+        return len(self._segments)
+
+    def _insert(self, item: StoredMessage, priority: int = 0, delay: float = None):
+        self._insert_many([item], priority, delay)
+
+    def _insert_many(
+        self, items: Iterable[StoredMessage], priority: int = 0, delay: float = None
+    ):
+        if priority:
+            raise ValueError(f"{type(self).__name__} does not support priorities")
+        not_before = _now_us() + int(delay * 1e6) if delay else 0
+        records = [(item.message_id, _encode_record(item, not_before)) for item in items]
+        with self._lock:
+            self._append(records)
+
+    def _select(
+        self, batch_limit: int = None, topics: List[str] = None
+    ) -> List[StoredMessage]:
+        limit = batch_limit or 1
+        now = _now_us()
+        with self._lock:
+            self._expire_leases(time.monotonic())
+            self._release_due(now)
+            claimed = self._claim_available(limit, topics)
+            topics = None if topics is None else set(topics)
+            while len(claimed) < limit and self._cursor < self._next:
+                sequence = self._cursor
+                self._cursor += 1
+                segment, index = self._locate(sequence)
+                if segment is None or segment.is_acked(index):
+                    continue
+                item, not_before, _ = _decode_record(segment.view, segment.positions[index])
+                if not_before > now:
+                    heapq.heappush(self._delayed, (not_before, sequence, item.topic))
+                elif topics is not None and item.topic not in topics:
+                    self._push_available(item.topic, sequence)
+                else:
+                    claimed.append(self._lease(sequence, item))
+            return claimed
+
+    def _delete(self, item: StoredMessage):
+        self._delete_many([item.message_id])
+
+    def _delete_many(self, message_ids: List[str]):
+        with self._lock:
+            for message_id in message_ids:
+                sequence = self._index.get(message_id)
+                if sequence is not None:
+                    self._ack(sequence, message_id)
+            self._collect()
+
+    def _extend_lease(self, message_ids: List[str], duration: float = None):
+        if duration is None:
+            duration = self.lease_duration
+        expires_at = time.monotonic() + duration
+        with self._lock:
+            for message_id in message_ids:
+                sequence = self._index.get(message_id)
+                if sequence in self._leases:
+                    self._leases[sequence] = expires_at
+                    heapq.heappush(self._lease_heap, (expires_at, sequence))
+
+    def _release(self, message_ids: List[str], after: str = None):
+        with self._lock:
+            due = None
+            head = self._index.get(after) if after is not None else None
+            if head is not None:
+                # retries are few, find the retry of the head among them
+                due = next((item[0] for item in self._delayed if item[1] == head), None)
+            for message_id in message_ids:
+                sequence = self._index.get(message_id)
+                if self._leases.pop(sequence, None) is None:
+                    continue
+                self._attempts[sequence] -= 1
+                topic = self._read(sequence).topic
+                if due is None:
+                    self._push_available(topic, sequence)
+                else:
+                    heapq.heappush(self._delayed, (due, sequence, topic))
+
+    def _reclaim_expired(self) -> int:
+        with self._lock:
+            expired = self._expire_leases(time.monotonic())
+            self._collect()
+            return expired
+
+    def _fail(self, message_ids: List[str], error: str = None):
+        now = _now_us()
+        policy = self.retry_policy
+        with self._lock:
+            for message_id in message_ids:
+                sequence = self._index.get(message_id)
+                if self._leases.pop(sequence, None) is None:
+                    continue
+                attempts = self._attempts[sequence]
+                if policy.exhausted(attempts):
+                    self._bury(sequence, error)
+                else:
+                    due = now + int(policy.delay(attempts) * 1e6)
+                    heapq.heappush(self._delayed, (due, sequence, self._read(sequence).topic))
+            self._collect()
+
+    def _redrive(self, message_ids: List[str] = None) -> int:
+        now = _now_us()
+        with self._lock, self._dead_lock:
+            dead = self._read_dead()
+            if message_ids is None:
+                redriven, kept = dead, []
+            else:
+                wanted = set(message_ids)
+                redriven = [record for record in dead if record[0].message_id in wanted]
+                kept = [record for record in dead if record[0].message_id not in wanted]
+            if not redriven:
+                return 0
+            self._append(
+                [(item.message_id, _encode_record(item, now)) for item, _, _ in redriven]
+            )
+            path = os.path.join(self.directory, DEAD_FILE)
+            with open(path + ".tmp", "wb") as file:
+                for item, failed_at, error in kept:
+                    file.write(_encode_record(item, failed_at, error))
+            os.replace(path + ".tmp", path)
+            return len(redriven)
+
+    def _select_dead(self, batch_limit: int = None) -> List[StoredMessage]:
+        with self._dead_lock:
+            dead = self._read_dead()
+        return [item for item, _, _ in dead[:batch_limit]]
+
+    # log structures, called with the lock held
+
+    def _append(self, records: List[Tuple[str, bytes]]):
+        for message_id, _ in records:
+            if message_id in self._index:
+                raise ValueError(f"Duplicate message id: {message_id}")
+        segment = self._active
+        written = set()
+        for message_id, record in records:
+            if segment is None or not segment.append(record):
+                segment = self._roll(len(record))
+                segment.append(record)
+            written.add(segment)
+            self._index[message_id] = self._next
+            self._next += 1
+        if self.sync:
+            for segment in written:
+                segment.map.flush()
+
+    def _roll(self, size: int) -> _Segment:
+        segment = _Segment(self.directory, self._next, max(self.segment_size, size))
+        self._segments.append(segment)
+        self._bases.append(segment.base)
+        self._active = segment
+        self._collect()
+        return segment
+
+    def _locate(self, sequence: int) -> Tuple[Optional[_Segment], int]:
+        position = bisect.bisect_right(self._bases, sequence) - 1
+        if position < 0:
+            return None, 0
+        segment = self._segments[position]
+        index = sequence - segment.base
+        if index >= len(segment):
+            return None, 0
+        return segment, index
+
+    def _read(self, sequence: int) -> StoredMessage:
+        segment, index = self._locate(sequence)
+        return _decode_record(segment.view, segment.positions[index])[0]
+
+    def _is_acked(self, sequence: int) -> bool:
+        segment, index = self._locate(sequence)
+        return segment is None or segment.is_acked(index)
+
+    def _lease(self, sequence: int, item: StoredMessage) -> StoredMessage:
+        expires_at = time.monotonic() + self.lease_duration
+        self._leases[sequence] = expires_at
+        heapq.heappush(self._lease_heap, (expires_at, sequence))
+        self._attempts[sequence] = self._attempts.get(sequence, 0) + 1
+        return item
+
+    def _ack(self, sequence: int, message_id: str):
+        del self._index[message_id]
+        self._leases.pop(sequence, None)
+        self._attempts.pop(sequence, None)
+        segment, index = self._locate(sequence)
+        if segment is not None:
+            segment.ack(index)
+
+    def _bury(self, sequence: int, error: str):
+        item = self._read(sequence)
+        record = _encode_record(item, _now_us(), (error or "").encode("utf8"))
+        with self._dead_lock:
+            with open(os.path.join(self.directory, DEAD_FILE), "ab") as file:
+                file.write(record)
+        self._ack(sequence, item.message_id)
+
+    def _read_dead(self) -> List[Tuple[StoredMessage, int, bytes]]:
+        """Dead letters with failure time and error, oldest failures first"""
+        try:
+            with open(os.path.join(self.directory, DEAD_FILE), "rb") as file:
+                view = memoryview(file.read())
+        except FileNotFoundError:
+            return []
+        positions, _ = _scan(view)
+        dead = []
+        for position in positions:
+            item, failed_at, error = _decode_record(view, position)
+            dead.append((item, failed_at, bytes(error)))
+        return dead
+
+    def _push_available(self, topic: str, sequence: int):
+        heap = self._available.get(topic)
+        if heap is None:
+            heap = self._available[topic] = []
+        heapq.heappush(heap, sequence)
+
+    def _claim_available(self, limit: int, topics: List[str] = None) -> List[StoredMessage]:
+        """Claim returned and skipped messages, they precede the cursor"""
+        if topics is None:
+            heaps = list(self._available.values())
+        else:
+            heaps = [self._available[topic] for topic in set(topics) if topic in self._available]
+        heads = []
+        for heap in heaps:
+            self._discard_acked(heap)
+            if heap:
+                heads.append((heap[0], heap))
+        heapq.heapify(heads)
+        claimed = []
+        while heads and len(claimed) < limit:
+            heap = heads[0][1]
+            sequence = heapq.heappop(heap)
+            claimed.append(self._lease(sequence, self._read(sequence)))
+            self._discard_acked(heap)
+            if heap:
+                heapq.heapreplace(heads, (heap[0], heap))
+            else:
+                heapq.heappop(heads)
+        return claimed
+
+    def _discard_acked(self, heap: list):
+        while heap and self._is_acked(heap[0]):
+            heapq.heappop(heap)
+
+    def _release_due(self, now: int):
+        delayed = self._delayed
+        while delayed and delayed[0][0] <= now:
+            _, sequence, topic = heapq.heappop(delayed)
+            if not self._is_acked(sequence):
+                self._push_available(topic, sequence)
+
+    def _expire_leases(self, now: float) -> int:
+        heap = self._lease_heap
+        expired = 0
+        while heap and heap[0][0] < now:
+            expires_at, sequence = heapq.heappop(heap)
+            if self._leases.get(sequence) != expires_at:
+                # acknowledged, failed or extended since
+                continue
+            del self._leases[sequence]
+            expired += 1
+            if self.retry_policy.exhausted(self._attempts[sequence]):
+                self._bury(sequence, "Lease expired")
+            else:
+                self._push_available(self._read(sequence).topic, sequence)
+        return expired
+
+    def _collect(self):
+        """Flush acknowledgments, advance consumer offset, remove acknowledged segments"""
+        for segment in self._segments:
+            segment.flush_acks(self.sync)
+        low_water = self._low_water
+        while low_water < self._next:
+            segment, index = self._locate(low_water)
+            if segment is None:
+                position = bisect.bisect_right(self._bases, low_water)
+                low_water = self._bases[position] if position < len(self._bases) else self._next
+            elif segment.is_acked(index):
+                low_water += 1
+            else:
+                break
+        if low_water != self._low_water and self._offset_file is not None:
+            self._low_water = low_water
+            self._offset_file.seek(0)
+            self._offset_file.write(_OFFSET.pack(low_water))
+            if self.sync:
+                os.fsync(self._offset_file.fileno())
+        for segment in list(self._segments):
+            if segment is not self._active and segment.acked == len(segment):
+                position = self._segments.index(segment)
+                del self._segments[position]
+                del self._bases[position]
+                segment.remove()
@@ -1,43 +1,358 @@
 """Message Bus repository implementation using SQLite"""
 
-from contextlib import contextmanager
-from datetime import datetime
+from array import array
+from concurrent.futures import Future
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+from itertools import islice
+import queue
 import sqlite3
-from typing import List
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Set
 from uuid import uuid4
+import weakref
 from igpy.messagebus.persistence import (
     CursorFactory,
     Mapper,
     Repository,
+    RetryPolicy,
     StoredMessage,
     TranscodingMapper,
 )
 from igpy.serialization.transcode import JSONTranscoder
 
 
+def _chunked(items: Iterable, size: int) -> Iterator[list]:
+    """Split iterable into lists of at most `size` items"""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class GroupCommitWriter:
+    """Write-behind queue committing items from many callers together
+
+    Items are written by a single writer thread every `max_batch` items or
+    `max_delay` seconds after the first waiting item, whichever comes first.
+    Futures returned by `submit` are resolved once the item is committed.
+    Items which are not written when the writer thread exits fail with
+    `RuntimeError`.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[List[Any]], None],
+        max_batch: int = 1000,
+        max_delay: float = 0.005,
+    ):
+        self._write = write
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        # makes closing atomic with queueing, nothing is queued after the sentinel
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="group-commit-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        """Queue item for writing"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Group commit writer is closed")
+            self._queue.put((item, future))
+        return future
+
+    def close(self):
+        """Write queued items and stop the writer thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        try:
+            self._write_batches()
+        finally:
+            with self._lock:
+                self._closed = True
+            self._fail_pending()
+
+    def _write_batches(self):
+        stopping = False
+        while not stopping:
+            entry = self._queue.get()
+            if entry is None:
+                return
+            batch = [entry]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self._commit(batch)
+
+    def _fail_pending(self):
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if entry is not None and not entry[1].done():
+                entry[1].set_exception(RuntimeError("Group commit writer is closed"))
+
+    def _commit(self, batch: list):
+        try:
+            self._write([item for item, _ in batch])
+        except Exception as exc:  # pylint: disable=broad-except
+            if len(batch) == 1:
+                batch[0][1].set_exception(exc)
+                return
+            # find out which items failed
+            try:
+                for entry in batch:
+                    self._commit([entry])
+            except BaseException:
+                self._stop_batch(batch)
+                raise
+            return
+        except BaseException:
+            self._stop_batch(batch)
+            raise
+        for _, future in batch:
+            future.set_result(None)
+
+    @staticmethod
+    def _stop_batch(batch: list):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(RuntimeError("Group commit writer stopped"))
+
+
+class _ThreadConnection:
+    """Connection of a thread, closed once the thread exits"""
+
+    __slots__ = ("connection", "__weakref__")
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+
+def _release_connection(
+    connection: sqlite3.Connection,
+    connections: Set[sqlite3.Connection],
+    lock: threading.Lock,
+):
+    with lock:
+        connections.discard(connection)
+    connection.close()
+
+
+# Tuning profiles: connection pragmas trading durability for speed
+PROFILES = {
+    # survives power loss, every commit is synced
+    "durable": {"journal_mode": "WAL", "synchronous": "FULL"},
+    # survives application crash, may lose last commits on power loss
+    "balanced": {"journal_mode": "WAL", "synchronous": "NORMAL"},
+    # no syncing at all, may corrupt the database on power loss
+    "fast": {"journal_mode": "WAL", "synchronous": "OFF"},
+}
+
+
 class SQLiteRepository(Repository):
+    """Message Bus repository using SQLite database
+
+    File databases use one connection per thread, closed when the thread
+    exits. In-memory database uses a single connection shared between
+    threads.
+
+    Connection pragmas are set by tuning `profile` (see `PROFILES`).
+    `journal_mode` and `synchronous` override the profile. Without profile
+    and overrides SQLite defaults are used.
+
+    Messages are claimed in order of descending priority and delivery time
+    (`not_before`), which is the posting time unless delivery is delayed.
+    Delayed and retried messages are flagged `delayed` and kept out of the
+    claim indexes until they are due, so polling does not walk messages
+    which are not due yet.
+
+    :meth:`iter_select` fetches claimed messages `fetch_chunk_size` rows at
+    a time.
+
+    With `write_behind` single inserts are handed to a `GroupCommitWriter`
+    and committed together with inserts from other threads.
+
+    Claiming a message counts an attempt. Failed messages are retried
+    according to `retry_policy` and moved to the dead letter table once
+    their attempts are exhausted, also when their lease expires.
+
+    Lock ids of claims are remembered per thread until the claimed
+    messages are deleted, failed or released. Extending leases, failing
+    and releasing messages claimed by the current thread affect only that
+    claim, so a consumer whose lease expired cannot change the claim of
+    another consumer. Messages claimed by other threads or processes are
+    matched by id.
+    """
+
     queue_table_name: str = "queue_item"
     lock_table_name: str = "queue_item_lock"
+    dead_table_name: str = "queue_item_dead"
 
-    def __init__(self, db_name: str = None, mapper: Mapper = None):
+    def __init__(
+        self,
+        db_name: str = None,
+        mapper: Mapper = None,
+        insert_chunk_size: int = 1000,
+        fetch_chunk_size: int = 500,
+        lease_duration: float = 300,
+        profile: str = None,
+        journal_mode: str = None,
+        synchronous: str = None,
+        busy_timeout: float = 5.0,
+        write_behind: bool = False,
+        group_commit_size: int = 1000,
+        group_commit_interval: float = 0.005,
+        retry_policy: RetryPolicy = None,
+    ):
         mapper = mapper or TranscodingMapper(JSONTranscoder())
-        super().__init__(mapper)
+        super().__init__(mapper, retry_policy)
         self.db_name = db_name or ":memory:"
-        self.queue_insert_statement = f"INSERT INTO {self.queue_table_name} (message_id, posted_at, topic, state) VALUES (?,?,?,?)"
-        self.queue_select_statement = f"SELECT * FROM {self.queue_table_name} WHERE message_id IN (SELECT message_id FROM {self.lock_table_name} WHERE lock_id=?) ORDER BY posted_at ASC"
-        self.connection = sqlite3.connect(
+        self.insert_chunk_size = insert_chunk_size
+        self.fetch_chunk_size = fetch_chunk_size
+        self.lease_duration = lease_duration
+        if profile is not None and profile not in PROFILES:
+            raise ValueError(f"Unknown profile: {profile}")
+        self.pragmas = dict(PROFILES.get(profile, {}))
+        if journal_mode:
+            self.pragmas["journal_mode"] = journal_mode
+        if synchronous:
+            self.pragmas["synchronous"] = synchronous
+        self.busy_timeout = busy_timeout
+        self.queue_insert_statement = f"INSERT INTO {self.queue_table_name} (message_id, posted_at, topic, state, priority, not_before, delayed) VALUES (?,?,?,?,?,?,?)"
+        self.queue_claim_statement = f"UPDATE {self.queue_table_name} SET lock_id=?, attempts=attempts+1 WHERE message_id IN (SELECT message_id FROM {self.queue_table_name} WHERE lock_id IS NULL AND delayed=0 AND not_before<=? ORDER BY priority DESC, not_before ASC LIMIT ?)"
+        self.queue_promote_statement = f"UPDATE {self.queue_table_name} SET delayed=0 WHERE delayed=1 AND not_before<=?"
+        self.lock_insert_statement = f"INSERT INTO {self.lock_table_name} (lock_id, message_id, locked_at, expires_at) SELECT lock_id, message_id, ?, ? FROM {self.queue_table_name} WHERE lock_id=?"
+        self.queue_reclaim_statement = f"UPDATE {self.queue_table_name} SET lock_id=NULL WHERE message_id IN (SELECT message_id FROM {self.lock_table_name} WHERE expires_at<?)"
+        self.lock_expire_statement = f"DELETE FROM {self.lock_table_name} WHERE expires_at<?"
+        expired_exhausted = f"attempts>=? AND message_id IN (SELECT message_id FROM {self.lock_table_name} WHERE expires_at<?)"
+        self.dead_expired_statement = f"INSERT INTO {self.dead_table_name} (message_id, posted_at, topic, state, priority, attempts, failed_at, error) SELECT message_id, posted_at, topic, state, priority, attempts, ?, 'Lease expired' FROM {self.queue_table_name} WHERE {expired_exhausted}"
+        self.queue_expired_delete_statement = f"DELETE FROM {self.queue_table_name} WHERE {expired_exhausted}"
+        self.dead_insert_statement = f"INSERT INTO {self.dead_table_name} (message_id, posted_at, topic, state, priority, attempts, failed_at, error) SELECT message_id, posted_at, topic, state, priority, attempts, ?, ? FROM {self.queue_table_name} WHERE message_id=?"
+        self.queue_retry_statement = f"UPDATE {self.queue_table_name} SET lock_id=NULL, not_before=?, delayed=1 WHERE message_id=?"
+        self.queue_release_statement = f"UPDATE {self.queue_table_name} SET lock_id=NULL, attempts=attempts-1 WHERE message_id=? AND lock_id=COALESCE(?, lock_id)"
+        self.queue_release_after_statement = f"UPDATE {self.queue_table_name} SET lock_id=NULL, attempts=attempts-1, not_before=COALESCE((SELECT not_before FROM {self.queue_table_name} WHERE message_id=? AND lock_id IS NULL), not_before), delayed=1 WHERE message_id=? AND lock_id=COALESCE(?, lock_id)"
+        self.queue_redrive_statement = f"INSERT INTO {self.queue_table_name} (message_id, posted_at, topic, state, priority, not_before) SELECT message_id, posted_at, topic, state, priority, ? FROM {self.dead_table_name}"
+        self.queue_select_statement = f"SELECT message_id, posted_at, topic, state FROM {self.queue_table_name} WHERE lock_id=? ORDER BY priority DESC, not_before ASC"
+        self.queue_select_rowid_statement = f"SELECT rowid FROM {self.queue_table_name} WHERE lock_id=? ORDER BY priority DESC, not_before ASC"
+        self._topic_claim_statements = {}
+        self._connections: Set[sqlite3.Connection] = set()
+        self._connections_lock = threading.Lock()
+        self._local = threading.local()
+        self._shared_connection = None
+        self._lock = nullcontext()
+        if self.db_name == ":memory:":
+            # every connection to ":memory:" opens a new database
+            self._shared_connection = self._connect()
+            self._lock = threading.RLock()
+        self.writer = None
+        if write_behind:
+            self.writer = GroupCommitWriter(
+                self._write_rows, group_commit_size, group_commit_interval
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
             self.db_name,
+            timeout=self.busy_timeout,
             check_same_thread=False,
             detect_types=sqlite3.PARSE_DECLTYPES
             | sqlite3.PARSE_COLNAMES,  # required for "native" date/time conversion
         )
+        for name, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {name}={value}")
+        with self._connections_lock:
+            self._connections.add(connection)
+        return connection
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Database connection for the current thread"""
+        if self._shared_connection:
+            return self._shared_connection
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            # thread-local data is dropped when the thread exits, which
+            # closes the connection of a short-lived thread
+            connection = self._connect()
+            holder = _ThreadConnection(connection)
+            weakref.finalize(
+                holder,
+                _release_connection,
+                connection,
+                self._connections,
+                self._connections_lock,
+            )
+            self._local.holder = holder
+        return holder.connection
+
+    @property
+    def _claims(self) -> Dict[str, str]:
+        """Lock ids of messages claimed by the current thread"""
+        claims = getattr(self._local, "claims", None)
+        if claims is None:
+            claims = self._local.claims = {}
+        return claims
+
+    def _lock_ids(self, message_ids: List[str], forget: bool = False) -> List[tuple]:
+        """Pairs of message id and lock id of the current thread's claim or None"""
+        claims = self._claims
+        pairs = [(message_id, claims.get(message_id)) for message_id in message_ids]
+        if forget:
+            for message_id in message_ids:
+                claims.pop(message_id, None)
+        return pairs
+
+    def close(self):
+        """Close all connections opened by the repository"""
+        if self.writer:
+            self.writer.close()
+        with self._connections_lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+        self._shared_connection = None
 
     @contextmanager
     def transaction(self):
         """Unit of work/transaction"""
-        cursor = self.connection.cursor()
-        yield cursor
-        self.connection.commit()
+        # in-memory database connection is shared between threads
+        with self._lock:
+            cursor = self.connection.cursor()
+            try:
+                yield cursor
+            except BaseException:
+                self.connection.rollback()
+                raise
+            self.connection.commit()
 
     def table_exists(self, table_name):
         """Returns True if table exists and Flase otherwise"""
@@ -54,6 +369,22 @@ class SQLiteRepository(Repository):
             trans.execute(f"SELECT COUNT(*) FROM {table_name}")
             return trans.fetchone()[0]
 
+    def _upgrade_table(self, trans, table_name, columns) -> List[str]:
+        """Add columns missing in a table created by an older version.
+
+        Returns names of added columns.
+        """
+        trans.execute(f"PRAGMA table_info({table_name})")
+        existing = {row[1] for row in trans.fetchall()}
+        added = []
+        for column_name, column_type in columns:
+            if column_name not in existing:
+                trans.execute(
+                    f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"
+                )
+                added.append(column_name)
+        return added
+
     def initialize(self):
         with self.transaction() as trans:
             create_queue_table_sql = (
@@ -63,6 +394,11 @@ class SQLiteRepository(Repository):
                 "posted_at timestamp, "
                 "topic TEXT, "
                 "state BLOB, "
+                "lock_id TEXT, "
+                "priority INTEGER NOT NULL DEFAULT 0, "
+                "not_before timestamp, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "delayed INTEGER NOT NULL DEFAULT 0, "
                 "PRIMARY KEY "
                 "(message_id))"
             )
@@ -72,36 +408,268 @@ class SQLiteRepository(Repository):
                 "        message_id TEXT, "
                 "        lock_id TExT, "
                 "        locked_at timestamp, "
+                "        expires_at timestamp, "
                 "        PRIMARY KEY "
                 "            (lock_id, message_id))"
             )
 
+            create_dead_table_sql = (
+                "CREATE TABLE IF NOT EXISTS "
+                f"{self.dead_table_name} ("
+                "message_id TEXT, "
+                "posted_at timestamp, "
+                "topic TEXT, "
+                "state BLOB, "
+                "priority INTEGER, "
+                "attempts INTEGER, "
+                "failed_at timestamp, "
+                "error TEXT, "
+                "PRIMARY KEY "
+                "(message_id))"
+            )
+
             trans.execute(create_queue_table_sql)
             trans.execute(create_lock_table_sql)
+            trans.execute(create_dead_table_sql)
+            queue_upgrade = self._upgrade_table(
+                trans,
+                self.queue_table_name,
+                [
+                    ("lock_id", "TEXT"),
+                    ("priority", "INTEGER NOT NULL DEFAULT 0"),
+                    ("not_before", "timestamp"),
+                    ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+                    ("delayed", "INTEGER NOT NULL DEFAULT 0"),
+                ],
+            )
+            lock_upgrade = self._upgrade_table(
+                trans, self.lock_table_name, [("expires_at", "timestamp")]
+            )
+            if "lock_id" in queue_upgrade:
+                # tables created before claims were tracked in the queue table
+                trans.execute(
+                    f"UPDATE {self.queue_table_name} SET lock_id = ("
+                    f"SELECT lock_id FROM {self.lock_table_name} "
+                    f"WHERE {self.lock_table_name}.message_id = {self.queue_table_name}.message_id)"
+                )
+            if "not_before" in queue_upgrade:
+                trans.execute(
+                    f"UPDATE {self.queue_table_name} SET not_before=posted_at"
+                )
+            if "expires_at" in lock_upgrade:
+                trans.execute(
+                    f"UPDATE {self.lock_table_name} SET expires_at=?",
+                    [self._lease_deadline(datetime.utcnow())],
+                )
+            if "delayed" in queue_upgrade:
+                trans.execute(
+                    f"UPDATE {self.queue_table_name} SET delayed=1 WHERE not_before>?",
+                    [datetime.utcnow()],
+                )
+            # replaced by the due indexes
+            for index in ("ready", "topic", "schedule", "topic_schedule"):
+                trans.execute(
+                    f"DROP INDEX IF EXISTS {self.queue_table_name}_{index}_idx"
+                )
+            # unclaimed due messages in delivery order
+            trans.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.queue_table_name}_due_idx "
+                f"ON {self.queue_table_name} (priority DESC, not_before) "
+                "WHERE lock_id IS NULL AND delayed=0"
+            )
+            # unclaimed due messages of a topic in delivery order
+            trans.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.queue_table_name}_topic_due_idx "
+                f"ON {self.queue_table_name} (topic, priority DESC, not_before) "
+                "WHERE lock_id IS NULL AND delayed=0"
+            )
+            # delayed messages in delivery order
+            trans.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.queue_table_name}_delayed_idx "
+                f"ON {self.queue_table_name} (not_before) WHERE delayed=1"
+            )
+            trans.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.queue_table_name}_lock_idx "
+                f"ON {self.queue_table_name} (lock_id) WHERE lock_id IS NOT NULL"
+            )
+            trans.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.lock_table_name}_message_idx "
+                f"ON {self.lock_table_name} (message_id)"
+            )
+            trans.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.lock_table_name}_expires_idx "
+                f"ON {self.lock_table_name} (expires_at)"
+            )
+            trans.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.dead_table_name}_failed_idx "
+                f"ON {self.dead_table_name} (failed_at)"
+            )
 
-    def _insert(self, item: StoredMessage):
-        with self.transaction() as curs:
-            params = [item.message_id, item.posted_at, item.topic, item.state]
-            curs.execute(self.queue_insert_statement, params)
+    def topic_claim_statement(self, topic_count: int) -> str:
+        """Claim statement for messages of `topic_count` topics.
 
-    def _select(self, batch_limit: int = None) -> List[StoredMessage]:
-        lock_id = uuid4().hex
-        lock_sql = (
-            f"INSERT INTO {self.lock_table_name} (lock_id, message_id, locked_at) \n"
-            f"        SELECT ?, message_id, ? FROM {self.queue_table_name} \n"
-            f"         WHERE message_id NOT IN (SELECT message_id FROM {self.lock_table_name}) \n"
-            f"         ORDER BY posted_at ASC \n"
-            f"         LIMIT ?"
+        Parameters are lock id, then topic, current time and batch limit for
+        every topic, then batch limit. Every topic is read from the topic index up to the
+        batch limit, so claiming never scans other topics or sorts more than
+        `topic_count` batches.
+        """
+        statement = self._topic_claim_statements.get(topic_count)
+        if statement is None:
+            topic_select = (
+                f"SELECT message_id, priority, not_before FROM {self.queue_table_name} "
+                "WHERE lock_id IS NULL AND delayed=0 AND topic=? AND not_before<=? "
+                "ORDER BY priority DESC, not_before ASC LIMIT ?"
+            )
+            candidates = " UNION ALL ".join(
+                [f"SELECT * FROM ({topic_select})"] * topic_count
+            )
+            statement = (
+                f"UPDATE {self.queue_table_name} SET lock_id=?, attempts=attempts+1 "
+                "WHERE message_id IN ("
+                f"SELECT message_id FROM ({candidates}) "
+                "ORDER BY priority DESC, not_before ASC LIMIT ?)"
+            )
+            self._topic_claim_statements[topic_count] = statement
+        return statement
+
+    def _lease_deadline(self, now: datetime, duration: float = None) -> datetime:
+        if duration is None:
+            duration = self.lease_duration
+        return now + timedelta(seconds=duration)
+
+    def submit(self, item: Any, priority: int = 0, delay: float = None) -> Future:
+        """Insert item into the repository, return future resolved once committed"""
+        row = self._row(self.mapper.encode(item), priority, delay)
+        if self.writer:
+            return self.writer.submit(row)
+        future = Future()
+        try:
+            self._write_rows([row])
+        except Exception as exc:  # pylint: disable=broad-except
+            future.set_exception(exc)
+        else:
+            future.set_result(None)
+        return future
+
+    @staticmethod
+    def _row(item: StoredMessage, priority: int = 0, delay: float = None) -> tuple:
+        """Insert statement parameters"""
+        if delay:
+            not_before = datetime.utcnow() + timedelta(seconds=delay)
+        else:
+            not_before = item.posted_at or datetime.utcnow()
+        return (
+            item.message_id,
+            item.posted_at,
+            item.topic,
+            item.state,
+            priority,
+            not_before,
+            1 if delay else 0,
         )
-        batch_limit = batch_limit or 1
+
+    def _write_rows(self, rows: List[tuple]):
         with self.transaction() as curs:
-            curs.execute(lock_sql, [lock_id, datetime.utcnow(), batch_limit])
+            curs.executemany(self.queue_insert_statement, rows)
+
+    def _insert(self, item: StoredMessage, priority: int = 0, delay: float = None):
+        row = self._row(item, priority, delay)
+        if self.writer:
+            # block until the group is committed
+            self.writer.submit(row).result()
+            return
         with self.transaction() as curs:
+            curs.execute(self.queue_insert_statement, row)
+
+    def _insert_many(
+        self, items: Iterable[StoredMessage], priority: int = 0, delay: float = None
+    ):
+        # one executemany and one commit per chunk
+        for chunk in _chunked(items, self.insert_chunk_size):
+            self._write_rows([self._row(item, priority, delay) for item in chunk])
+
+    def _claim(self, curs, lock_id: str, batch_limit: int, topics: List[str]):
+        """Reclaim expired leases, promote due delayed messages, claim and record a batch"""
+        now = datetime.utcnow()
+        self._expire_leases(curs, now)
+        curs.execute(self.queue_promote_statement, [now])
+        if topics is None:
+            curs.execute(self.queue_claim_statement, [lock_id, now, batch_limit or 1])
+        else:
             params = [lock_id]
-            curs.execute(self.queue_select_statement, params)
-            return [CursorFactory.as_message(curs, row) for row in curs.fetchall()]
+            for topic in topics:
+                params += [topic, now, batch_limit or 1]
+            params.append(batch_limit or 1)
+            curs.execute(self.topic_claim_statement(len(topics)), params)
+        curs.execute(
+            self.lock_insert_statement, [now, self._lease_deadline(now), lock_id]
+        )
+
+    def _select(
+        self, batch_limit: int = None, topics: List[str] = None
+    ) -> List[StoredMessage]:
+        if topics is not None:
+            topics = list(dict.fromkeys(topics))
+            if not topics:
+                return []
+        lock_id = uuid4().hex
+        # claim and fetch the batch in a single transaction
+        with self.transaction() as curs:
+            self._claim(curs, lock_id, batch_limit, topics)
+            curs.execute(self.queue_select_statement, [lock_id])
+            items = CursorFactory.as_messages(curs, curs.fetchall())
+        claims = self._claims
+        for item in items:
+            claims[item.message_id] = lock_id
+        return items
+
+    def _iter_select(
+        self, batch_limit: int = None, topics: List[str] = None
+    ) -> Iterator[StoredMessage]:
+        if topics is not None:
+            topics = list(dict.fromkeys(topics))
+            if not topics:
+                return iter(())
+        lock_id = uuid4().hex
+        rowids = array("q")
+        with self.transaction() as curs:
+            self._claim(curs, lock_id, batch_limit, topics)
+            curs.execute(self.queue_select_rowid_statement, [lock_id])
+            while True:
+                rows = curs.fetchmany(self.fetch_chunk_size)
+                if not rows:
+                    break
+                rowids.extend(row[0] for row in rows)
+        return self._fetch_claimed(lock_id, rowids)
+
+    def _fetch_claimed(
+        self, lock_id: str, rowids: Iterable[int]
+    ) -> Iterator[StoredMessage]:
+        """Fetch claimed rows in chunks, in order of given row ids.
+
+        Every chunk is read by a short transaction, so no read transaction is
+        left open while the caller processes messages.
+        """
+        for chunk in _chunked(rowids, self.fetch_chunk_size):
+            placeholders = ",".join("?" * len(chunk))
+            with self.transaction() as curs:
+                curs.execute(
+                    "SELECT rowid, message_id, posted_at, topic, state "
+                    f"FROM {self.queue_table_name} "
+                    f"WHERE lock_id=? AND rowid IN ({placeholders})",
+                    [lock_id, *chunk],
+                )
+                rows = {row[0]: row[1:] for row in curs.fetchall()}
+            claims = self._claims
+            for rowid in chunk:
+                row = rows.get(rowid)
+                # skip rows deleted since they were claimed
+                if row is not None:
+                    claims[row[0]] = lock_id
+                    yield StoredMessage(*row)
 
     def _delete(self, item: StoredMessage):
+        self._claims.pop(item.message_id, None)
         with self.transaction() as curs:
             curs.execute(
                 f"DELETE FROM {self.lock_table_name} WHERE message_id=?",
@@ -111,3 +679,126 @@ class SQLiteRepository(Repository):
                 f"DELETE FROM {self.queue_table_name} WHERE message_id=?",
                 [item.message_id],
             )
+
+    def _delete_many(self, message_ids: List[str]):
+        if not message_ids:
+            return
+        claims = self._claims
+        for message_id in message_ids:
+            claims.pop(message_id, None)
+        params = [(message_id,) for message_id in message_ids]
+        with self.transaction() as curs:
+            curs.executemany(
+                f"DELETE FROM {self.lock_table_name} WHERE message_id=?", params
+            )
+            curs.executemany(
+                f"DELETE FROM {self.queue_table_name} WHERE message_id=?", params
+            )
+
+    def _extend_lease(self, message_ids: List[str], duration: float = None):
+        if not message_ids:
+            return
+        expires_at = self._lease_deadline(datetime.utcnow(), duration)
+        with self.transaction() as curs:
+            curs.executemany(
+                f"UPDATE {self.lock_table_name} SET expires_at=? "
+                "WHERE message_id=? AND lock_id=COALESCE(?, lock_id)",
+                [(expires_at, *claim) for claim in self._lock_ids(message_ids)],
+            )
+
+    def _release(self, message_ids: List[str], after: str = None):
+        if not message_ids:
+            return
+        params = self._lock_ids(message_ids, forget=True)
+        with self.transaction() as curs:
+            if after is None:
+                curs.executemany(self.queue_release_statement, params)
+            else:
+                # same not_before as `after`, rowid order puts them after it
+                curs.executemany(
+                    self.queue_release_after_statement,
+                    [(after, *claim) for claim in params],
+                )
+            curs.executemany(
+                f"DELETE FROM {self.lock_table_name} "
+                "WHERE message_id=? AND lock_id=COALESCE(?, lock_id)",
+                params,
+            )
+
+    def _expire_leases(self, curs, now: datetime) -> int:
+        """Return items with expired leases to the queue or to dead letters"""
+        params = [self.retry_policy.max_attempts, now]
+        curs.execute(self.dead_expired_statement, [now] + params)
+        curs.execute(self.queue_expired_delete_statement, params)
+        curs.execute(self.queue_reclaim_statement, [now])
+        curs.execute(self.lock_expire_statement, [now])
+        return curs.rowcount
+
+    def _reclaim_expired(self) -> int:
+        now = datetime.utcnow()
+        with self.transaction() as curs:
+            return self._expire_leases(curs, now)
+
+    def _fail(self, message_ids: List[str], error: str = None):
+        if not message_ids:
+            return
+        now = datetime.utcnow()
+        policy = self.retry_policy
+        lock_ids = dict(self._lock_ids(message_ids, forget=True))
+        with self.transaction() as curs:
+            attempts = {}
+            for chunk in _chunked(message_ids, 500):
+                placeholders = ",".join("?" * len(chunk))
+                curs.execute(
+                    f"SELECT message_id, attempts, lock_id FROM {self.queue_table_name} "
+                    f"WHERE lock_id IS NOT NULL AND message_id IN ({placeholders})",
+                    chunk,
+                )
+                for message_id, count, lock_id in curs.fetchall():
+                    # skip messages claimed again since this thread claimed them
+                    if lock_ids[message_id] in (None, lock_id):
+                        attempts[message_id] = count
+            dead = []
+            retry = []
+            for message_id, count in attempts.items():
+                if policy.exhausted(count):
+                    dead.append((now, error, message_id))
+                else:
+                    not_before = now + timedelta(seconds=policy.delay(count))
+                    retry.append((not_before, message_id))
+            curs.executemany(self.dead_insert_statement, dead)
+            curs.executemany(
+                f"DELETE FROM {self.queue_table_name} WHERE message_id=?",
+                [(message_id,) for _, _, message_id in dead],
+            )
+            curs.executemany(self.queue_retry_statement, retry)
+            curs.executemany(
+                f"DELETE FROM {self.lock_table_name} WHERE message_id=?",
+                [(message_id,) for message_id in attempts],
+            )
+
+    def _redrive(self, message_ids: List[str] = None) -> int:
+        now = datetime.utcnow()
+        with self.transaction() as curs:
+            if message_ids is None:
+                curs.execute(self.queue_redrive_statement, [now])
+                curs.execute(f"DELETE FROM {self.dead_table_name}")
+                return curs.rowcount
+            params = [(message_id,) for message_id in message_ids]
+            curs.executemany(
+                f"{self.queue_redrive_statement} WHERE message_id=?",
+                [(now, message_id) for message_id in message_ids],
+            )
+            curs.executemany(
+                f"DELETE FROM {self.dead_table_name} WHERE message_id=?", params
+            )
+            return curs.rowcount
+
+    def _select_dead(self, batch_limit: int = None) -> List[StoredMessage]:
+        with self.transaction() as curs:
+            curs.execute(
+                f"SELECT message_id, posted_at, topic, state FROM {self.dead_table_name} "
+                "ORDER BY failed_at ASC, posted_at ASC LIMIT ?",
+                [batch_limit or -1],
+            )
+            return CursorFactory.as_messages(curs, curs.fetchall())
@@ -0,0 +1,327 @@
+"""Compact binary transcoder"""
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import struct
+from typing import Any, Callable, Dict
+from uuid import UUID
+
+from .transcode import AbstractTranscoder
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+MAGIC = 0xB1
+VERSION_NATIVE = 1
+VERSION_MSGPACK = 2
+
+NONE = 0x00
+FALSE = 0x01
+TRUE = 0x02
+INT = 0x03
+FLOAT = 0x04
+STR = 0x05
+BYTES = 0x06
+LIST = 0x07
+DICT = 0x08
+UUID_BYTES = 0x09
+DECIMAL = 0x0A
+DECIMAL_STR = 0x0B
+DATETIME = 0x0C
+DATETIME_TZ = 0x0D
+
+EXT_UUID = 1
+EXT_DECIMAL = 2
+EXT_DATETIME = 3
+EXT_DATETIME_TZ = 4
+EXT_INT = 5
+
+EPOCH = datetime(1970, 1, 1)
+DOUBLE = struct.Struct(">d")
+MICROSECONDS = struct.Struct(">q")
+MICROSECONDS_TZ = struct.Struct(">qq")
+
+
+def _micros(delta: timedelta) -> int:
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def _write_varint(buffer: bytearray, value: int):
+    while value > 0x7F:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _write_zigzag(buffer: bytearray, value: int):
+    _write_varint(buffer, value << 1 if value >= 0 else (-value << 1) - 1)
+
+
+class BinaryTranscoder(AbstractTranscoder):
+    """Compact binary transcoder
+
+    Encodes :class:`UUID`, :class:`Decimal` and :class:`datetime` natively
+    instead of wrapping them in strings. Encoded data starts with a magic
+    byte followed by format version:
+
+    * version 1 - built-in pure-Python format
+    * version 2 - MessagePack with extension types, used if `use_msgpack`
+      is True, requires ``msgpack``
+
+    Both versions are decoded regardless of `use_msgpack`, version 2 only
+    if ``msgpack`` is installed.
+
+    Data without the magic byte, e.g. rows stored by :class:`JSONTranscoder`,
+    is decoded by the `fallback` transcoder.
+    """
+
+    def __init__(self, fallback: AbstractTranscoder = None, use_msgpack: bool = False):
+        if use_msgpack and msgpack is None:
+            raise ImportError("msgpack is required to use MessagePack format")
+        self.fallback = fallback
+        self.use_msgpack = use_msgpack
+        self._writers: Dict[type, Callable[[bytearray, Any], None]] = {
+            type(None): self._write_none,
+            bool: self._write_bool,
+            int: self._write_int,
+            float: self._write_float,
+            str: self._write_str,
+            bytes: self._write_bytes,
+            bytearray: self._write_bytes,
+            list: self._write_list,
+            tuple: self._write_list,
+            dict: self._write_dict,
+            UUID: self._write_uuid,
+            Decimal: self._write_decimal,
+            datetime: self._write_datetime,
+        }
+
+    def encode(self, obj: Any) -> bytes:
+        if self.use_msgpack:
+            return bytes((MAGIC, VERSION_MSGPACK)) + msgpack.packb(
+                obj, default=self._pack_ext, use_bin_type=True
+            )
+        buffer = bytearray((MAGIC, VERSION_NATIVE))
+        self._write(buffer, obj)
+        return bytes(buffer)
+
+    def decode(self, data: bytes) -> Any:
+        if len(data) < 2 or data[0] != MAGIC:
+            if self.fallback is None:
+                raise ValueError("Data is not encoded by BinaryTranscoder")
+            return self.fallback.decode(data)
+        version = data[1]
+        if version == VERSION_NATIVE:
+            value, _ = self._read(memoryview(data), 2)
+            return value
+        if version == VERSION_MSGPACK:
+            if msgpack is None:
+                raise ValueError("msgpack is required to decode this data")
+            return msgpack.unpackb(
+                memoryview(data)[2:],
+                ext_hook=self._unpack_ext,
+                raw=False,
+                strict_map_key=False,
+            )
+        raise ValueError(f"Unsupported binary format version: {version}")
+
+    # built-in format writers
+
+    def _write(self, buffer: bytearray, obj: Any):
+        writer = self._writers.get(type(obj))
+        if writer is None:
+            # subclasses of supported types, e.g. enum.IntEnum
+            for cls, writer in self._writers.items():
+                if isinstance(obj, cls):
+                    break
+            else:
+                raise TypeError(
+                    f"Object of type {obj.__class__.__name__} is not serializable"
+                )
+        writer(buffer, obj)
+
+    def _write_none(self, buffer: bytearray, _: None):
+        buffer.append(NONE)
+
+    def _write_bool(self, buffer: bytearray, obj: bool):
+        buffer.append(TRUE if obj else FALSE)
+
+    def _write_int(self, buffer: bytearray, obj: int):
+        buffer.append(INT)
+        _write_zigzag(buffer, obj)
+
+    def _write_float(self, buffer: bytearray, obj: float):
+        buffer.append(FLOAT)
+        buffer += DOUBLE.pack(obj)
+
+    def _write_str(self, buffer: bytearray, obj: str):
+        data = obj.encode("utf8")
+        buffer.append(STR)
+        _write_varint(buffer, len(data))
+        buffer += data
+
+    def _write_bytes(self, buffer: bytearray, obj: bytes):
+        buffer.append(BYTES)
+        _write_varint(buffer, len(obj))
+        buffer += obj
+
+    def _write_list(self, buffer: bytearray, obj: list):
+        buffer.append(LIST)
+        _write_varint(buffer, len(obj))
+        for item in obj:
+            self._write(buffer, item)
+
+    def _write_dict(self, buffer: bytearray, obj: dict):
+        buffer.append(DICT)
+        _write_varint(buffer, len(obj))
+        for key, value in obj.items():
+            self._write(buffer, key)
+            self._write(buffer, value)
+
+    def _write_uuid(self, buffer: bytearray, obj: UUID):
+        buffer.append(UUID_BYTES)
+        buffer += obj.bytes
+
+    def _write_decimal(self, buffer: bytearray, obj: Decimal):
+        sign, digits, exponent = obj.as_tuple()
+        if not isinstance(exponent, int):
+            # NaN and Infinity
+            data = str(obj).encode("ascii")
+            buffer.append(DECIMAL_STR)
+            _write_varint(buffer, len(data))
+            buffer += data
+            return
+        coefficient = 0
+        for digit in digits:
+            coefficient = coefficient * 10 + digit
+        buffer.append(DECIMAL)
+        buffer.append(sign)
+        _write_varint(buffer, coefficient)
+        _write_zigzag(buffer, exponent)
+
+    def _write_datetime(self, buffer: bytearray, obj: datetime):
+        offset = obj.utcoffset()
+        if offset is None:
+            buffer.append(DATETIME)
+            _write_zigzag(buffer, _micros(obj - EPOCH))
+            return
+        buffer.append(DATETIME_TZ)
+        _write_zigzag(buffer, _micros(obj.replace(tzinfo=None) - EPOCH))
+        _write_zigzag(buffer, _micros(offset))
+
+    # built-in format reader
+
+    def _read(self, data: memoryview, pos: int):
+        # pylint: disable=too-many-return-statements,too-many-branches
+        tag = data[pos]
+        pos += 1
+        if tag == STR:
+            size, pos = self._read_varint(data, pos)
+            return str(data[pos : pos + size], "utf8"), pos + size
+        if tag == INT:
+            return self._read_zigzag(data, pos)
+        if tag == DICT:
+            count, pos = self._read_varint(data, pos)
+            result = {}
+            for _ in range(count):
+                key, pos = self._read(data, pos)
+                result[key], pos = self._read(data, pos)
+            return result, pos
+        if tag == LIST:
+            count, pos = self._read_varint(data, pos)
+            result = []
+            for _ in range(count):
+                item, pos = self._read(data, pos)
+                result.append(item)
+            return result, pos
+        if tag == NONE:
+            return None, pos
+        if tag == TRUE:
+            return True, pos
+        if tag == FALSE:
+            return False, pos
+        if tag == FLOAT:
+            return DOUBLE.unpack_from(data, pos)[0], pos + DOUBLE.size
+        if tag == BYTES:
+            size, pos = self._read_varint(data, pos)
+            return bytes(data[pos : pos + size]), pos + size
+        if tag == UUID_BYTES:
+            return UUID(bytes=bytes(data[pos : pos + 16])), pos + 16
+        if tag == DECIMAL:
+            sign = data[pos]
+            coefficient, pos = self._read_varint(data, pos + 1)
+            exponent, pos = self._read_zigzag(data, pos)
+            digits = tuple(int(digit) for digit in str(coefficient))
+            return Decimal((sign, digits, exponent)), pos
+        if tag == DECIMAL_STR:
+            size, pos = self._read_varint(data, pos)
+            return Decimal(str(data[pos : pos + size], "ascii")), pos + size
+        if tag == DATETIME:
+            micros, pos = self._read_zigzag(data, pos)
+            return EPOCH + timedelta(microseconds=micros), pos
+        if tag == DATETIME_TZ:
+            micros, pos = self._read_zigzag(data, pos)
+            offset, pos = self._read_zigzag(data, pos)
+            tzinfo = timezone(timedelta(microseconds=offset))
+            return (EPOCH + timedelta(microseconds=micros)).replace(tzinfo=tzinfo), pos
+        raise ValueError(f"Unknown type tag: {tag:#x}")
+
+    @staticmethod
+    def _read_varint(data: memoryview, pos: int):
+        result = 0
+        shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result, pos
+            shift += 7
+
+    def _read_zigzag(self, data: memoryview, pos: int):
+        value, pos = self._read_varint(data, pos)
+        return (value >> 1) ^ -(value & 1), pos
+
+    # MessagePack extension types
+
+    @staticmethod
+    def _pack_ext(obj: Any) -> Any:
+        if isinstance(obj, int):
+            # integers which do not fit into 64 bits
+            return msgpack.ExtType(
+                EXT_INT, obj.to_bytes(obj.bit_length() // 8 + 1, "big", signed=True)
+            )
+        if isinstance(obj, UUID):
+            return msgpack.ExtType(EXT_UUID, obj.bytes)
+        if isinstance(obj, Decimal):
+            return msgpack.ExtType(EXT_DECIMAL, str(obj).encode("ascii"))
+        if isinstance(obj, datetime):
+            offset = obj.utcoffset()
+            if offset is None:
+                return msgpack.ExtType(
+                    EXT_DATETIME, MICROSECONDS.pack(_micros(obj - EPOCH))
+                )
+            return msgpack.ExtType(
+                EXT_DATETIME_TZ,
+                MICROSECONDS_TZ.pack(
+                    _micros(obj.replace(tzinfo=None) - EPOCH), _micros(offset)
+                ),
+            )
+        raise TypeError(f"Object of type {obj.__class__.__name__} is not serializable")
+
+    @staticmethod
+    def _unpack_ext(code: int, data: bytes) -> Any:
+        if code == EXT_INT:
+            return int.from_bytes(data, "big", signed=True)
+        if code == EXT_UUID:
+            return UUID(bytes=data)
+        if code == EXT_DECIMAL:
+            return Decimal(data.decode("ascii"))
+        if code == EXT_DATETIME:
+            return EPOCH + timedelta(microseconds=MICROSECONDS.unpack(data)[0])
+        if code == EXT_DATETIME_TZ:
+            micros, offset = MICROSECONDS_TZ.unpack(data)
+            tzinfo = timezone(timedelta(microseconds=offset))
+            return (EPOCH + timedelta(microseconds=micros)).replace(tzinfo=tzinfo)
+        return msgpack.ExtType(code, data)
@@ -0,0 +1,113 @@
+"""Per-class codecs converting objects to/from state dictionaries"""
+import dataclasses
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+_NO_DEFAULT = object()
+
+
+def class_fields(cls: type) -> Optional[Tuple[str, ...]]:
+    """Return field names of a dataclass, attrs or slotted class.
+
+    Returns None for other classes.
+    """
+    if dataclasses.is_dataclass(cls):
+        return tuple(field.name for field in dataclasses.fields(cls))
+    attributes = getattr(cls, "__attrs_attrs__", None)
+    if attributes is not None:
+        return tuple(attribute.name for attribute in attributes)
+    if has_instance_dict(cls):
+        return None
+    names = []
+    for base in reversed(cls.__mro__[:-1]):
+        slots = vars(base)["__slots__"]
+        for name in (slots,) if isinstance(slots, str) else slots:
+            if name not in ("__weakref__", *names):
+                names.append(name)
+    return tuple(names)
+
+
+def has_instance_dict(cls: type) -> bool:
+    """Return True if instances of the class have `__dict__`"""
+    for base in cls.__mro__[:-1]:
+        slots = vars(base).get("__slots__")
+        if slots is None:
+            return True
+        if "__dict__" in ((slots,) if isinstance(slots, str) else slots):
+            return True
+    return False
+
+
+def _dataclass_defaults(cls: type) -> Dict[str, Callable[[], Any]]:
+    if not dataclasses.is_dataclass(cls):
+        return {}
+    defaults = {}
+    for field in dataclasses.fields(cls):
+        if field.default is not dataclasses.MISSING:
+            defaults[field.name] = lambda value=field.default: value
+        elif field.default_factory is not dataclasses.MISSING:
+            defaults[field.name] = field.default_factory
+    return defaults
+
+
+class ClassCodec:
+    """Convert objects of a class to/from state dictionaries
+
+    Field names are collected once from dataclass fields, attrs attributes
+    or `__slots__`, so slotted and frozen classes are supported. Objects are
+    created without calling `__init__`. Dataclass fields missing from the
+    state, e.g. fields added after the state was stored, are set to their
+    defaults. Objects with an instance `__dict__` are converted using it,
+    so that attributes which are not fields, e.g. ones set in
+    `__post_init__`, are kept as well.
+
+    Fields listed in `exclude` are not part of the state returned by
+    :meth:`get_state`. They are expected in the state passed to
+    :meth:`create`.
+    """
+
+    def __init__(self, cls: type, exclude: Iterable[str] = ()):
+        self.cls = cls
+        self.exclude = tuple(exclude)
+        fields = class_fields(cls)
+        self.fields = fields
+        self.state_fields = None
+        self._getter = None
+        if fields is not None:
+            self.state_fields = tuple(name for name in fields if name not in self.exclude)
+            if self.state_fields:
+                self._getter = attrgetter(*self.state_fields)
+        self._defaults = tuple(
+            (name, default)
+            for name, default in _dataclass_defaults(cls).items()
+            if name not in self.exclude
+        )
+        self._has_dict = has_instance_dict(cls)
+
+    def get_state(self, obj: Any) -> Dict[str, Any]:
+        """Return object state without excluded fields"""
+        if self._has_dict:
+            state = obj.__dict__.copy()
+            for name in self.exclude:
+                state.pop(name, None)
+            return state
+        if self._getter is None:
+            return {}
+        if len(self.state_fields) == 1:
+            return {self.state_fields[0]: self._getter(obj)}
+        return dict(zip(self.state_fields, self._getter(obj)))
+
+    def create(self, state: Dict[str, Any]) -> Any:
+        """Create object from state without calling `__init__`"""
+        obj = object.__new__(self.cls)
+        for name, default in self._defaults:
+            if name not in state:
+                state[name] = default()
+        if self._has_dict:
+            obj.__dict__.update(state)
+            return obj
+        setattr_ = object.__setattr__
+        for name in self.fields:
+            if name in state:
+                setattr_(obj, name, state[name])
+        return obj
@@ -0,0 +1,136 @@
+"""Compressing transcoder stage"""
+import lzma
+import struct
+from typing import Iterable
+import zlib
+
+from .transcode import AbstractTranscoder
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+RAW = 0x00
+ZLIB = 0x01
+LZMA = 0x02
+ZSTD = 0x03
+ZLIB_DICT = 0x11
+ZSTD_DICT = 0x13
+
+ALGORITHMS = {"zlib": ZLIB, "lzma": LZMA, "zstd": ZSTD}
+CHECKSUM = struct.Struct(">I")
+
+
+def train_dictionary(samples: Iterable[bytes], size: int = 16384, algorithm: str = "zlib") -> bytes:
+    """Build a shared compression dictionary from sample messages.
+
+    For ``zstd`` the dictionary is trained by ``zstandard``. For ``zlib``
+    the most recent samples are concatenated up to `size` bytes, as zlib
+    finds matches in the end of its dictionary first.
+    """
+    samples = [bytes(sample) for sample in samples]
+    if algorithm == "zstd":
+        if zstandard is None:
+            raise ValueError("zstandard is required for zstd dictionaries")
+        return zstandard.train_dictionary(size, samples).as_bytes()
+    if algorithm != "zlib":
+        raise ValueError(f"Dictionaries are not supported for {algorithm}")
+    return b"".join(samples)[-size:]
+
+
+class CompressingTranscoder(AbstractTranscoder):
+    """Compress data encoded by the previous transcoder stage
+
+    Append it after the serializing transcoder::
+
+        mapper = TranscodingMapper(JSONTranscoder())
+        mapper.transcoders.append(CompressingTranscoder())
+
+    Encoded data starts with a header byte naming the algorithm, so rows
+    compressed with different algorithms, or stored uncompressed, decode
+    correctly. Data shorter than `threshold` bytes is stored uncompressed.
+    Data without a known header, i.e. stored before compression was
+    enabled, is returned unchanged.
+
+    A shared `dictionary` (see :func:`train_dictionary`) improves the ratio
+    of small, repetitive messages. Its checksum is stored with the data and
+    the same dictionary is required for decoding.
+    """
+
+    def __init__(
+        self,
+        algorithm: str = "zlib",
+        threshold: int = 256,
+        level: int = None,
+        dictionary: bytes = None,
+    ):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown compression algorithm: {algorithm}")
+        if algorithm == "zstd" and zstandard is None:
+            raise ValueError("zstandard is required for zstd compression")
+        if dictionary is not None and algorithm == "lzma":
+            raise ValueError("Dictionaries are not supported for lzma")
+        self.algorithm = algorithm
+        self.threshold = threshold
+        self.level = level
+        self.dictionary = dictionary
+        self._checksum = CHECKSUM.pack(zlib.adler32(dictionary)) if dictionary else b""
+
+    def encode(self, obj: bytes) -> bytes:
+        data = bytes(obj)
+        if len(data) >= self.threshold:
+            header, compressed = self._compress(data)
+            encoded = bytes((header,)) + compressed
+            if len(encoded) < len(data):
+                return encoded
+        return bytes((RAW,)) + data
+
+    def decode(self, data: bytes) -> bytes:
+        data = memoryview(data)
+        if not data:
+            return data.tobytes()
+        header = data[0]
+        if header == RAW:
+            return data[1:].tobytes()
+        if header == ZLIB:
+            return zlib.decompress(data[1:])
+        if header == LZMA:
+            return lzma.decompress(data[1:])
+        if header == ZSTD:
+            return self._zstd_decompressor().decompress(data[1:])
+        if header in (ZLIB_DICT, ZSTD_DICT):
+            if data[1:5] != self._checksum:
+                raise ValueError("Data was compressed with a different dictionary")
+            if header == ZLIB_DICT:
+                decompressor = zlib.decompressobj(zdict=self.dictionary)
+                return decompressor.decompress(data[5:]) + decompressor.flush()
+            return self._zstd_decompressor(self.dictionary).decompress(data[5:])
+        # stored before compression was enabled
+        return data.tobytes()
+
+    def _compress(self, data: bytes):
+        level = self.level
+        if self.algorithm == "zlib":
+            level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+            if self.dictionary:
+                compressor = zlib.compressobj(level, zdict=self.dictionary)
+                return ZLIB_DICT, self._checksum + compressor.compress(data) + compressor.flush()
+            return ZLIB, zlib.compress(data, level)
+        if self.algorithm == "lzma":
+            return LZMA, lzma.compress(data, preset=level)
+        kwargs = {"level": 3 if level is None else level}
+        if self.dictionary:
+            kwargs["dict_data"] = zstandard.ZstdCompressionDict(self.dictionary)
+            return ZSTD_DICT, self._checksum + zstandard.ZstdCompressor(**kwargs).compress(data)
+        return ZSTD, zstandard.ZstdCompressor(**kwargs).compress(data)
+
+    @staticmethod
+    def _zstd_decompressor(dictionary: bytes = None):
+        if zstandard is None:
+            raise ValueError("zstandard is required to decode this data")
+        if dictionary:
+            return zstandard.ZstdDecompressor(
+                dict_data=zstandard.ZstdCompressionDict(dictionary)
+            )
+        return zstandard.ZstdDecompressor()
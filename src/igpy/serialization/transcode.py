@@ -3,9 +3,14 @@ from abc import ABC, abstractmethod
 from datetime import datetime
 from decimal import Decimal
 import json
-from typing import Any, Dict, Union, cast
+from typing import Any, Callable, Dict, Union, cast
 from uuid import UUID
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
 
 class AbstractTranscoder(ABC):
     """Abstract object transcoder"""
@@ -64,6 +69,9 @@ class JSONTranscoder(AbstractTranscoder):
 
     def decode(self, data: bytes) -> Any:
         """Decode object"""
+        if isinstance(data, memoryview):
+            # e.g. zero-copy slice of a memory-mapped file
+            return self.decoder.decode(str(data, "utf8"))
         return self.decoder.decode(data.decode("utf8"))
 
     def _encode_dict(self, obj: Any) -> Dict[str, Union[str, dict]]:
@@ -86,6 +94,62 @@ class JSONTranscoder(AbstractTranscoder):
             return transcoding.decode(data[self.PAYLOAD_KEY])
         return data
 
+
+class FastJSONTranscoder(JSONTranscoder):
+    """JSON Transcoder with precompiled per-type dispatch
+
+    Output is byte-compatible with :class:`JSONTranscoder`. Type wrappers
+    are detected by dictionary size and key lookup, and data which does not
+    contain the type key is parsed without object hook at all, using
+    ``orjson`` when installed, unless `use_orjson` is False.
+    """
+
+    def __init__(self, use_orjson: bool = True):
+        super().__init__()
+        self._encoders: Dict[type, Callable[[Any], dict]] = {}
+        self._decoders: Dict[str, Callable[[Any], Any]] = {}
+        self._type_marker = json.dumps(self.TYPE_KEY).encode("utf8")
+        self._loads = orjson.loads if use_orjson and orjson else None
+        self._plain_decoder = json.JSONDecoder()
+
+    def register(self, transcoding: Transcoding):
+        super().register(transcoding)
+        type_key, payload_key = self.TYPE_KEY, self.PAYLOAD_KEY
+        name, encode = transcoding.name, transcoding.encode
+        self._encoders[transcoding.type] = lambda obj: {
+            type_key: name,
+            payload_key: encode(obj),
+        }
+        self._decoders[name] = transcoding.decode
+
+    def decode(self, data: bytes) -> Any:
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        if self._type_marker in data:
+            return self.decoder.decode(data.decode("utf8"))
+        if self._loads:
+            try:
+                return self._loads(data)
+            except orjson.JSONDecodeError:
+                # e.g. NaN and Infinity are accepted only by json module
+                pass
+        return self._plain_decoder.decode(data.decode("utf8"))
+
+    def _encode_dict(self, obj: Any) -> Dict[str, Union[str, dict]]:
+        try:
+            encode = self._encoders[type(obj)]
+        except KeyError as exc:
+            raise TypeError(
+                f"Object of type {obj.__class__.__name__} is not serializable"
+            ) from exc
+        return encode(obj)
+
+    def _decode_dict(self, data: Dict[str, Union[str, dict]]) -> Any:
+        if len(data) == 2 and self.TYPE_KEY in data and self.PAYLOAD_KEY in data:
+            return self._decoders[data[self.TYPE_KEY]](data[self.PAYLOAD_KEY])
+        return data
+
+
 class UUIDAsHex(Transcoding):
     """
     Transcoding that represents :class:`UUID` objects as hex values.
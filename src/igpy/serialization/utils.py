@@ -1,7 +1,8 @@
 """Serialization/Deserialization utils"""
 
 import importlib
-from typing import Any
+import threading
+from typing import Any, Dict
 
 
 def get_topic(cls: type) -> str:
@@ -23,3 +24,73 @@ def resolve_attr(obj: Any, path: str) -> Any:
     head, _, tail = path.partition(".")
     obj = getattr(obj, head)
     return resolve_attr(obj, tail)
+
+
+class TopicCache:
+    """Bounded cache of topic to object and class to topic lookups
+
+    When the cache is full, the oldest entry is evicted. `maxsize` of 0
+    disables caching.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._objects: Dict[str, Any] = {}
+        self._topics: Dict[Any, str] = {}
+        self._lock = threading.Lock()
+
+    def resolve_topic(self, topic: str) -> Any:
+        """Cached `resolve_topic`"""
+        try:
+            obj = self._objects[topic]
+        except KeyError:
+            self.misses += 1
+            obj = resolve_topic(topic)
+            self._store(self._objects, topic, obj)
+            return obj
+        self.hits += 1
+        return obj
+
+    def get_topic(self, cls: type) -> str:
+        """Cached `get_topic`"""
+        try:
+            topic = self._topics[cls]
+        except KeyError:
+            self.misses += 1
+            topic = get_topic(cls)
+            self._store(self._topics, cls, topic)
+            return topic
+        self.hits += 1
+        return topic
+
+    def invalidate(self, topic: str = None):
+        """Forget cached lookups for a topic or, if not given, all lookups"""
+        with self._lock:
+            if topic is None:
+                self._objects.clear()
+                self._topics.clear()
+                return
+            self._objects.pop(topic, None)
+            for cls in [cls for cls, value in self._topics.items() if value == topic]:
+                del self._topics[cls]
+
+    def stats(self) -> Dict[str, int]:
+        """Cache hit/miss counters and size"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._objects) + len(self._topics),
+        }
+
+    def _store(self, cache: dict, key: Any, value: Any):
+        if not self.maxsize:
+            return
+        with self._lock:
+            if key not in cache and len(cache) >= self.maxsize:
+                del cache[next(iter(cache))]
+            cache[key] = value
+
+
+topic_cache = TopicCache()
@@ -0,0 +1,127 @@
+Feature: Message bus repository queue
+
+
+Scenario Outline: Peek single message from the bus
+   Given initialized <backend> message bus repository
+     And message bus
+     And message 'Hello world' is placed on the message bus
+     And message 'Hello moon' is placed on the message bus
+   When message is peeked from message bus
+   Then result contains 1 items(s)
+    And message body for result #1 is 'Hello world'
+    And queue holds 2 message(s)
+    And 1 message(s) are claimed
+
+   Examples: Backends
+     | backend     |
+     | in-memory   |
+     | segment log |
+
+Scenario Outline: Peek multiple messages from the bus
+   Given initialized <backend> message bus repository
+     And message bus
+     And message 'Hello world' is placed on the message bus
+     And message 'Hello moon' is placed on the message bus
+   When 10 message(s) are peeked from message bus
+   Then result contains 2 items(s)
+    And message body for result #1 is 'Hello world'
+    And message body for result #2 is 'Hello moon'
+    And queue holds 2 message(s)
+    And 2 message(s) are claimed
+
+   Examples: Backends
+     | backend     |
+     | in-memory   |
+     | segment log |
+
+Scenario Outline: Peeked messages are not peeked again
+   Given initialized <backend> message bus repository
+     And message bus
+     And message 'Hello world' is placed on the message bus
+     And message 'Hello moon' is placed on the message bus
+   When 1 message(s) are peeked from message bus
+    And 10 message(s) are peeked from message bus
+   Then result contains 1 items(s)
+    And message body for result #1 is 'Hello moon'
+    And 2 message(s) are claimed
+
+   Examples: Backends
+     | backend     |
+     | in-memory   |
+     | segment log |
+
+Scenario Outline: Delete message from the bus
+   Given initialized <backend> message bus repository
+     And message bus
+     And message 'Hello world' is placed on the message bus
+     And message 'Hello moon' is placed on the message bus
+   When 1 message(s) are peeked from message bus
+    And 1 peeked message(s) are deleted from message bus
+   Then queue holds 1 message(s)
+    And 0 message(s) are claimed
+
+   Examples: Backends
+     | backend     |
+     | in-memory   |
+     | segment log |
+
+Scenario Outline: Put multiple messages on the bus
+   Given initialized <backend> message bus repository
+     And message bus
+     And 5 messages are placed on the message bus in bulk
+   When 10 message(s) are peeked from message bus
+   Then result contains 5 items(s)
+    And message body for result #1 is 'Message 1'
+    And message body for result #5 is 'Message 5'
+    And queue holds 5 message(s)
+
+   Examples: Backends
+     | backend     |
+     | in-memory   |
+     | segment log |
+
+Scenario Outline: Delete multiple messages from the bus
+   Given initialized <backend> message bus repository
+     And message bus
+     And 5 messages are placed on the message bus in bulk
+   When 3 message(s) are peeked from message bus
+    And peeked messages are deleted from message bus in bulk
+   Then queue holds 2 message(s)
+    And 0 message(s) are claimed
+
+   Examples: Backends
+     | backend     |
+     | in-memory   |
+     | segment log |
+
+Scenario Outline: Expired claim is returned to the bus
+   Given initialized <backend> message bus repository with 0.05 seconds lease
+     And message bus
+     And message 'Hello world' is placed on the message bus
+   When message is peeked from message bus
+    And 0.1 seconds pass
+    And message is peeked from message bus
+   Then result contains 1 items(s)
+    And message body for result #1 is 'Hello world'
+    And 1 message(s) are claimed
+
+   Examples: Backends
+     | backend     |
+     | in-memory   |
+     | segment log |
+
+Scenario Outline: Extended lease keeps the claim
+   Given initialized <backend> message bus repository with 0.05 seconds lease
+     And message bus
+     And message 'Hello world' is placed on the message bus
+   When message is peeked from message bus
+    And lease of peeked messages is extended by 10 seconds
+    And 0.1 seconds pass
+    And message is peeked from message bus
+   Then result contains 0 items(s)
+    And 1 message(s) are claimed
+
+   Examples: Backends
+     | backend     |
+     | in-memory   |
+     | segment log |
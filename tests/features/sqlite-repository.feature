@@ -30,6 +30,17 @@ Scenario: Peek multiple messages from the bus
     And table 'queue_item' contains 2 rows
     And table 'queue_item_lock' contains 2 rows
 
+Scenario: Peeked messages are not peeked again
+   Given initialized SQLite message bus repository
+     And message bus
+     And message 'Hello world' is placed on the message bus
+     And message 'Hello moon' is placed on the message bus
+   When 1 message(s) are peeked from message bus
+    And 10 message(s) are peeked from message bus
+   Then result contains 1 items(s)
+    And message body for result #1 is 'Hello moon'
+    And table 'queue_item_lock' contains 2 rows
+
 Scenario: Delete message from the bus
    Given initialized SQLite message bus repository
      And message bus
@@ -39,3 +50,44 @@ Scenario: Delete message from the bus
     And 1 peeked message(s) are deleted from message bus
    Then table 'queue_item' contains 1 rows
     And table 'queue_item_lock' contains 0 rows
+
+Scenario: Put multiple messages on the bus
+   Given initialized SQLite message bus repository
+     And message bus
+     And 5 messages are placed on the message bus in bulk
+   When 10 message(s) are peeked from message bus
+   Then result contains 5 items(s)
+    And message body for result #1 is 'Message 1'
+    And message body for result #5 is 'Message 5'
+    And table 'queue_item' contains 5 rows
+
+Scenario: Delete multiple messages from the bus
+   Given initialized SQLite message bus repository
+     And message bus
+     And 5 messages are placed on the message bus in bulk
+   When 3 message(s) are peeked from message bus
+    And peeked messages are deleted from message bus in bulk
+   Then table 'queue_item' contains 2 rows
+    And table 'queue_item_lock' contains 0 rows
+
+Scenario: Expired claim is returned to the bus
+   Given initialized SQLite message bus repository with 0.05 seconds lease
+     And message bus
+     And message 'Hello world' is placed on the message bus
+   When message is peeked from message bus
+    And 0.1 seconds pass
+    And message is peeked from message bus
+   Then result contains 1 items(s)
+    And message body for result #1 is 'Hello world'
+    And table 'queue_item_lock' contains 1 rows
+
+Scenario: Extended lease keeps the claim
+   Given initialized SQLite message bus repository with 0.05 seconds lease
+     And message bus
+     And message 'Hello world' is placed on the message bus
+   When message is peeked from message bus
+    And lease of peeked messages is extended by 10 seconds
+    And 0.1 seconds pass
+    And message is peeked from message bus
+   Then result contains 0 items(s)
+    And table 'queue_item_lock' contains 1 rows
@@ -0,0 +1,42 @@
+"""BDD steps for in-memory message bus repository"""
+# pylint: disable=missing-function-docstring
+from behave import given, then  # pylint: disable=no-name-in-module
+from igpy.messagebus.memory import MemoryRepository
+
+
+@given("initialized in-memory message bus repository")
+def given_initialized_memory_repository(ctx):
+    """Create in-memory message bus repository"""
+    ctx.repository = MemoryRepository()
+    ctx.repository.initialize()
+
+
+@given("initialized in-memory message bus repository with {lease} seconds lease")
+def given_initialized_memory_repository_with_lease(ctx, lease):
+    """Create in-memory message bus repository with given lease duration"""
+    ctx.repository = MemoryRepository(lease_duration=float(lease))
+    ctx.repository.initialize()
+
+
+@then("queue holds {expected_count} message(s)")
+def assert_number_of_queued_messages(ctx, expected_count):
+    assert (
+        "repository" in ctx
+    ), "'repository' should be added to the test context before calling this step"
+    expected_count = int(expected_count)
+    actual_count = ctx.repository.message_count()
+    assert (
+        actual_count == expected_count
+    ), f"Expected: {expected_count}, Actual: {actual_count}"
+
+
+@then("{expected_count} message(s) are claimed")
+def assert_number_of_claimed_messages(ctx, expected_count):
+    assert (
+        "repository" in ctx
+    ), "'repository' should be added to the test context before calling this step"
+    expected_count = int(expected_count)
+    actual_count = ctx.repository.claimed_count()
+    assert (
+        actual_count == expected_count
+    ), f"Expected: {expected_count}, Actual: {actual_count}"
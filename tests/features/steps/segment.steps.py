@@ -0,0 +1,21 @@
+"""BDD steps for segment log message bus repository"""
+# pylint: disable=missing-function-docstring
+import tempfile
+from behave import given  # pylint: disable=no-name-in-module
+from igpy.messagebus.segment import SegmentLogRepository
+
+
+@given("initialized segment log message bus repository")
+def given_initialized_segment_repository(ctx):
+    """Create segment log message bus repository in temporary directory"""
+    ctx.directory = tempfile.TemporaryDirectory()
+    ctx.repository = SegmentLogRepository(ctx.directory.name)
+    ctx.repository.initialize()
+
+
+@given("initialized segment log message bus repository with {lease} seconds lease")
+def given_initialized_segment_repository_with_lease(ctx, lease):
+    """Create segment log message bus repository with given lease duration"""
+    ctx.directory = tempfile.TemporaryDirectory()
+    ctx.repository = SegmentLogRepository(ctx.directory.name, lease_duration=float(lease))
+    ctx.repository.initialize()
@@ -1,5 +1,6 @@
 """BDD steps for message bus sqlite persistence"""
 # pylint: disable=missing-function-docstring
+import time
 from behave import given, when, then  # pylint: disable=no-name-in-module
 from igpy.messagebus.messagebus import MessageBus, TextMessage
 from igpy.messagebus.sqlite import SQLiteRepository
@@ -18,6 +19,13 @@ def given_initialized_empty_sqlite_repository(ctx):
     ctx.repository.initialize()
 
 
+@given("initialized SQLite message bus repository with {lease} seconds lease")
+def given_initialized_sqlite_repository_with_lease(ctx, lease):
+    """Initialize SQLite message bus repository with given lease duration"""
+    ctx.repository = SQLiteRepository(db_name=":memory:", lease_duration=float(lease))
+    ctx.repository.initialize()
+
+
 @given("message bus")
 def given_message_bus(ctx):
     """Create messagebus with repository"""
@@ -48,6 +56,17 @@ def when_message_is_placed_on_messagebus(ctx, body: str):
     ctx.messagebus.put(message)
 
 
+@given("{count} messages are placed on the message bus in bulk")
+def given_messages_are_placed_on_messagebus_in_bulk(ctx, count):
+    """Place multiple messages on the message bus with a single call"""
+    assert (
+        "messagebus" in ctx
+    ), "'messagebus' should be added to the test context before calling this step"
+    count = int(count)
+    messages = [TextMessage(body=f"Message {index + 1}") for index in range(count)]
+    ctx.messagebus.put_many(messages)
+
+
 @when("message bus repository is initialized")
 def when_message_bus_repository_is_initialized(ctx):
     """Invoke message bus repository initialize action"""
@@ -93,6 +112,33 @@ def when_peeked_messages_are_deleted(ctx, count):
         ctx.messagebus.remove(ctx.actual[index])
 
 
+@when("peeked messages are deleted from message bus in bulk")
+def when_peeked_messages_are_deleted_in_bulk(ctx):
+    """delete all peeked messages with a single call"""
+    assert (
+        "messagebus" in ctx
+    ), "'messagebus' should be added to the test context before calling this step"
+    assert (
+        "actual" in ctx
+    ), "'actual' should be added to the test context before calling this step"
+    ctx.messagebus.remove_many(ctx.actual)
+
+
+@when("lease of peeked messages is extended by {duration} seconds")
+def when_lease_of_peeked_messages_is_extended(ctx, duration):
+    """extend lease of all peeked messages"""
+    assert (
+        "actual" in ctx
+    ), "'actual' should be added to the test context before calling this step"
+    ctx.messagebus.extend_lease(ctx.actual, float(duration))
+
+
+@when("{delay} seconds pass")
+def when_seconds_pass(ctx, delay):
+    """wait for given number of seconds"""
+    time.sleep(float(delay))
+
+
 @then("message bus queue table '{table_name}' exists")
 def assert_message_bus_table_exists(ctx, table_name: str):
     """Assert that message bus table exists"""
@@ -0,0 +1,17 @@
+"""Messages and helpers shared by message bus tests"""
+from dataclasses import dataclass
+from datetime import datetime
+
+
+@dataclass(frozen=True)
+class OtherMessage:
+    """Message of another topic"""
+
+    body: str
+    message_id: str = None
+    posted_at: datetime = None
+
+
+def bodies(messages) -> list:
+    """Bodies of given messages"""
+    return [message.body for message in messages]
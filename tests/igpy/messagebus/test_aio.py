@@ -0,0 +1,104 @@
+"""Unit tests for the `aio` module"""
+# pylint: disable=redefined-outer-name
+import asyncio
+import threading
+from typing import Any
+
+import pytest
+from igpy.messagebus import MessageBus
+from igpy.messagebus.aio import AsyncConsumer, AsyncMessageBus
+from igpy.messagebus.messagebus import TextMessage
+from igpy.messagebus.sqlite import SQLiteRepository
+
+
+class RecordingConsumer(AsyncConsumer):
+    """Consumer recording processed messages and peak concurrency"""
+
+    def __init__(self, message_bus: AsyncMessageBus, concurrency: int):
+        super().__init__(message_bus, concurrency)
+        self.running_sleep_interval = 0.01
+        self.processed = []
+        self.active = 0
+        self.peak = 0
+
+    async def process(self, message: Any):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.processed.append(message.body)
+        self.active -= 1
+
+
+@pytest.fixture
+def message_bus():
+    """Message bus with initialized in-memory repository"""
+    repository = SQLiteRepository()
+    repository.initialize()
+    yield MessageBus(repository)
+
+
+class TestAsyncMessageBusClass:
+    """Unit tests for AsyncMessageBus class"""
+
+    def test_repository_runs_on_executor_thread(self, message_bus):
+        """Blocking calls should not run on the event loop thread"""
+        threads = []
+        put = message_bus.put
+        message_bus.put = lambda item, *args: (
+            threads.append(threading.get_ident()) or put(item, *args)
+        )
+
+        async def scenario():
+            async with AsyncMessageBus(message_bus) as bus:
+                await bus.put(TextMessage(body="Hello world"))
+                return await bus.peek(10)
+
+        messages = asyncio.run(scenario())
+        assert [message.body for message in messages] == ["Hello world"]
+        assert threads and threads[0] != threading.get_ident()
+
+    def test_stream_yields_messages_as_they_are_put(self, message_bus):
+        """stream should yield messages put while iterating"""
+
+        async def scenario():
+            async with AsyncMessageBus(message_bus) as bus:
+                await bus.put(TextMessage(body="first"))
+                received = []
+
+                async def produce():
+                    await asyncio.sleep(0.05)
+                    await bus.put(TextMessage(body="second"))
+
+                producer = asyncio.ensure_future(produce())
+                async for message in bus.stream(batch_limit=5):
+                    received.append(message.body)
+                    await bus.remove(message)
+                    if len(received) == 2:
+                        break
+                await producer
+                return received
+
+        assert asyncio.run(scenario()) == ["first", "second"]
+
+
+class TestAsyncConsumerClass:
+    """Unit tests for AsyncConsumer class"""
+
+    def test_processes_messages_with_bounded_concurrency(self, message_bus):
+        """Consumer should process and remove messages, at most `concurrency` at a time"""
+        message_bus.put_many(TextMessage(body=str(index)) for index in range(20))
+
+        async def scenario():
+            async with AsyncMessageBus(message_bus) as bus:
+                consumer = RecordingConsumer(bus, concurrency=3)
+                task = asyncio.ensure_future(consumer.run())
+                while len(consumer.processed) < 20:
+                    await asyncio.sleep(0.01)
+                consumer.stop()
+                await task
+                return consumer
+
+        consumer = asyncio.run(scenario())
+        assert sorted(consumer.processed, key=int) == [str(i) for i in range(20)]
+        assert 1 < consumer.peak <= 3
+        assert message_bus.repository.row_count("queue_item") == 0
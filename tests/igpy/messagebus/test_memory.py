@@ -0,0 +1,149 @@
+"""Unit tests for the `memory` module"""
+# pylint: disable=redefined-outer-name
+import threading
+import time
+
+import pytest
+from igpy.messagebus import MessageBus
+from igpy.messagebus.memory import MemoryRepository
+from igpy.messagebus.messagebus import TextMessage
+from igpy.messagebus.persistence import RetryPolicy, TranscodingMapper
+from tests.igpy.messagebus.helpers import OtherMessage, bodies
+
+
+@pytest.fixture
+def bus():
+    """Message bus with in-memory repository allowing two attempts per message"""
+    repository = MemoryRepository(
+        lease_duration=0.05, retry_policy=RetryPolicy(max_attempts=2, initial_delay=0.05)
+    )
+    return MessageBus(repository)
+
+
+class TestMemoryRepositoryClass:
+    """Unit tests for MemoryRepository class"""
+
+    def test_messages_are_claimed_by_priority_then_posting_order(self, bus):
+        """Higher priority messages should be claimed first"""
+        bus.put_many([TextMessage(body="bulk 1"), TextMessage(body="bulk 2")])
+        bus.put(TextMessage(body="urgent"), priority=10)
+        assert bodies(bus.peek(2)) == ["urgent", "bulk 1"]
+
+    def test_delayed_message_is_claimed_when_due(self, bus):
+        """Delayed message should not be claimed before the delay passes"""
+        bus.repository.lease_duration = 60
+        bus.put(TextMessage(body="later"), delay=0.05)
+        bus.put(TextMessage(body="now"))
+        assert bodies(bus.peek(10)) == ["now"]
+        time.sleep(0.06)
+        assert bodies(bus.peek(10)) == ["later"]
+
+    def test_peek_returns_messages_of_given_topics(self, bus):
+        """peek should claim only messages of given topics in posting order"""
+        bus.put_many(
+            [TextMessage(body="text"), OtherMessage(body="other"), TextMessage(body="last")]
+        )
+        assert bodies(bus.peek(10, topics=[OtherMessage])) == ["other"]
+        assert bodies(bus.peek(10, topics=[TextMessage, OtherMessage])) == [
+            "text",
+            "last",
+        ]
+
+    def test_failed_message_is_retried_then_moved_to_dead_letters(self, bus):
+        """Failed message should be retried after a delay until attempts are exhausted"""
+        bus.put(TextMessage(body="poison"))
+        bus.fail(bus.peek(10), "ValueError()")
+        assert bus.peek(10) == []
+        time.sleep(0.06)
+        bus.fail(bus.peek(10), "ValueError()")
+        assert bus.repository.message_count() == 0
+        assert bodies(bus.dead_letters()) == ["poison"]
+        assert bus.redrive() == 1
+        assert bodies(bus.peek(10)) == ["poison"]
+
+    def test_released_message_is_claimed_again_without_losing_attempts(self, bus):
+        """Released message should be claimed again first and keep its attempts"""
+        bus.repository.lease_duration = 60
+        bus.put_many([TextMessage(body="first"), TextMessage(body="second")])
+        for _ in range(3):
+            messages = bus.peek(1)
+            assert bodies(messages) == ["first"]
+            bus.release(messages)
+        bus.fail(bus.peek(1), "ValueError()")
+        assert bus.dead_letters() == []
+
+    def test_message_released_after_failed_message_follows_its_retry(self, bus):
+        """Message released after a failed message should be claimed after its retry"""
+        bus.repository.lease_duration = 60
+        bus.put_many([TextMessage(body="failed"), TextMessage(body="released")])
+        failed, released = bus.peek(2)
+        bus.fail([failed], "ValueError()")
+        bus.release([released], after=failed)
+        assert bus.peek(2) == []
+        time.sleep(0.06)
+        assert bodies(bus.peek(2)) == ["failed", "released"]
+
+    def test_message_released_after_removed_message_keeps_its_position(self, bus):
+        """Message released after a message which left the queue should not be delayed"""
+        bus.repository.lease_duration = 60
+        bus.put_many([TextMessage(body="removed"), TextMessage(body="released")])
+        removed, released = bus.peek(2)
+        bus.remove(removed)
+        bus.release([released], after=removed)
+        assert bodies(bus.peek(2)) == ["released"]
+
+    def test_expired_lease_of_last_attempt_moves_message_to_dead_letters(self, bus):
+        """Message whose lease expired after the last attempt should be moved to dead letters"""
+        bus.put(TextMessage(body="crash"))
+        bus.peek(10)
+        time.sleep(0.06)
+        bus.peek(10)
+        time.sleep(0.06)
+        assert bus.reclaim_expired() == 1
+        assert bodies(bus.dead_letters()) == ["crash"]
+
+    def test_duplicate_message_id_is_rejected(self, bus):
+        """Inserting a message id twice should fail"""
+        bus.put(TextMessage(body="first", message_id="1"))
+        with pytest.raises(ValueError):
+            bus.put(TextMessage(body="second", message_id="1"))
+
+    def test_acknowledged_messages_are_released(self, bus):
+        """Leases of acknowledged messages should not keep them in memory"""
+        bus.repository.lease_duration = 60
+        for index in range(1000):
+            bus.put(TextMessage(body=str(index)))
+            bus.remove_many(bus.peek(1))
+        leases = bus.repository._leases
+        assert len(leases) < 100
+        assert all(entry.item is None for _, _, entry in leases)
+
+    def test_unserialized_state_is_not_changed_by_decoding(self):
+        """Decoding should not change stored state when no transcoder is used"""
+        bus = MessageBus(MemoryRepository(TranscodingMapper()))
+        bus.put(TextMessage(body="Hello world"))
+        item = bus.repository._entries[next(iter(bus.repository._entries))].item
+        bus.peek(10)
+        assert item.state == {"body": "Hello world"}
+
+    def test_concurrent_consumers_claim_each_message_once(self, bus):
+        """Messages should be claimed by exactly one of concurrent consumers"""
+        bus.repository.lease_duration = 60
+        bus.put_many(TextMessage(body=str(index)) for index in range(1000))
+        claimed = []
+
+        def consume():
+            while True:
+                messages = bus.peek(7)
+                if not messages:
+                    return
+                claimed.extend(bodies(messages))
+                bus.remove_many(messages)
+
+        threads = [threading.Thread(target=consume) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(claimed, key=int) == [str(index) for index in range(1000)]
+        assert bus.repository.message_count() == 0
@@ -2,17 +2,25 @@
 # pylint: disable=redefined-outer-name
 import dataclasses
 from datetime import datetime
+import pickle
+import threading
 from unittest.mock import Mock, patch
+import attr
 from attr import dataclass
 import pytest
 from igpy.messagebus import MessageBus
+from igpy.messagebus.memory import MemoryRepository
+from igpy.messagebus.messagebus import Consumer, TextMessage, Wakeup
 from igpy.messagebus.persistence import (
+    LazyMessage,
     Mapper,
     Repository,
+    RetryPolicy,
     CursorFactory,
     StoredMessage,
     TranscodingMapper,
 )
+from igpy.serialization.transcode import JSONTranscoder
 
 
 class SomeRepository(Repository):
@@ -35,6 +43,15 @@ class SomeMessage:
     text: str
 
 
+@attr.s(auto_attribs=True, slots=True, frozen=True)
+class SlottedMessage:
+    """Slotted message for testing"""
+
+    text: str
+    message_id: str = None
+    posted_at: datetime = None
+
+
 @pytest.fixture
 def fetched_column_names():
     """List of column names returned by the test query"""
@@ -162,6 +179,26 @@ class TestCursorFactoryClass:
         assert isinstance(actual, StoredMessage)
         assert dataclasses.asdict(actual) == fetched_dict
 
+    def test_message_factory_maps_columns_by_name(self, fetched_dict):
+        """message_factory should create StoredMessage from rows in any column order"""
+        columns = ["state", "topic", "message_id", "posted_at"]
+        factory = CursorFactory.message_factory([(col,) for col in columns])
+        actual = factory([fetched_dict[col] for col in columns])
+        assert dataclasses.asdict(actual) == fetched_dict
+        assert CursorFactory.message_factory([(col,) for col in columns]) is factory
+
+
+class TestStoredMessageClass:
+    """Unit tests for StoredMessage class"""
+
+    def test_has_no_instance_dict(self, given_stored_message):
+        """StoredMessage should use slots"""
+        assert not hasattr(given_stored_message, "__dict__")
+
+    def test_can_be_pickled(self, given_stored_message):
+        """Frozen slotted StoredMessage should survive pickling"""
+        assert pickle.loads(pickle.dumps(given_stored_message)) == given_stored_message
+
 
 class TestMapperClass:
     """Unit tests for Mapper class"""
@@ -178,6 +215,17 @@ class TestMapperClass:
         data = Mock()
         assert mapper.decode(data) is data
 
+    def test_get_message_id_returns_message_id_attribute(self, given_stored_message):
+        """get_message_id should return message_id attribute"""
+        mapper = Mapper()
+        assert mapper.get_message_id(given_stored_message) == given_stored_message.message_id
+
+    def test_get_partition_key_returns_partition_key_attribute(self):
+        """get_partition_key should return partition_key attribute or None"""
+        mapper = Mapper()
+        assert mapper.get_partition_key(Mock(partition_key="order-1")) == "order-1"
+        assert mapper.get_partition_key(object()) is None
+
 
 class TestTranscodingMapperClass:
     """Unit tests for TranscodingMapper class"""
@@ -206,6 +254,69 @@ class TestTranscodingMapperClass:
         given_transcoder.decode.assert_called_once_with(given_stored_message.state)
         assert actual == given_message
 
+    def test_get_message_id_does_not_encode(
+        self, given_message, given_mapper, given_transcoder
+    ):
+        """get_message_id should return id attribute without transcoding"""
+        assert given_mapper.get_message_id(given_message) == given_message.message_id
+        given_transcoder.encode.assert_not_called()
+
+    def test_slotted_message_round_trip(self):
+        """Slotted frozen message should be encoded and decoded"""
+        mapper = TranscodingMapper(JSONTranscoder())
+        message = SlottedMessage(text="Hello world")
+        actual = mapper.decode(mapper.encode(message))
+        assert isinstance(actual, SlottedMessage)
+        assert actual.text == message.text
+        assert actual.message_id
+
+    def test_get_partition_key_calls_partition_key_function(self, given_message):
+        """get_partition_key should return result of given partition key function"""
+        mapper = TranscodingMapper(partition_key=lambda message: message.text)
+        assert mapper.get_partition_key(given_message) == given_message.text
+
+
+class TestLazyMessageClass:
+    """Unit tests for TranscodingMapper lazy mode and LazyMessage class"""
+
+    @pytest.fixture
+    def lazy_mapper(self, given_transcoder):
+        """Lazy mapper fixture"""
+        return TranscodingMapper(given_transcoder, lazy=True)
+
+    def test_decode_returns_envelope_without_decoding_state(
+        self, lazy_mapper, given_stored_message, given_transcoder
+    ):
+        """decode should return envelope with raw fields and not decode the state"""
+        actual = lazy_mapper.decode(given_stored_message)
+        assert isinstance(actual, LazyMessage)
+        assert actual.message_id == given_stored_message.message_id
+        assert actual.topic == given_stored_message.topic
+        assert actual.state is given_stored_message.state
+        given_transcoder.decode.assert_not_called()
+
+    def test_payload_is_decoded_once_on_first_access(
+        self, lazy_mapper, given_stored_message, given_message, given_transcoder
+    ):
+        """Payload attributes should be decoded on first access only"""
+        actual = lazy_mapper.decode(given_stored_message)
+        assert actual.text == given_message.text
+        assert actual.message == given_message
+        given_transcoder.decode.assert_called_once()
+
+    def test_envelope_has_no_instance_dict(self, lazy_mapper, given_stored_message):
+        """Envelope should use slots"""
+        actual = lazy_mapper.decode(given_stored_message)
+        assert not hasattr(actual, "__dict__")
+
+    def test_encode_returns_stored_message_without_transcoding(
+        self, lazy_mapper, given_stored_message, given_transcoder
+    ):
+        """Encoding an envelope should reuse the raw state"""
+        actual = lazy_mapper.encode(lazy_mapper.decode(given_stored_message))
+        assert actual == given_stored_message
+        given_transcoder.encode.assert_not_called()
+
 
 class TestRepositoryClass:
     """Unit tests for Repository class"""
@@ -219,6 +330,23 @@ class TestRepositoryClass:
             mock_repository.mapper.encode.return_value
         )
 
+    def test_insert_many_calls_protected_insert_many_with_encoded_subjects(
+        self, given_message, mock_repository
+    ):
+        """Public insert_many method should call protected _insert_many with encoded messages"""
+        insert_many_mock = Mock(side_effect=list)
+        with patch.object(mock_repository, "_insert_many", insert_many_mock):
+            mock_repository.insert_many([given_message, given_message])
+        insert_many_mock.assert_called_once()
+        assert mock_repository.mapper.encode.call_count == 2
+
+    def test_protected_insert_many_calls_protected_insert_for_each_item(
+        self, mock_repository, repository_insert_mock
+    ):
+        """Default _insert_many should call _insert for every item"""
+        mock_repository._insert_many(["first", "second"])
+        assert repository_insert_mock.call_count == 2
+
     def test_delete_calls_protected_delete_with_encoded_subject(
         self, given_message, mock_repository, repository_delete_mock
     ):
@@ -228,6 +356,14 @@ class TestRepositoryClass:
             mock_repository.mapper.encode.return_value
         )
 
+    def test_delete_many_calls_protected_delete_many_with_ids(self, mock_repository):
+        """Public delete_many method should call protected _delete_many with a list of ids"""
+        delete_many_mock = Mock()
+        with patch.object(mock_repository, "_delete_many", delete_many_mock):
+            mock_repository.delete_many(iter(["a", "b"]))
+        delete_many_mock.assert_called_once_with(["a", "b"])
+        mock_repository.mapper.encode.assert_not_called()
+
     def test_select_calls_protected_select_and_reruns_decoded_result(
         self, mock_repository, repository_select_mock
     ):
@@ -242,3 +378,199 @@ class TestRepositoryClass:
         assert actual == [
             mock_repository.mapper.decode.return_value
         ]  # decoded result is returned
+
+
+class TestRetryPolicyClass:
+    """Unit tests for RetryPolicy class"""
+
+    def test_delay_backs_off_exponentially(self):
+        """Retry delay should grow by backoff factor up to max delay"""
+        policy = RetryPolicy(initial_delay=1, backoff_factor=2, max_delay=5)
+        assert [policy.delay(attempts) for attempts in range(1, 5)] == [1, 2, 4, 5]
+
+    def test_exhausted_after_max_attempts(self):
+        """Policy should be exhausted after max attempts"""
+        policy = RetryPolicy(max_attempts=3)
+        assert not policy.exhausted(2)
+        assert policy.exhausted(3)
+
+
+class TestMessageBusClass:
+    """Unit tests for MessageBus class"""
+
+    def test_put_many_calls_repository_insert_many(self):
+        """put_many should pass items to repository insert_many"""
+        repository = Mock()
+        items = [Mock(), Mock()]
+        MessageBus(repository).put_many(items)
+        repository.insert_many.assert_called_once_with(
+            items, priority=0, delay=None
+        )
+
+    def test_remove_many_deletes_message_ids(self, given_message):
+        """remove_many should pass message ids to repository delete_many"""
+        repository = Mock()
+        repository.mapper = Mapper()
+        MessageBus(repository).remove_many([given_message])
+        repository.delete_many.assert_called_once()
+        ids = list(repository.delete_many.call_args[0][0])
+        assert ids == [given_message.message_id]
+
+    def test_extend_lease_passes_message_ids(self, given_message):
+        """extend_lease should pass message ids and duration to repository"""
+        repository = Mock()
+        repository.mapper = Mapper()
+        MessageBus(repository).extend_lease([given_message], 30)
+        ids, duration = repository.extend_lease.call_args[0]
+        assert list(ids) == [given_message.message_id]
+        assert duration == 30
+
+    def test_put_notifies_wakeup(self):
+        """put should notify consumers waiting on the wakeup"""
+        wakeup = Wakeup()
+        MessageBus(Mock(), wakeup=wakeup).put(Mock())
+        assert wakeup.generation == 1
+
+
+class TestWakeupClass:
+    """Unit tests for Wakeup class"""
+
+    def test_wait_times_out_without_notification(self):
+        """wait should return False if nobody notifies"""
+        assert not Wakeup().wait(0.01)
+
+    def test_wait_returns_immediately_after_missed_notification(self):
+        """wait should not block if notification happened after generation was read"""
+        wakeup = Wakeup()
+        generation = wakeup.generation
+        wakeup.notify()
+        assert wakeup.wait(10, generation)
+
+    def test_wait_returns_when_notified(self):
+        """wait should return True when notified from another thread"""
+        wakeup = Wakeup()
+        timer = threading.Timer(0.01, wakeup.notify)
+        timer.start()
+        assert wakeup.wait(10)
+        timer.join()
+
+
+class TestConsumerClass:
+    """Unit tests for Consumer class"""
+
+    @pytest.fixture
+    def consumer(self):
+        """Consumer fixture"""
+        consumer = Consumer(Mock())
+        consumer.peek_batch_size = 10
+        consumer.min_sleep_interval = 0.01
+        consumer.running_sleep_interval = 1
+        consumer.backoff_factor = 2
+        return consumer
+
+    def test_full_batch_does_not_sleep(self, consumer):
+        """Consumer should poll again immediately after a full batch"""
+        assert consumer._next_sleep_interval(10) == 0
+
+    def test_partial_batch_sleeps_min_interval(self, consumer):
+        """Consumer should sleep min interval after a partial batch"""
+        assert consumer._next_sleep_interval(3) == 0.01
+
+    def test_empty_polls_back_off_exponentially(self, consumer):
+        """Consumer should back off exponentially up to running_sleep_interval"""
+        intervals = [consumer._next_sleep_interval(0) for _ in range(9)]
+        assert intervals[:4] == [0.01, 0.02, 0.04, 0.08]
+        assert intervals[-1] == 1
+
+    def test_backoff_is_reset_by_received_messages(self, consumer):
+        """Consumer should reset back off after receiving messages"""
+        for _ in range(5):
+            consumer._next_sleep_interval(0)
+        assert consumer._next_sleep_interval(1) == 0.01
+
+
+class KeyedConsumer(Consumer):
+    """Consumer recording processed message bodies and their threads"""
+
+    def __init__(self, message_bus: MessageBus, workers: int = None):
+        super().__init__(message_bus, workers)
+        self.peek_batch_size = 100
+        self.stop_after = 4
+        self.processed = []
+        self.threads = {}
+        self.failed_once = set()
+
+    def process(self, message):
+        if message.body.endswith("poison"):
+            raise ValueError("poison")
+        if message.body.endswith("flaky") and message.body not in self.failed_once:
+            self.failed_once.add(message.body)
+            raise ValueError("flaky")
+        self.processed.append(message.body)
+        self.threads.setdefault(message.body.split(":")[0], set()).add(
+            threading.current_thread().name
+        )
+        if len(self.processed) == self.stop_after:
+            self.stop()
+
+
+class TestConsumerKeyOrderedMode:
+    """Unit tests for Consumer processing messages by partition key"""
+
+    @pytest.fixture
+    def bus(self):
+        """Message bus with partition key before the colon of text message body"""
+        mapper = TranscodingMapper(
+            JSONTranscoder(), partition_key=lambda message: message.body.split(":")[0]
+        )
+        return MessageBus(MemoryRepository(mapper))
+
+    def test_messages_of_a_key_are_processed_in_order_by_one_worker(self, bus):
+        """Messages with the same key should be processed in order in one thread"""
+        bus.put_many(
+            TextMessage(body=f"{key}:{index}") for index in range(2) for key in "ab"
+        )
+        consumer = KeyedConsumer(bus, workers=2)
+        consumer.run()
+        for key in "ab":
+            assert [body for body in consumer.processed if body[0] == key] == [
+                f"{key}:0",
+                f"{key}:1",
+            ]
+            assert len(consumer.threads[key]) == 1
+        assert bus.repository.message_count() == 0
+
+    def test_messages_after_failed_message_of_a_key_are_released(self, bus):
+        """Messages following a failed message with the same key should be released unprocessed"""
+        bus.repository.retry_policy = RetryPolicy(max_attempts=1)
+        bus.put_many(
+            [TextMessage(body=body) for body in ("a:poison", "a:1", "b:0", "b:1")]
+            + [TextMessage(body=f"c:{index}") for index in range(2)]
+        )
+        consumer = KeyedConsumer(bus, workers=3)
+        consumer.run()
+        assert sorted(consumer.processed) == ["b:0", "b:1", "c:0", "c:1"]
+        assert [message.body for message in bus.dead_letters()] == ["a:poison"]
+        assert [message.body for message in bus.peek(10)] == ["a:1"]
+
+    def test_released_messages_are_not_moved_to_dead_letters(self, bus):
+        """Messages released after a failure in an earlier batch should not lose attempts"""
+        bus.repository.retry_policy = RetryPolicy(max_attempts=2, initial_delay=0)
+        bus.put_many(TextMessage(body=f"k:{body}") for body in ("A-poison", "B", "C", "D"))
+        consumer = KeyedConsumer(bus, workers=2)
+        consumer.peek_batch_size = 2
+        consumer.stop_after = 3
+        consumer.run()
+        assert consumer.processed == ["k:B", "k:C", "k:D"]
+        assert [message.body for message in bus.dead_letters()] == ["k:A-poison"]
+
+    def test_messages_of_a_key_wait_for_retry_of_failed_message(self, bus):
+        """Messages following a retried message should be processed after its retry"""
+        bus.repository.retry_policy = RetryPolicy(max_attempts=2, initial_delay=0.05)
+        bus.put_many(TextMessage(body=f"k:{body}") for body in ("A-flaky", "B", "C"))
+        consumer = KeyedConsumer(bus, workers=2)
+        consumer.peek_batch_size = 2
+        consumer.stop_after = 3
+        consumer.run()
+        assert consumer.processed == ["k:A-flaky", "k:B", "k:C"]
+        assert bus.dead_letters() == []
@@ -0,0 +1,154 @@
+"""Unit tests for the `metrics` module"""
+# pylint: disable=redefined-outer-name
+import json
+
+import pytest
+from igpy.messagebus import MessageBus
+from igpy.messagebus.memory import MemoryRepository
+from igpy.messagebus.messagebus import Consumer, TextMessage
+from igpy.messagebus.metrics import Instrumentation, MetricsCollector, instrumentation
+from igpy.messagebus.sqlite import SQLiteRepository
+
+
+@pytest.fixture
+def collector():
+    """Collector added to the shared instrumentation for the duration of a test"""
+    collector = MetricsCollector(buckets=(0.001, 1))
+    instrumentation.add_hook(collector)
+    yield collector
+    instrumentation.remove_hook(collector)
+
+
+@pytest.fixture
+def bus():
+    """Message bus with initialized in-memory SQLite repository"""
+    repository = SQLiteRepository()
+    repository.initialize()
+    return MessageBus(repository)
+
+
+class FailingConsumer(Consumer):
+    """Consumer failing every message and stopping after the first batch"""
+
+    def process(self, message):
+        self.stop()
+        raise ValueError(message.body)
+
+
+class TestInstrumentationClass:
+    """Unit tests for Instrumentation class"""
+
+    def test_methods_are_restored_when_last_hook_is_removed(self):
+        """Instrumented methods should be replaced only while hooks are added"""
+        put = MessageBus.__dict__["put"]
+        hooks = Instrumentation()
+        hooks.add_hook(lambda *args: None)
+        assert MessageBus.__dict__["put"] is not put
+        hooks.remove_hook(hooks.hooks[0])
+        assert MessageBus.__dict__["put"] is put
+        assert not hooks.enabled
+
+    def test_overlapping_instances_share_wrapped_methods(self):
+        """Methods should be wrapped once and restored after the last instance"""
+        put = MessageBus.__dict__["put"]
+        first, second = Instrumentation(), Instrumentation()
+        first_calls, second_calls = [], []
+        first.add_hook(lambda name, *args: first_calls.append(name))
+        second.add_hook(lambda name, *args: second_calls.append(name))
+        wrapped = MessageBus.__dict__["put"]
+        assert wrapped.__wrapped__ is put
+        bus = MessageBus(MemoryRepository())
+        bus.put(TextMessage(body="Hello"))
+        first.remove_hook(first.hooks[0])
+        assert MessageBus.__dict__["put"] is wrapped
+        bus.put(TextMessage(body="World"))
+        second.remove_hook(second.hooks[0])
+        assert MessageBus.__dict__["put"] is put
+        assert first_calls.count("messagebus.put") == 1
+        assert second_calls.count("messagebus.put") == 2
+
+    def test_timed_reports_duration_and_error(self):
+        """Wrapped function should report duration and whether it raised"""
+        hooks = Instrumentation()
+        calls = []
+        hooks.hooks.append(lambda *args: calls.append(args))
+        with pytest.raises(ValueError):
+            hooks.timed("failing", int)("not a number")
+        assert hooks.timed("parse", int)("1") == 1
+        assert [(name, error) for name, _, error in calls] == [
+            ("failing", True),
+            ("parse", False),
+        ]
+
+
+class TestMetricsCollectorClass:
+    """Unit tests for MetricsCollector class"""
+
+    def test_bus_and_repository_operations_are_collected(self, collector, bus):
+        """Message bus, mapper and SQLite operations should be counted"""
+        bus.put_many([TextMessage(body="Hello"), TextMessage(body="World")])
+        bus.remove_many(bus.peek(10))
+        operations = collector.snapshot()["operations"]
+        assert operations["messagebus.put_many"]["count"] == 1
+        assert operations["mapper.encode"]["count"] == 2
+        assert operations["mapper.decode"]["count"] == 2
+        assert operations["sqlite.claim"]["count"] == 1
+        assert operations["sqlite.delete_many"]["count"] == 1
+
+    def test_failed_consumer_process_is_counted_as_error(self, collector):
+        """Exception raised by Consumer.process should be counted"""
+        bus = MessageBus(MemoryRepository())
+        bus.put(TextMessage(body="poison"))
+        FailingConsumer(bus).run()
+        process = collector.snapshot()["operations"]["consumer.process"]
+        assert process["count"] == 1
+        assert process["errors"] == 1
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Bucket counts should include all smaller durations"""
+        collector = MetricsCollector(buckets=(0.001, 1))
+        for elapsed in (0.0005, 0.5, 2):
+            collector("op", elapsed)
+        operation = collector.snapshot()["operations"]["op"]
+        assert operation["buckets"] == {"0.001": 1, "1": 2, "+Inf": 3}
+        assert operation["count"] == 3
+        assert operation["sum"] == pytest.approx(2.5005)
+
+    def test_repository_gauges_are_read_on_snapshot(self, bus):
+        """Queue depth gauges should report current table sizes"""
+        collector = MetricsCollector()
+        collector.watch_repository(bus.repository)
+        bus.put_many([TextMessage(body="Hello"), TextMessage(body="World")])
+        bus.peek(1)
+        assert collector.snapshot()["gauges"] == {
+            "dead_letters": 0,
+            "lock_table_size": 1,
+            "queue_depth": 2,
+        }
+
+    def test_repositories_are_watched_with_name_prefixes(self, bus):
+        """Gauges of several repositories should be kept apart by prefix"""
+        collector = MetricsCollector()
+        memory = MemoryRepository()
+        collector.watch_repository(bus.repository, prefix="sqlite_")
+        collector.watch_repository(memory, prefix="memory_")
+        memory.insert(TextMessage(body="Hello"))
+        gauges = collector.snapshot()["gauges"]
+        assert gauges["sqlite_queue_depth"] == 0
+        assert gauges["memory_queue_depth"] == 1
+        with pytest.raises(ValueError):
+            collector.watch_repository(memory, prefix="memory_")
+
+    def test_snapshot_is_exported_as_json_and_prometheus_text(self):
+        """Snapshot should be exported in both formats"""
+        collector = MetricsCollector(buckets=(1,))
+        collector.gauge("queue depth", lambda: 7)
+        collector("messagebus.put", 0.5, True)
+        assert json.loads(collector.to_json()) == collector.snapshot()
+        text = collector.to_prometheus()
+        assert (
+            'igpy_messagebus_operation_seconds_bucket{operation="messagebus.put",le="+Inf"} 1'
+            in text
+        )
+        assert 'igpy_messagebus_operation_errors_total{operation="messagebus.put"} 1' in text
+        assert "igpy_messagebus_queue_depth 7" in text
@@ -0,0 +1,156 @@
+"""Unit tests for the `partition` module"""
+# pylint: disable=redefined-outer-name
+import time
+
+import pytest
+from igpy.messagebus import MessageBus
+from igpy.messagebus.memory import MemoryRepository
+from igpy.messagebus.messagebus import TextMessage
+from igpy.messagebus.partition import PartitionedRepository, partition_index
+from igpy.messagebus.persistence import RetryPolicy
+from tests.igpy.messagebus.helpers import bodies
+
+
+def entity_key(message) -> str:
+    """Partition key of test messages, the body up to the first colon"""
+    return message.body.split(":")[0]
+
+
+@pytest.fixture
+def repository():
+    """Repository with three in-memory partitions, partitioned by entity"""
+    return PartitionedRepository([MemoryRepository() for _ in range(3)], key=entity_key)
+
+
+@pytest.fixture
+def bus(repository):
+    """Message bus with partitioned repository"""
+    return MessageBus(repository)
+
+
+def counts(repository) -> list:
+    """Number of messages in every partition"""
+    return [partition.message_count() for partition in repository.partitions]
+
+
+def row_counts(repository) -> list:
+    """Number of queued rows in every SQLite partition"""
+    return [partition.row_count("queue_item") for partition in repository.partitions]
+
+
+class TestPartitionIndexFunction:
+    """Unit tests for partition_index function"""
+
+    def test_index_is_stable(self):
+        """Index should be the CRC-32 of the key, not its process-seeded hash"""
+        assert partition_index("order-1", 4) == 3769860079 % 4 == 3
+        assert partition_index("order-2", 4) == 1
+        assert partition_index(1, 7) == partition_index("1", 7)
+
+
+class TestPartitionedRepositoryClass:
+    """Unit tests for PartitionedRepository class"""
+
+    def test_partitions_are_required(self):
+        """Repository without partitions should not be created"""
+        with pytest.raises(ValueError):
+            PartitionedRepository([])
+
+    def test_messages_with_same_key_are_stored_in_same_partition(self, bus):
+        """All messages of an entity should go to the partition of its key"""
+        bus.put_many(TextMessage(body=f"a:{index}") for index in range(5))
+        bus.put(TextMessage(body="a:5"))
+        partition = bus.repository.partition_of(TextMessage(body="a:"))
+        assert partition.message_count() == 6
+        assert sum(counts(bus.repository)) == 6
+
+    def test_peek_fills_batch_from_all_partitions(self, bus):
+        """Batch should be filled from successive partitions"""
+        messages = [TextMessage(body=f"{key}:1") for key in "abcdefgh"]
+        bus.put_many(messages)
+        assert sorted(bodies(bus.peek(10))) == sorted(bodies(messages))
+        assert bus.peek(10) == []
+
+    def test_assigned_repository_claims_from_its_partitions_only(self, bus):
+        """Assigned repository should claim from assigned partitions only"""
+        bus.put_many(TextMessage(body=f"{key}:1") for key in "abcdefgh")
+        repository = bus.repository
+        for index, partition in enumerate(repository.partitions):
+            assigned = MessageBus(repository.assign([index]))
+            claimed = assigned.peek(10)
+            assert len(claimed) == partition.message_count()
+            assert all(
+                repository.partition_of(message) is partition for message in claimed
+            )
+
+    def test_messages_of_a_key_are_claimed_in_order(self, bus):
+        """Messages of a key should be claimed in posting order within partition"""
+        bus.put_many(
+            TextMessage(body=f"{key}:{index}") for index in range(5) for key in "ab"
+        )
+        claimed = bodies(bus.peek(10))
+        for key in "ab":
+            assert [body for body in claimed if body[0] == key] == [
+                f"{key}:{index}" for index in range(5)
+            ]
+
+    def test_remove_deletes_from_claiming_partition(self, bus):
+        """Claimed messages should be deleted from their partition"""
+        bus.put_many(TextMessage(body=f"{key}:1") for key in "abcdefgh")
+        bus.remove_many(bus.peek(3))
+        assert sum(counts(bus.repository)) == 5
+        assert bus.repository._claims == {}
+
+    def test_remove_of_unclaimed_message_is_passed_to_all_partitions(self, bus):
+        """Message which was not claimed here should be deleted from any partition"""
+        message = TextMessage(body="a:1", message_id="1")
+        bus.put(message)
+        bus.remove(message)
+        assert sum(counts(bus.repository)) == 0
+
+    def test_stored_items_are_inserted_into_partition_of_their_key(self, repository):
+        """Protected inserts should partition encoded items by their message key"""
+        messages = [TextMessage(body=f"{key}:1") for key in "abcdefgh"]
+        repository._insert(repository.mapper.encode(messages[0]))
+        repository._insert_many(repository.mapper.encode(message) for message in messages[1:])
+        assert sum(counts(repository)) == 8
+        for partition in repository.partitions:
+            for message in partition.select(batch_limit=10):
+                assert repository.partition_of(message) is partition
+
+    def test_expired_claims_are_forgotten(self):
+        """Claims should not be remembered after their lease expires"""
+        repository = PartitionedRepository(
+            [MemoryRepository(lease_duration=0.05) for _ in range(3)], key=entity_key
+        )
+        bus = MessageBus(repository)
+        bus.put_many(TextMessage(body=f"{key}:1") for key in "abcdefgh")
+        claimed = bus.peek(3)
+        repository.extend_lease([claimed[0].message_id], 10)
+        time.sleep(0.1)
+        bus.reclaim_expired()
+        assert list(repository._claims) == [claimed[0].message_id]
+
+    def test_failed_messages_are_redriven_from_all_partitions(self, bus):
+        """Dead letters of all partitions should be listed and redriven"""
+        for partition in bus.repository.partitions:
+            partition.retry_policy = RetryPolicy(max_attempts=1)
+        bus.put_many(TextMessage(body=f"{key}:1") for key in "abcdefgh")
+        bus.fail(bus.peek(10), "ValueError()")
+        assert len(bus.dead_letters()) == 8
+        assert len(bus.dead_letters(3)) == 3
+        assert bus.redrive() == 8
+        assert len(bus.peek(10)) == 8
+
+    def test_from_sqlite_creates_partition_per_database(self, tmp_path):
+        """SQLite partitions should be created for given database files"""
+        repository = PartitionedRepository.from_sqlite(
+            [str(tmp_path / f"queue-{index}.db") for index in range(2)], key=entity_key
+        )
+        repository.initialize()
+        bus = MessageBus(repository)
+        bus.put_many(TextMessage(body=f"{key}:1") for key in "abcdefgh")
+        assert sum(row_counts(repository)) == 8
+        bus.remove_many(bus.peek(10))
+        assert sum(row_counts(repository)) == 0
+        repository.close()
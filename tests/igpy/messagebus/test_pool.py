@@ -0,0 +1,111 @@
+"""Unit tests for the `pool` module"""
+# pylint: disable=redefined-outer-name
+import functools
+import threading
+import time
+from typing import Any
+
+import pytest
+from igpy.messagebus import MessageBus
+from igpy.messagebus.messagebus import Consumer, TextMessage
+from igpy.messagebus.pool import ConsumerPool
+from igpy.messagebus.sqlite import SQLiteRepository
+
+
+class RecordingConsumer(Consumer):
+    """Consumer recording processed messages"""
+
+    processed = []
+    processed_lock = threading.Lock()
+
+    def __init__(self, message_bus: MessageBus, delay: float = 0):
+        super().__init__(message_bus)
+        self.delay = delay
+        self.running_sleep_interval = 0.01
+        self.paused_sleep_interval = 0.01
+
+    def process(self, message: Any):
+        time.sleep(self.delay)
+        with self.processed_lock:
+            self.processed.append(message.body)
+
+
+def sqlite_consumer(db_name: str) -> Consumer:
+    """Create consumer with its own repository connection"""
+    return Consumer(MessageBus(SQLiteRepository(db_name)))
+
+
+@pytest.fixture
+def message_bus():
+    """Message bus with initialized in-memory repository"""
+    repository = SQLiteRepository()
+    repository.initialize()
+    RecordingConsumer.processed = []
+    yield MessageBus(repository)
+
+
+def wait_for(condition, timeout=10):
+    """Wait until condition is met"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def consume(message_bus, workers, count, delay):
+    """Consume `count` messages with a thread pool, return elapsed seconds"""
+    message_bus.put_many(TextMessage(body=str(index)) for index in range(count))
+    pool = ConsumerPool(lambda: RecordingConsumer(message_bus, delay), workers)
+    started = time.perf_counter()
+    with pool:
+        wait_for(lambda: len(RecordingConsumer.processed) >= count)
+    return time.perf_counter() - started
+
+
+class TestConsumerPoolClass:
+    """Unit tests for ConsumerPool class"""
+
+    def test_unknown_executor_raises_error(self):
+        """ConsumerPool should reject unknown executor"""
+        with pytest.raises(ValueError):
+            ConsumerPool(Consumer, executor="fiber")
+
+    def test_thread_workers_process_every_message_once(self, message_bus):
+        """Every message should be processed by exactly one worker"""
+        consume(message_bus, workers=4, count=100, delay=0)
+        assert sorted(RecordingConsumer.processed, key=int) == [
+            str(index) for index in range(100)
+        ]
+        assert message_bus.repository.row_count("queue_item") == 0
+
+    def test_thread_workers_scale_io_bound_handlers(self, message_bus):
+        """Throughput should grow close to linearly with the number of workers"""
+        single = consume(message_bus, workers=1, count=40, delay=0.01)
+        RecordingConsumer.processed = []
+        parallel = consume(message_bus, workers=4, count=40, delay=0.01)
+        assert parallel < single / 2
+
+    def test_paused_pool_does_not_process_messages(self, message_bus):
+        """Paused pool should not process messages until resumed"""
+        pool = ConsumerPool(lambda: RecordingConsumer(message_bus), 2)
+        with pool:
+            pool.pause()
+            time.sleep(0.05)
+            message_bus.put(TextMessage(body="paused"))
+            time.sleep(0.05)
+            assert not RecordingConsumer.processed
+            pool.resume()
+            wait_for(lambda: RecordingConsumer.processed)
+        assert not pool.running
+
+    def test_process_workers_consume_queue(self, tmp_path):
+        """Process workers should open own repositories and consume the queue"""
+        db_name = str(tmp_path / "queue.db")
+        repository = SQLiteRepository(db_name)
+        repository.initialize()
+        MessageBus(repository).put_many(TextMessage(body=str(i)) for i in range(20))
+        pool = ConsumerPool(
+            functools.partial(sqlite_consumer, db_name), workers=2, executor="process"
+        )
+        with pool:
+            wait_for(lambda: repository.row_count("queue_item") == 0)
@@ -0,0 +1,182 @@
+"""Unit tests for the `segment` module"""
+# pylint: disable=redefined-outer-name
+import os
+import time
+
+import pytest
+from igpy.messagebus import MessageBus
+from igpy.messagebus.messagebus import TextMessage
+from igpy.messagebus.persistence import RetryPolicy
+from igpy.messagebus.segment import SEGMENT_SUFFIX, SegmentLogRepository
+from tests.igpy.messagebus.helpers import OtherMessage, bodies
+
+
+def open_bus(directory, **kwargs) -> MessageBus:
+    """Message bus with initialized segment log repository in `directory`"""
+    repository = SegmentLogRepository(str(directory), **kwargs)
+    repository.initialize()
+    return MessageBus(repository)
+
+
+@pytest.fixture
+def bus(tmp_path):
+    """Message bus with segment log repository allowing two attempts per message"""
+    bus = open_bus(
+        tmp_path,
+        lease_duration=0.05,
+        retry_policy=RetryPolicy(max_attempts=2, initial_delay=0.05),
+    )
+    yield bus
+    bus.repository.close()
+
+
+def segment_files(directory) -> list:
+    """Names of segment files in `directory`"""
+    return sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+
+
+class TestSegmentLogRepositoryClass:
+    """Unit tests for SegmentLogRepository class"""
+
+    def test_messages_are_claimed_in_posting_order(self, bus):
+        """Messages should be claimed in the order they were put"""
+        bus.put_many([TextMessage(body="first"), TextMessage(body="second")])
+        bus.put(TextMessage(body="third"))
+        assert bodies(bus.peek(2)) == ["first", "second"]
+        assert bodies(bus.peek(2)) == ["third"]
+
+    def test_claimed_state_is_slice_of_mapped_segment(self, bus):
+        """Claimed items should reference segment memory instead of copying it"""
+        bus.put(TextMessage(body="Hello world"))
+        (item,) = bus.repository._select(1)
+        assert isinstance(item.state, memoryview)
+        assert bytes(item.state) == b'{"body": "Hello world"}'
+
+    def test_priority_is_rejected(self, bus):
+        """Putting message with priority should fail"""
+        with pytest.raises(ValueError):
+            bus.put(TextMessage(body="urgent"), priority=10)
+
+    def test_delayed_message_is_claimed_when_due(self, bus):
+        """Delayed message should not be claimed before the delay passes"""
+        bus.repository.lease_duration = 60
+        bus.put(TextMessage(body="later"), delay=0.05)
+        bus.put(TextMessage(body="now"))
+        assert bodies(bus.peek(10)) == ["now"]
+        time.sleep(0.06)
+        assert bodies(bus.peek(10)) == ["later"]
+
+    def test_peek_returns_messages_of_given_topics(self, bus):
+        """peek should claim only messages of given topics in posting order"""
+        bus.put_many(
+            [TextMessage(body="text"), OtherMessage(body="other"), TextMessage(body="last")]
+        )
+        assert bodies(bus.peek(10, topics=[OtherMessage])) == ["other"]
+        assert bodies(bus.peek(10, topics=[TextMessage, OtherMessage])) == [
+            "text",
+            "last",
+        ]
+
+    def test_segments_are_rolled_and_removed_when_acknowledged(self, tmp_path):
+        """Full segments should be rolled and removed once all messages are deleted"""
+        bus = open_bus(tmp_path, segment_size=256)
+        bus.put_many(TextMessage(body=str(index)) for index in range(20))
+        assert len(segment_files(tmp_path)) > 2
+        messages = bus.peek(20)
+        assert bodies(messages) == [str(index) for index in range(20)]
+        bus.remove_many(messages)
+        assert segment_files(tmp_path) == segment_files(tmp_path)[-1:]
+        assert bus.repository.message_count() == 0
+        bus.repository.close()
+
+    def test_unacknowledged_messages_are_delivered_after_reopening(self, tmp_path):
+        """Reopened repository should deliver messages which were not deleted"""
+        bus = open_bus(tmp_path, segment_size=256)
+        bus.put_many(TextMessage(body=str(index)) for index in range(10))
+        bus.remove_many(bus.peek(4))
+        bus.peek(2)
+        bus.repository.close()
+        bus = open_bus(tmp_path, segment_size=256)
+        assert bus.repository.message_count() == 6
+        bus.put(TextMessage(body="new"))
+        assert bodies(bus.peek(10)) == ["4", "5", "6", "7", "8", "9", "new"]
+        bus.repository.close()
+
+    def test_torn_record_is_ignored_after_reopening(self, tmp_path):
+        """Record with damaged content should end the recovered segment"""
+        bus = open_bus(tmp_path)
+        bus.put_many([TextMessage(body="intact"), TextMessage(body="torn")])
+        bus.repository.close()
+        path = os.path.join(tmp_path, segment_files(tmp_path)[0])
+        with open(path, "r+b") as file:
+            content = file.read()
+            file.seek(content.index(b"torn"))
+            file.write(b"TORN")
+        bus = open_bus(tmp_path)
+        assert bodies(bus.peek(10)) == ["intact"]
+        bus.repository.close()
+
+    def test_empty_segment_left_by_crash_is_removed_after_reopening(self, tmp_path):
+        """Segment file created but never written before a crash should be dropped"""
+        bus = open_bus(tmp_path)
+        bus.put(TextMessage(body="intact"))
+        bus.repository.close()
+        base = int(segment_files(tmp_path)[0][: -len(SEGMENT_SUFFIX)])
+        empty = os.path.join(tmp_path, f"{base + 1:020d}{SEGMENT_SUFFIX}")
+        open(empty, "wb").close()
+        bus = open_bus(tmp_path)
+        assert not os.path.exists(empty)
+        bus.put(TextMessage(body="new"))
+        assert bodies(bus.peek(10)) == ["intact", "new"]
+        bus.repository.close()
+
+    def test_failed_message_is_retried_then_moved_to_dead_letters(self, bus):
+        """Failed message should be retried after a delay until attempts are exhausted"""
+        bus.put(TextMessage(body="poison"))
+        bus.fail(bus.peek(10), "ValueError()")
+        assert bus.peek(10) == []
+        time.sleep(0.06)
+        bus.fail(bus.peek(10), "ValueError()")
+        assert bus.repository.message_count() == 0
+        assert bodies(bus.dead_letters()) == ["poison"]
+        assert bus.redrive() == 1
+        assert bus.dead_letters() == []
+        assert bodies(bus.peek(10)) == ["poison"]
+
+    def test_released_message_is_claimed_again_without_losing_attempts(self, bus):
+        """Released message should be claimed again first and keep its attempts"""
+        bus.repository.lease_duration = 60
+        bus.put_many([TextMessage(body="first"), TextMessage(body="second")])
+        for _ in range(3):
+            messages = bus.peek(1)
+            assert bodies(messages) == ["first"]
+            bus.release(messages)
+        bus.fail(bus.peek(1), "ValueError()")
+        assert bus.dead_letters() == []
+
+    def test_message_released_after_failed_message_follows_its_retry(self, bus):
+        """Message released after a failed message should be claimed after its retry"""
+        bus.repository.lease_duration = 60
+        bus.put_many([TextMessage(body="failed"), TextMessage(body="released")])
+        failed, released = bus.peek(2)
+        bus.fail([failed], "ValueError()")
+        bus.release([released], after=failed)
+        assert bus.peek(2) == []
+        time.sleep(0.06)
+        assert bodies(bus.peek(2)) == ["failed", "released"]
+
+    def test_expired_lease_of_last_attempt_moves_message_to_dead_letters(self, bus):
+        """Message whose lease expired after the last attempt should be moved to dead letters"""
+        bus.put(TextMessage(body="crash"))
+        bus.peek(10)
+        time.sleep(0.06)
+        bus.peek(10)
+        time.sleep(0.06)
+        assert bus.reclaim_expired() == 1
+        assert bodies(bus.dead_letters()) == ["crash"]
+
+    def test_duplicate_message_id_is_rejected(self, bus):
+        """Inserting a message id twice should fail"""
+        bus.put(TextMessage(body="first", message_id="1"))
+        with pytest.raises(ValueError):
+            bus.put(TextMessage(body="second", message_id="1"))
@@ -0,0 +1,536 @@
+"""Unit tests for the `sqlite` module"""
+# pylint: disable=redefined-outer-name
+import gc
+import sqlite3
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from igpy.messagebus import MessageBus
+from igpy.messagebus.messagebus import Consumer, TextMessage
+from igpy.messagebus.persistence import RetryPolicy
+from igpy.messagebus.sqlite import GroupCommitWriter, SQLiteRepository
+from tests.igpy.messagebus.helpers import OtherMessage
+
+
+@pytest.fixture
+def db_name(tmp_path):
+    """Database file name"""
+    return str(tmp_path / "queue.db")
+
+
+def pragma(repository, name):
+    """Read pragma value from current thread connection"""
+    return repository.connection.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+class TestSQLiteRepositoryClass:
+    """Unit tests for SQLiteRepository class"""
+
+    def test_unknown_profile_raises_error(self, db_name):
+        """Unknown tuning profile should be rejected"""
+        with pytest.raises(ValueError):
+            SQLiteRepository(db_name, profile="reckless")
+
+    def test_default_uses_rollback_journal(self, db_name):
+        """WAL should be opt-in"""
+        repository = SQLiteRepository(db_name)
+        assert pragma(repository, "journal_mode") == "delete"
+
+    @pytest.mark.parametrize(
+        "profile,synchronous", [("durable", 2), ("balanced", 1), ("fast", 0)]
+    )
+    def test_profile_sets_pragmas(self, db_name, profile, synchronous):
+        """Tuning profile should enable WAL and set synchronous level"""
+        repository = SQLiteRepository(db_name, profile=profile)
+        assert pragma(repository, "journal_mode") == "wal"
+        assert pragma(repository, "synchronous") == synchronous
+
+    def test_explicit_pragmas_override_profile(self, db_name):
+        """journal_mode and synchronous arguments should override the profile"""
+        repository = SQLiteRepository(
+            db_name, profile="fast", journal_mode="TRUNCATE", synchronous="FULL"
+        )
+        assert pragma(repository, "journal_mode") == "truncate"
+        assert pragma(repository, "synchronous") == 2
+
+    def test_file_database_uses_connection_per_thread(self, db_name):
+        """Every thread should get its own connection to a file database"""
+        repository = SQLiteRepository(db_name)
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(repository.connection))
+        thread.start()
+        thread.join()
+        assert connections[0] is not repository.connection
+        assert repository.connection is repository.connection
+        repository.close()
+
+    def test_connection_is_closed_when_thread_exits(self, db_name):
+        """Connections of finished threads should not be kept open"""
+        repository = SQLiteRepository(db_name)
+        repository.initialize()
+        bus = MessageBus(repository)
+        threads = [
+            threading.Thread(target=bus.put, args=(TextMessage(body=str(index)),))
+            for index in range(50)
+        ]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        gc.collect()
+        assert len(repository._connections) == 1
+        assert repository.row_count("queue_item") == 50
+        repository.close()
+
+    def test_memory_database_shares_connection(self):
+        """All threads should share the in-memory database connection"""
+        repository = SQLiteRepository()
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(repository.connection))
+        thread.start()
+        thread.join()
+        assert connections[0] is repository.connection
+
+    def test_concurrent_producers_and_consumer(self, db_name):
+        """Producer threads and a consumer should share repository safely"""
+        repository = SQLiteRepository(db_name, profile="balanced")
+        repository.initialize()
+        bus = MessageBus(repository)
+
+        def produce():
+            for index in range(50):
+                bus.put(TextMessage(body=str(index)))
+
+        producers = [threading.Thread(target=produce) for _ in range(4)]
+        for producer in producers:
+            producer.start()
+        received = 0
+        while received < 200:
+            messages = bus.peek(20)
+            bus.remove_many(messages)
+            received += len(messages)
+        for producer in producers:
+            producer.join()
+        assert repository.row_count("queue_item") == 0
+        repository.close()
+
+
+class TestSQLiteRepositoryTopics:
+    """Unit tests for topic filtered selection"""
+
+    @pytest.fixture
+    def bus(self):
+        """Message bus with messages of two topics"""
+        repository = SQLiteRepository()
+        repository.initialize()
+        bus = MessageBus(repository)
+        bus.put_many(
+            [TextMessage(body="text 1"), OtherMessage(body="other"), TextMessage(body="text 2")]
+        )
+        return bus
+
+    def test_peek_returns_messages_of_given_topics(self, bus):
+        """peek should claim only messages of given topics"""
+        messages = bus.peek(10, topics=[OtherMessage])
+        assert [message.body for message in messages] == ["other"]
+        messages = bus.peek(10, topics=[TextMessage, OtherMessage])
+        assert [message.body for message in messages] == ["text 1", "text 2"]
+
+    def test_multiple_topics_are_claimed_in_posting_order(self, bus):
+        """Messages of multiple topics should be claimed oldest first"""
+        messages = bus.peek(2, topics=[OtherMessage, TextMessage])
+        assert [message.body for message in messages] == ["text 1", "other"]
+
+    def test_claim_uses_topic_index(self, bus):
+        """Claiming a topic should search the topic index"""
+        statement = bus.repository.topic_claim_statement(1)
+        plan = bus.repository.connection.execute(
+            f"EXPLAIN QUERY PLAN {statement}", ["lock", "topic", "9999", 10, 10]
+        ).fetchall()
+        assert any("queue_item_topic_due_idx" in row[-1] for row in plan)
+
+    def test_consumer_dispatches_subscribed_topics(self, bus):
+        """Consumer should peek subscribed topics and dispatch to handlers"""
+        consumer = Consumer(bus)
+        received = []
+        consumer.subscribe(OtherMessage, received.append)
+        consumer.running_sleep_interval = 0.01
+        thread = threading.Thread(target=consumer.run)
+        thread.start()
+        while not received:
+            time.sleep(0.01)
+        consumer.stop()
+        thread.join()
+        assert [message.body for message in received] == ["other"]
+        assert bus.repository.row_count("queue_item") == 2
+
+
+class TestSQLiteRepositorySchedule:
+    """Unit tests for message priority and delayed delivery"""
+
+    @pytest.fixture
+    def bus(self):
+        """Message bus with initialized in-memory repository"""
+        repository = SQLiteRepository()
+        repository.initialize()
+        return MessageBus(repository)
+
+    def test_higher_priority_is_claimed_first(self, bus):
+        """Messages should be claimed by priority, then in posting order"""
+        bus.put_many([TextMessage(body="bulk 1"), TextMessage(body="bulk 2")])
+        bus.put(TextMessage(body="urgent"), priority=10)
+        messages = bus.peek(2)
+        assert [message.body for message in messages] == ["urgent", "bulk 1"]
+
+    def test_delayed_message_is_claimed_when_due(self, bus):
+        """Delayed message should not be claimed before the delay passes"""
+        bus.put(TextMessage(body="later"), delay=0.2)
+        bus.put(TextMessage(body="now"))
+        assert [message.body for message in bus.peek(10)] == ["now"]
+        time.sleep(0.25)
+        assert [message.body for message in bus.peek(10)] == ["later"]
+
+    def test_empty_poll_does_not_walk_delayed_messages(self, bus):
+        """Cost of polling without due messages should not grow with delayed messages"""
+
+        def poll_steps():
+            steps = []
+            connection = bus.repository.connection
+            connection.set_progress_handler(lambda: steps.append(1), 100)
+            assert bus.peek(10) == []
+            connection.set_progress_handler(None, 0)
+            return len(steps)
+
+        bus.put(TextMessage(body="later"), delay=60)
+        few = poll_steps()
+        bus.put_many((TextMessage(body=str(index)) for index in range(20000)), delay=60)
+        assert poll_steps() <= few + 1
+
+    def test_initialize_upgrades_queue_table(self, db_name):
+        """Messages stored before scheduling was added should be claimed"""
+        repository = SQLiteRepository(db_name)
+        bus = MessageBus(repository)
+        stored = repository.mapper.encode(TextMessage(body="Hello world"))
+        connection = sqlite3.connect(db_name)
+        connection.execute(
+            "CREATE TABLE queue_item (message_id TEXT, posted_at timestamp, "
+            "topic TEXT, state BLOB, lock_id TEXT, PRIMARY KEY (message_id))"
+        )
+        connection.execute(
+            "INSERT INTO queue_item VALUES (?,?,?,?,NULL)",
+            [stored.message_id, stored.posted_at, stored.topic, stored.state],
+        )
+        connection.commit()
+        connection.close()
+        repository.initialize()
+        assert [message.body for message in bus.peek(10)] == ["Hello world"]
+        repository.close()
+
+
+class TestSQLiteRepositoryIterSelect:
+    """Unit tests for streaming selection"""
+
+    @pytest.fixture
+    def bus(self):
+        """Message bus fetching claimed messages two at a time"""
+        repository = SQLiteRepository(fetch_chunk_size=2)
+        repository.initialize()
+        bus = MessageBus(repository)
+        bus.put_many(TextMessage(body=f"message {index}") for index in range(5))
+        return bus
+
+    def test_iter_messages_yields_batch_in_order(self, bus):
+        """iter_messages should yield claimed messages in claim order"""
+        messages = bus.iter_messages(4)
+        assert [message.body for message in messages] == [
+            f"message {index}" for index in range(4)
+        ]
+
+    def test_iter_messages_claims_batch_before_iterating(self, bus):
+        """Batch should be claimed when iter_messages is called"""
+        messages = bus.iter_messages(4)
+        assert [message.body for message in bus.peek(10)] == ["message 4"]
+        assert len(list(messages)) == 4
+
+    def test_iter_messages_skips_removed_messages(self, bus):
+        """Messages removed after being claimed should be skipped"""
+        messages = bus.iter_messages(5)
+        next(messages)
+        with bus.repository.transaction() as curs:
+            curs.execute(
+                "DELETE FROM queue_item WHERE rowid=(SELECT MAX(rowid) FROM queue_item)"
+            )
+        assert [message.body for message in messages] == [
+            "message 1",
+            "message 2",
+            "message 3",
+        ]
+
+
+class PoisonConsumer(Consumer):
+    """Consumer failing to process poison messages"""
+
+    def __init__(self, message_bus: MessageBus):
+        super().__init__(message_bus)
+        self.running_sleep_interval = 0.01
+        self.processed = []
+
+    def process(self, message):
+        if message.body == "poison":
+            raise ValueError("poison")
+        self.processed.append(message.body)
+        if len(self.processed) == 2:
+            self.stop()
+
+
+class TestSQLiteRepositoryRetries:
+    """Unit tests for failed message retries and dead letters"""
+
+    @pytest.fixture
+    def bus(self):
+        """Message bus with repository allowing two attempts per message"""
+        repository = SQLiteRepository(
+            lease_duration=0, retry_policy=RetryPolicy(max_attempts=2, initial_delay=60)
+        )
+        repository.initialize()
+        return MessageBus(repository)
+
+    def attempts(self, bus):
+        """Attempt counts of queued messages"""
+        return [
+            row[0]
+            for row in bus.repository.connection.execute("SELECT attempts FROM queue_item")
+        ]
+
+    def test_consumer_isolates_failing_message(self, bus):
+        """Failing message should be rescheduled and other messages processed"""
+        bus.put_many(
+            [TextMessage(body="first"), TextMessage(body="poison"), TextMessage(body="last")]
+        )
+        consumer = PoisonConsumer(bus)
+        consumer.run()
+        assert consumer.processed == ["first", "last"]
+        assert self.attempts(bus) == [1]
+        assert bus.peek(10) == []
+
+    def test_exhausted_message_is_moved_to_dead_letters(self, bus):
+        """Message failed max_attempts times should be moved to dead letters"""
+        bus.put(TextMessage(body="poison"))
+        for _ in range(2):
+            bus.repository.connection.execute("UPDATE queue_item SET not_before=posted_at")
+            bus.fail(bus.peek(10), "ValueError('poison')")
+        assert bus.repository.row_count("queue_item") == 0
+        assert [message.body for message in bus.dead_letters()] == ["poison"]
+        error = bus.repository.connection.execute("SELECT error FROM queue_item_dead")
+        assert error.fetchone()[0] == "ValueError('poison')"
+
+    def test_expired_exhausted_lease_is_moved_to_dead_letters(self, bus):
+        """Message whose lease expired after the last attempt should be moved to dead letters"""
+        bus.put(TextMessage(body="crash"))
+        bus.peek(10)
+        bus.peek(10)
+        time.sleep(0.01)
+        assert bus.reclaim_expired() == 1
+        assert [message.body for message in bus.dead_letters()] == ["crash"]
+
+    def test_expired_claim_does_not_change_new_claim(self, bus):
+        """Consumer whose lease expired should not extend or fail the claim of another consumer"""
+        bus.put(TextMessage(body="slow"))
+        claimed = threading.Event()
+        reclaimed = threading.Event()
+
+        def stale_consumer():
+            messages = bus.peek(10)
+            claimed.set()
+            reclaimed.wait()
+            bus.extend_lease(messages, 0)
+            bus.fail(messages, "ValueError('late')")
+
+        thread = threading.Thread(target=stale_consumer)
+        thread.start()
+        claimed.wait()
+        time.sleep(0.01)
+        bus.repository.lease_duration = 60
+        assert [message.body for message in bus.peek(10)] == ["slow"]
+        reclaimed.set()
+        thread.join()
+        assert bus.reclaim_expired() == 0
+        assert bus.dead_letters() == []
+        assert bus.repository.row_count("queue_item_lock") == 1
+
+    def test_redrive_returns_dead_letters_to_queue(self, bus):
+        """redrive should return dead letters with reset attempts"""
+        bus.put_many([TextMessage(body="first"), TextMessage(body="second")])
+        for _ in range(2):
+            bus.repository.connection.execute("UPDATE queue_item SET not_before=posted_at")
+            bus.fail(bus.peek(10))
+        first = next(message for message in bus.dead_letters() if message.body == "first")
+        assert bus.redrive([first.message_id]) == 1
+        assert bus.redrive() == 1
+        assert self.attempts(bus) == [0, 0]
+        assert [message.body for message in bus.peek(10)] == ["first", "second"]
+
+    def test_released_message_does_not_count_attempt(self, bus):
+        """Released message should be claimable again with its attempt undone"""
+        bus.put_many([TextMessage(body="first"), TextMessage(body="second")])
+        bus.release(bus.peek(1))
+        assert self.attempts(bus) == [0, 0]
+        assert bus.repository.row_count("queue_item_lock") == 0
+        assert [message.body for message in bus.peek(1)] == ["first"]
+
+    def test_message_released_after_failed_message_waits_for_its_retry(self, bus):
+        """Message released after a failed message should be due with its retry"""
+        bus.put_many([TextMessage(body="failed"), TextMessage(body="released")])
+        failed, released = bus.peek(2)
+        bus.fail([failed], "ValueError()")
+        bus.release([released], after=failed)
+        assert bus.peek(2) == []
+        assert self.attempts(bus) == [1, 0]
+        not_before = bus.repository.connection.execute(
+            "SELECT DISTINCT not_before FROM queue_item"
+        ).fetchall()
+        assert len(not_before) == 1
+
+
+class TestGroupCommitWriterClass:
+    """Unit tests for GroupCommitWriter class"""
+
+    def test_items_from_many_threads_are_written_together(self):
+        """Concurrently submitted items should be written in few batches"""
+        batches = []
+        writer = GroupCommitWriter(batches.append, max_batch=100, max_delay=0.05)
+        threads = [
+            threading.Thread(target=lambda: writer.submit("item").result())
+            for _ in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        writer.close()
+        assert sum(len(batch) for batch in batches) == 20
+        assert len(batches) < 20
+
+    def test_items_submitted_while_closing_are_written_or_rejected(self):
+        """Every accepted item should be written even if submitted during close"""
+        batches = []
+        writer = GroupCommitWriter(batches.append, max_batch=10, max_delay=0.001)
+        futures = []
+
+        def submit():
+            while True:
+                try:
+                    futures.append(writer.submit("item"))
+                except RuntimeError:
+                    return
+
+        threads = [threading.Thread(target=submit) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.01)
+        writer.close()
+        for thread in threads:
+            thread.join()
+        assert all(future.result(timeout=1) is None for future in futures)
+        assert sum(len(batch) for batch in batches) == len(futures)
+
+    @pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+    def test_pending_items_fail_when_writer_stops(self):
+        """Items of a stopped writer should fail instead of waiting forever"""
+
+        def write(items):
+            raise SystemExit()
+
+        writer = GroupCommitWriter(write, max_batch=1, max_delay=0)
+        with pytest.raises(RuntimeError):
+            writer.submit("item").result(timeout=1)
+        writer._thread.join(timeout=1)
+        with pytest.raises(RuntimeError):
+            writer.submit("item")
+
+    @pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+    def test_items_fail_when_writer_stops_while_retrying_batch(self):
+        """Items retried one by one should fail when the writer stops on an earlier item"""
+
+        def write(items):
+            if len(items) > 1:
+                raise ValueError("bad batch")
+            if items == ["fatal"]:
+                raise SystemExit()
+
+        writer = GroupCommitWriter(write, max_batch=3, max_delay=1)
+        futures = [writer.submit(item) for item in ("good", "fatal", "last")]
+        assert futures[0].result(timeout=1) is None
+        for future in futures[1:]:
+            with pytest.raises(RuntimeError):
+                future.result(timeout=1)
+        writer._thread.join(timeout=1)
+
+    def test_batch_is_written_when_full(self):
+        """Batch should be written as soon as it reaches max_batch items"""
+        batches = []
+        writer = GroupCommitWriter(batches.append, max_batch=2, max_delay=10)
+        futures = [writer.submit(index) for index in range(2)]
+        for future in futures:
+            future.result(timeout=1)
+        writer.close()
+        assert batches == [[0, 1]]
+
+    def test_failed_item_does_not_fail_others(self):
+        """Only the future of the failing item should get the exception"""
+
+        def write(items):
+            if "bad" in items:
+                raise ValueError("bad item")
+
+        writer = GroupCommitWriter(write, max_batch=10, max_delay=0.05)
+        good, bad = writer.submit("good"), writer.submit("bad")
+        assert good.result(timeout=1) is None
+        with pytest.raises(ValueError):
+            bad.result(timeout=1)
+        writer.close()
+
+    def test_close_writes_queued_items(self):
+        """close should write items still waiting in the queue"""
+        batches = []
+        writer = GroupCommitWriter(batches.append, max_batch=100, max_delay=10)
+        future = writer.submit("item")
+        writer.close()
+        assert future.done()
+        assert batches == [["item"]]
+
+
+class TestSQLiteRepositoryWriteBehind:
+    """Unit tests for SQLiteRepository write-behind mode"""
+
+    def test_put_blocks_until_committed(self, db_name):
+        """put should return once the message is committed"""
+        repository = SQLiteRepository(db_name, write_behind=True)
+        repository.initialize()
+        bus = MessageBus(repository)
+        with patch.object(
+            repository.writer, "_write", wraps=repository.writer._write
+        ) as write:
+            threads = [
+                threading.Thread(target=lambda: bus.put(TextMessage(body="Hello")))
+                for _ in range(20)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        assert repository.row_count("queue_item") == 20
+        assert 0 < write.call_count < 20
+        repository.close()
+
+    def test_submit_returns_future(self, db_name):
+        """submit should return future resolved once the message is committed"""
+        repository = SQLiteRepository(db_name, write_behind=True)
+        repository.initialize()
+        message = TextMessage(body="Hello", message_id="1")
+        repository.submit(message).result(timeout=1)
+        assert repository.row_count("queue_item") == 1
+        with pytest.raises(sqlite3.IntegrityError):
+            repository.submit(message).result(timeout=1)
+        repository.close()
@@ -0,0 +1,118 @@
+"""Unit tests for binary module"""
+# pylint: disable=redefined-outer-name
+
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from unittest.mock import patch
+from uuid import uuid4
+
+import pytest
+from igpy.serialization.binary import BinaryTranscoder
+from igpy.serialization.transcode import (
+    DatetimeAsISO,
+    DecimalAsStr,
+    JSONTranscoder,
+    UUIDAsHex,
+)
+
+
+@pytest.fixture
+def json_transcoder():
+    """JSONTranscoder with all transcodings registered"""
+    transcoder = JSONTranscoder()
+    for transcoding in (UUIDAsHex(), DecimalAsStr(), DatetimeAsISO()):
+        transcoder.register(transcoding)
+    return transcoder
+
+
+@pytest.fixture
+def payload():
+    """Payload with all supported types"""
+    return {
+        "none": None,
+        "flags": [True, False],
+        "integers": [0, 1, -1, 127, 128, -(2**70), 2**70],
+        "float": -1.25,
+        "text": "Hello, ñ world",
+        "raw": b"\x00\xff",
+        "nested": {"list": [{"a": 1}], 1: "integer key"},
+        "uuid": uuid4(),
+        "decimals": [Decimal("12.30"), Decimal("-0.001"), Decimal("0"), Decimal("1E+5")],
+        "naive": datetime(2022, 1, 2, 3, 4, 5, 6),
+        "before_epoch": datetime(1900, 1, 1),
+        "aware": datetime(2022, 1, 2, 3, 4, 5, tzinfo=timezone(timedelta(hours=-5))),
+    }
+
+
+class TestBinaryTranscoderClass:
+    """Unit tests for BinaryTranscoder class"""
+
+    def test_native_format_round_trip(self, payload):
+        """Native format should decode what it encoded"""
+        transcoder = BinaryTranscoder(use_msgpack=False)
+        data = transcoder.encode(payload)
+        assert data[:2] == b"\xb1\x01"
+        assert transcoder.decode(data) == payload
+
+    def test_msgpack_format_round_trip(self, payload):
+        """MessagePack format should decode what it encoded"""
+        pytest.importorskip("msgpack")
+        transcoder = BinaryTranscoder(use_msgpack=True)
+        data = transcoder.encode(payload)
+        assert data[:2] == b"\xb1\x02"
+        assert transcoder.decode(data) == payload
+        assert BinaryTranscoder().decode(data) == payload
+
+    def test_native_format_is_default(self, payload):
+        """Format should not depend on installed packages unless asked for"""
+        assert BinaryTranscoder().encode(payload)[:2] == b"\xb1\x01"
+
+    def test_msgpack_format_requires_msgpack(self):
+        """MessagePack format should not be silently replaced"""
+        with patch("igpy.serialization.binary.msgpack", None):
+            with pytest.raises(ImportError):
+                BinaryTranscoder(use_msgpack=True)
+
+    def test_decimal_specials_round_trip(self):
+        """Infinity should survive the round trip"""
+        transcoder = BinaryTranscoder(use_msgpack=False)
+        value = Decimal("-Infinity")
+        assert transcoder.decode(transcoder.encode(value)) == value
+
+    def test_tuple_is_decoded_as_list(self):
+        """Tuples should be decoded as lists, like JSON"""
+        transcoder = BinaryTranscoder(use_msgpack=False)
+        assert transcoder.decode(transcoder.encode((1, 2))) == [1, 2]
+
+    def test_decodes_memoryview(self, payload):
+        """decode should accept bytes-like data"""
+        transcoder = BinaryTranscoder(use_msgpack=False)
+        data = memoryview(transcoder.encode(payload))
+        assert transcoder.decode(data) == payload
+
+    def test_smaller_than_json(self, payload, json_transcoder):
+        """Encoded data should be smaller than JSON"""
+        del payload["raw"], payload["nested"]
+        binary = BinaryTranscoder(use_msgpack=False).encode(payload)
+        assert len(binary) < len(json_transcoder.encode(payload))
+
+    def test_json_rows_are_decoded_by_fallback(self, json_transcoder):
+        """Data without magic byte should be decoded by fallback transcoder"""
+        transcoder = BinaryTranscoder(fallback=json_transcoder)
+        data = json_transcoder.encode({"price": Decimal("1.5")})
+        assert transcoder.decode(data) == {"price": Decimal("1.5")}
+
+    def test_unknown_data_without_fallback_raises_error(self):
+        """Data without magic byte should be rejected without fallback"""
+        with pytest.raises(ValueError):
+            BinaryTranscoder().decode(b'{"a": 1}')
+
+    def test_unsupported_version_raises_error(self):
+        """Data with unknown format version should be rejected"""
+        with pytest.raises(ValueError):
+            BinaryTranscoder().decode(b"\xb1\x7f")
+
+    def test_encode_raises_error_for_unsupported_type(self):
+        """encode should raise TypeError for unsupported type"""
+        with pytest.raises(TypeError):
+            BinaryTranscoder(use_msgpack=False).encode(object())
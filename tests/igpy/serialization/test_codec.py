@@ -0,0 +1,112 @@
+"""Unit tests for codec module"""
+# pylint: disable=too-few-public-methods
+
+from dataclasses import dataclass, field
+from typing import List
+
+import attr
+from igpy.serialization.codec import ClassCodec, class_fields
+
+
+@dataclass(frozen=True)
+class FrozenMessage:
+    """Frozen dataclass"""
+
+    text: str
+    tags: List[str] = field(default_factory=list)
+    message_id: str = None
+
+
+@attr.s(auto_attribs=True, slots=True, frozen=True)
+class AttrsMessage:
+    """Slotted attrs class"""
+
+    text: str
+    message_id: str = None
+
+
+class SlotsMessage:
+    """Plain slotted class"""
+
+    __slots__ = ("text", "message_id")
+
+    def __init__(self, text, message_id=None):
+        self.text = text
+        self.message_id = message_id
+
+
+@dataclass
+class DerivedMessage:
+    """Dataclass setting an attribute which is not a field"""
+
+    text: str
+    message_id: str = None
+
+    def __post_init__(self):
+        self.length = len(self.text)
+
+
+class PlainMessage:
+    """Plain class"""
+
+    def __init__(self, text, message_id=None):
+        self.text = text
+        self.message_id = message_id
+
+
+class TestClassFieldsFunction:
+    """Unit tests for class_fields function"""
+
+    def test_returns_field_names(self):
+        """Field names should be collected from supported class kinds"""
+        assert class_fields(FrozenMessage) == ("text", "tags", "message_id")
+        assert class_fields(AttrsMessage) == ("text", "message_id")
+        assert class_fields(SlotsMessage) == ("text", "message_id")
+
+    def test_returns_none_for_plain_class(self):
+        """Classes without declared fields should return None"""
+        assert class_fields(PlainMessage) is None
+
+
+class TestClassCodecClass:
+    """Unit tests for ClassCodec class"""
+
+    def test_get_state_skips_excluded_fields(self):
+        """get_state should return fields which are not excluded"""
+        codec = ClassCodec(FrozenMessage, exclude=("message_id",))
+        message = FrozenMessage("hello", ["a"], message_id="1")
+        assert codec.get_state(message) == {"text": "hello", "tags": ["a"]}
+
+    def test_round_trip(self):
+        """create should reconstruct object from state of supported classes"""
+        for cls in (FrozenMessage, AttrsMessage, SlotsMessage):
+            codec = ClassCodec(cls, exclude=("message_id",))
+            message = cls("hello", message_id="1")
+            state = codec.get_state(message)
+            assert state["text"] == "hello"
+            state["message_id"] = "1"
+            actual = codec.create(state)
+            assert (actual.text, actual.message_id) == ("hello", "1")
+
+    def test_plain_class_uses_instance_dict(self):
+        """Plain class objects should be converted using __dict__"""
+        codec = ClassCodec(PlainMessage, exclude=("message_id",))
+        message = PlainMessage("hello", "1")
+        assert codec.get_state(message) == {"text": "hello"}
+        actual = codec.create({"text": "hello", "message_id": "1"})
+        assert vars(actual) == vars(message)
+
+    def test_create_sets_missing_defaults(self):
+        """Dataclass fields missing from state should be set to defaults"""
+        codec = ClassCodec(FrozenMessage)
+        actual = codec.create({"text": "hello"})
+        assert actual == FrozenMessage("hello")
+
+    def test_non_field_attributes_are_kept(self):
+        """Instance attributes which are not fields should be part of the state"""
+        codec = ClassCodec(DerivedMessage, exclude=("message_id",))
+        message = DerivedMessage("hello", "1")
+        state = codec.get_state(message)
+        assert state == {"text": "hello", "length": 5}
+        state["message_id"] = "1"
+        assert vars(codec.create(state)) == vars(message)
@@ -0,0 +1,89 @@
+"""Unit tests for compress module"""
+# pylint: disable=redefined-outer-name
+import json
+
+import pytest
+from igpy.messagebus.messagebus import TextMessage
+from igpy.messagebus.persistence import TranscodingMapper
+from igpy.serialization.compress import CompressingTranscoder, train_dictionary
+from igpy.serialization.transcode import JSONTranscoder
+
+
+def sample_message(index: int) -> bytes:
+    """Small repetitive JSON message"""
+    return json.dumps(
+        {"event": "order_placed", "customer": f"customer-{index}", "status": "new"}
+    ).encode("utf8")
+
+
+@pytest.fixture
+def large_data():
+    """Data above compression threshold"""
+    return b"".join(sample_message(index) for index in range(50))
+
+
+class TestCompressingTranscoderClass:
+    """Unit tests for CompressingTranscoder class"""
+
+    @pytest.mark.parametrize("algorithm", ["zlib", "lzma", "zstd"])
+    def test_round_trip(self, algorithm, large_data):
+        """Compressed data should be smaller and decode to the original"""
+        if algorithm == "zstd":
+            pytest.importorskip("zstandard")
+        transcoder = CompressingTranscoder(algorithm)
+        encoded = transcoder.encode(large_data)
+        assert len(encoded) < len(large_data)
+        assert transcoder.decode(encoded) == large_data
+
+    def test_small_data_is_stored_uncompressed(self):
+        """Data below threshold should be stored with raw header"""
+        transcoder = CompressingTranscoder(threshold=1024)
+        assert transcoder.encode(b'{"a": 1}') == b'\x00{"a": 1}'
+        assert transcoder.decode(b'\x00{"a": 1}') == b'{"a": 1}'
+
+    def test_incompressible_data_is_stored_uncompressed(self):
+        """Data which does not shrink should be stored with raw header"""
+        data = bytes(range(256))
+        encoded = CompressingTranscoder(threshold=0).encode(data)
+        assert encoded[0] == 0
+        assert encoded[1:] == data
+
+    def test_decodes_rows_of_other_algorithms(self, large_data):
+        """Rows compressed with another algorithm should be decoded"""
+        stored = CompressingTranscoder("lzma").encode(large_data)
+        assert CompressingTranscoder("zlib").decode(stored) == large_data
+
+    def test_data_without_header_is_returned_unchanged(self):
+        """Rows stored before compression was enabled should pass through"""
+        assert CompressingTranscoder().decode(b'{"a": 1}') == b'{"a": 1}'
+
+    def test_dictionary_improves_small_messages(self):
+        """Shared dictionary should compress small messages better"""
+        dictionary = train_dictionary(sample_message(index) for index in range(100))
+        data = sample_message(1000)
+        plain = CompressingTranscoder(threshold=0).encode(data)
+        transcoder = CompressingTranscoder(threshold=0, dictionary=dictionary)
+        encoded = transcoder.encode(data)
+        assert len(encoded) < len(plain)
+        assert transcoder.decode(memoryview(encoded)) == data
+
+    def test_different_dictionary_raises_error(self):
+        """Decoding with a different dictionary should be rejected"""
+        data = sample_message(1)
+        encoded = CompressingTranscoder(threshold=0, dictionary=data).encode(data)
+        with pytest.raises(ValueError):
+            CompressingTranscoder(dictionary=b"other").decode(encoded)
+
+    def test_unknown_algorithm_raises_error(self):
+        """Unknown algorithm should be rejected"""
+        with pytest.raises(ValueError):
+            CompressingTranscoder("snappy")
+
+    def test_works_as_mapper_stage(self):
+        """Transcoder should work after serialization in TranscodingMapper"""
+        mapper = TranscodingMapper(JSONTranscoder())
+        mapper.transcoders.append(CompressingTranscoder(threshold=0))
+        message = TextMessage(body="Hello world " * 100, message_id="1")
+        stored = mapper.encode(message)
+        assert stored.state[0] == 1
+        assert mapper.decode(stored).body == message.body
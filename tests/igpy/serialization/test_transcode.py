@@ -8,7 +8,13 @@ from unittest.mock import Mock, patch
 from uuid import uuid4
 
 import pytest
-from igpy.serialization.transcode import DatetimeAsISO, DecimalAsStr, JSONTranscoder, UUIDAsHex
+from igpy.serialization.transcode import (
+    DatetimeAsISO,
+    DecimalAsStr,
+    FastJSONTranscoder,
+    JSONTranscoder,
+    UUIDAsHex,
+)
 
 
 class DummyTranscoding(DecimalAsStr):
@@ -112,12 +118,77 @@ class TestJSONTranscoderClass:
         }
         assert expected == decoded
 
+    def test_can_decode_memoryview(self, some_transcoder: JSONTranscoder):
+        """Data given as memoryview slice is decoded"""
+        data = memoryview(b'[{"@TYP": "decimal_str", "@PL": "78.910"}]')
+        decoded = some_transcoder.decode(data[1:-1])
+        assert Decimal("78.910") == decoded
+
     def test_encode_raises_error_not_registered_type(self, some_transcoder: JSONTranscoder):
         """encode raises TypeError for type that is not registered"""
         data = datetime.now()
         with pytest.raises(TypeError):
             some_transcoder.encode(data)
 
+
+def register_all(transcoder):
+    """Register all transcodings with the transcoder"""
+    for transcoding in (UUIDAsHex(), DecimalAsStr(), DatetimeAsISO()):
+        transcoder.register(transcoding)
+    return transcoder
+
+
+@pytest.fixture
+def typed_payload():
+    """Payload with nested dictionaries and transcoded types"""
+    return {
+        "an_integer": 1,
+        "a_float": 1.5,
+        "a_string": "@TYP in text",
+        "a_list": [1, {"uuid": uuid4()}, [Decimal("1.10")]],
+        "a_dict": {"x": {"y": {"when": datetime(2022, 1, 2, 3, 4, 5, 6)}}},
+        "a_wrapper_lookalike": {"@TYP": "value", "other": 1},
+        "a_decimal": Decimal("78.910"),
+    }
+
+
+class TestFastJSONTranscoderClass:
+    """Unit tests for FastJSONTranscoder class"""
+
+    @pytest.fixture(params=[True, False], ids=["orjson", "json"])
+    def transcoder(self, request):
+        """FastJSONTranscoder fixture with and without orjson"""
+        return register_all(FastJSONTranscoder(use_orjson=request.param))
+
+    def test_encode_is_byte_compatible(self, transcoder, typed_payload):
+        """encode should produce the same bytes as JSONTranscoder"""
+        expected = register_all(JSONTranscoder()).encode(typed_payload)
+        assert transcoder.encode(typed_payload) == expected
+
+    def test_decodes_json_transcoder_output(self, transcoder, typed_payload):
+        """decode should reconstruct data encoded by JSONTranscoder"""
+        data = register_all(JSONTranscoder()).encode(typed_payload)
+        assert transcoder.decode(data) == typed_payload
+
+    def test_decodes_data_without_wrappers(self, transcoder):
+        """decode should handle data without type wrappers"""
+        assert transcoder.decode(b'{"a": [1, {"b": null}]}') == {"a": [1, {"b": None}]}
+
+    def test_decodes_nan(self, transcoder):
+        """decode should accept NaN produced by the json module"""
+        data = transcoder.encode({"value": float("inf")})
+        assert transcoder.decode(data) == {"value": float("inf")}
+
+    def test_decodes_memoryview(self, transcoder):
+        """decode should accept bytes-like data"""
+        assert transcoder.decode(memoryview(b'{"a": 1}')) == {"a": 1}
+
+    def test_encode_raises_error_not_registered_type(self):
+        """encode raises TypeError for type that is not registered"""
+        with pytest.raises(TypeError):
+            FastJSONTranscoder().encode(datetime.now())
+
+
 class TestDatetimeAsISOClass:
     """Unit tests for DatetimeAsISO class"""
 
@@ -5,7 +5,7 @@ from unittest.mock import patch, Mock
 import pytest
 import igpy.serialization.utils
 import tests.igpy.serialization.test_utils
-from igpy.serialization.utils import get_topic, resolve_attr, resolve_topic
+from igpy.serialization.utils import TopicCache, get_topic, resolve_attr, resolve_topic
 
 
 @pytest.fixture
@@ -63,3 +63,50 @@ class TestResolveAttrFunction:
         obj = Mock()
         attr_value = resolve_attr(obj, "a.b.c.d")
         assert attr_value is obj.a.b.c.d
+
+
+class TestTopicCacheClass:
+    """Unit tests for TopicCache class"""
+
+    def test_resolve_topic_resolves_once(self):
+        """resolve_topic should resolve the topic on first lookup only"""
+        cache = TopicCache()
+        topic = "tests.igpy.serialization.test_utils#TestTopicCacheClass"
+        with patch.object(
+            igpy.serialization.utils, "resolve_topic", wraps=resolve_topic
+        ) as spy:
+            assert cache.resolve_topic(topic) is TestTopicCacheClass
+            assert cache.resolve_topic(topic) is TestTopicCacheClass
+        spy.assert_called_once_with(topic)
+        assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+    def test_get_topic_returns_cached_topic(self):
+        """get_topic should return the same topic as get_topic function"""
+        cache = TopicCache()
+        assert cache.get_topic(TopicCache) == get_topic(TopicCache)
+        assert cache.get_topic(TopicCache) == get_topic(TopicCache)
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_oldest_entry_is_evicted_when_full(self):
+        """Cache should not grow beyond maxsize"""
+        cache = TopicCache(maxsize=1)
+        cache.get_topic(TopicCache)
+        cache.get_topic(TestTopicCacheClass)
+        cache.get_topic(TopicCache)
+        assert cache.misses == 3
+        assert cache.stats()["size"] == 1
+
+    def test_invalidate_topic_forgets_lookups(self):
+        """invalidate should drop both lookup directions of a topic"""
+        cache = TopicCache()
+        topic = cache.get_topic(TopicCache)
+        cache.resolve_topic(topic)
+        cache.invalidate(topic)
+        assert cache.stats()["size"] == 0
+
+    def test_zero_maxsize_disables_caching(self):
+        """Cache with maxsize 0 should not store anything"""
+        cache = TopicCache(maxsize=0)
+        cache.get_topic(TopicCache)
+        cache.get_topic(TopicCache)
+        assert cache.misses == 2